@@ -1,22 +1,41 @@
 #! /usr/bin/env python
+"""Prints the Slack ID of every workspace member
 
+With --index the members are also saved as the Slack directory index sleuth
+reads from DIRECTORY_URL, a local path or an s3:// URL.
+"""
+
+import argparse
 import os
 import sys
 
-import requests
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sleuth")
+)
 
-SLACK_API_TOKEN = os.environ["SLACK_API_TOKEN"]
+from sleuth.directory import build_index, iter_members  # noqa: E402
+from sleuth.store import get_store  # noqa: E402
 
-users_list = requests.get(
-    "https://slack.com/api/users.list?token=%s" % SLACK_API_TOKEN
-).json()
+parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+parser.add_argument("--index", help="path or s3:// URL to save the index to")
+args = parser.parse_args()
+
+SLACK_API_TOKEN = os.environ["SLACK_API_TOKEN"]
 
-if users_list["ok"] is not True:
-    print("Slack API call failed")
+members = []
+try:
+    for user in iter_members(SLACK_API_TOKEN):
+        members.append(user)
+        print("User: {} ID: {}".format(user.get("name", "NA"), user["id"]))
+except RuntimeError as e:
+    print(e)
     sys.exit(1)
 
-for user in users_list["members"]:
-    name = "NA"
-    if "name" in user:
-        name = user["name"]
-    print("User: {} ID: {}".format(name, user["id"]))
+if args.index:
+    index = build_index(members)
+    get_store(args.index).save(index)
+    print(
+        "Saved {} emails and {} handles to {}".format(
+            len(index["emails"]), len(index["handles"]), args.index
+        )
+    )
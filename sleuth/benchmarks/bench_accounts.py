@@ -0,0 +1,48 @@
+"""Benchmarks auditing many accounts through a fake STS/IAM backend
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_accounts --accounts 100 --users 20 --latency 0.005
+"""
+
+import argparse
+import functools
+import logging
+import os
+import time
+
+from benchmarks.fakes import FakeOrganization
+from sleuth import auditor, services
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--users", type=int, default=20, help="users per account")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per call")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    os.environ.setdefault("WARNING_AGE", "80")
+    os.environ.setdefault("EXPIRATION_AGE", "90")
+
+    for workers in args.workers:
+        org = FakeOrganization(args.accounts, args.users, args.latency)
+        factory = functools.partial(
+            services.assume_role_client,
+            sts=org.sts,
+            client_factory=org.client_factory,
+        )
+        start = time.perf_counter()
+        users = auditor.audit_accounts(org.account_ids, factory, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(
+            "account_workers={:<4} accounts={:<5} users={:<7} api_calls={:<7} wall={:.2f}s".format(
+                workers, args.accounts, len(users), org.total_calls, elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares collecting users with worker threads and with the async collector
+
+Both run against the same fake fleet with the same latency per call, the
+threads through FakeIAM and the async collector through AsyncFakeIAM. The
+traced peak does not include thread stacks, extra_threads accounts for them.
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_async --users 2000 --latency 0.02 \\
+        --workers 8 32 --concurrency 8 32
+"""
+
+import argparse
+import logging
+import threading
+import time
+import tracemalloc
+
+from benchmarks.fakes import AsyncFakeIAM, FakeIAM, generate_fleet
+from sleuth import aio, services
+
+
+def measure(collect):
+    """Runs collect twice, timed and then traced since tracing slows it down
+
+    Returns:
+    tuple: Users, wall time, peak memory and peak extra threads
+    """
+    threads = threading.active_count()
+    peak_threads = threads
+    start = time.perf_counter()
+    count = 0
+    for _ in collect():
+        count += 1
+        peak_threads = max(peak_threads, threading.active_count())
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in collect():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak, peak_threads - threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per call")
+    parser.add_argument("--workers", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32])
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    fleet = generate_fleet(args.users)
+
+    runs = [
+        (
+            "threads workers={}".format(workers),
+            lambda workers=workers: services.iter_iam_users(
+                workers, FakeIAM(fleet, latency=args.latency)
+            ),
+        )
+        for workers in args.workers
+    ] + [
+        (
+            "async concurrency={}".format(concurrency),
+            lambda concurrency=concurrency: aio.iter_iam_users(
+                concurrency, AsyncFakeIAM(FakeIAM(fleet), args.latency)
+            ),
+        )
+        for concurrency in args.concurrency
+    ]
+
+    for name, collect in runs:
+        count, elapsed, peak, threads = measure(collect)
+        print(
+            "{:<24} users={:<7} wall={:.2f}s users/s={:<8.0f} peak={}KB "
+            "extra_threads={}".format(
+                name, count, elapsed, count / elapsed, peak // 1024, threads
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
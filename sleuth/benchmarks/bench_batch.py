@@ -0,0 +1,94 @@
+"""Compares Key.audit with the batch audit on synthetic keys
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_batch --keys 1000000
+"""
+
+import argparse
+import datetime as dt
+import random
+import time
+
+from sleuth import batch
+from sleuth.auditor import Key
+
+
+def timed(name, count, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<15} keys={:<8} wall={:.2f}s keys/s={:,.0f}".format(
+            name, count, elapsed, count / elapsed
+        )
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=1000000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    creation_ages = [int(rng.expovariate(1 / 60.0)) for _ in range(args.keys)]
+    access_ages = [min(a, int(rng.expovariate(1 / 10.0))) for a in creation_ages]
+    statuses = ["Active" if rng.random() < 0.95 else "Inactive" for _ in creation_ages]
+    auto_expire = [rng.random() < 0.95 for _ in creation_ages]
+    thresholds = (80, 90, 90, 80)
+
+    now = dt.datetime.now(dt.timezone.utc)
+    keys = [
+        Key(
+            "user",
+            "key",
+            s,
+            now - dt.timedelta(days=c),
+            now - dt.timedelta(days=a),
+            now,
+        )
+        for c, a, s in zip(creation_ages, access_ages, statuses)
+    ]
+
+    def key_audit():
+        for k, expires in zip(keys, auto_expire):
+            if expires:
+                k.audit(*thresholds)
+            else:
+                k.audit_state = "good"
+        return [k.audit_state for k in keys]
+
+    expected = timed("Key.audit", args.keys, key_audit)
+    columns = (creation_ages, access_ages, statuses, auto_expire) + thresholds
+
+    states, _, _ = timed(
+        "python",
+        args.keys,
+        lambda: batch.audit_batch(*columns, enable_auto_expire=False, use_numpy=False),
+    )
+    assert states == expected
+
+    if not batch.have_numpy():
+        print("numpy is not installed, skipping the numpy path")
+        return
+
+    states, _, _ = timed(
+        "numpy",
+        args.keys,
+        lambda: batch.audit_batch(*columns, enable_auto_expire=False, use_numpy=True),
+    )
+    assert list(states) == expected
+
+    arrays = [batch.np.asarray(c) for c in columns[:4]]
+    timed(
+        "numpy (arrays)",
+        args.keys,
+        lambda: batch.audit_batch(
+            *arrays, *thresholds, enable_auto_expire=False, use_numpy=True
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
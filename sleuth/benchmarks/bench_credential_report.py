@@ -0,0 +1,47 @@
+"""Compares per user API collection with the credential report fast path
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_credential_report --users 4000 --latency 0.002
+"""
+
+import argparse
+import time
+
+from benchmarks.fakes import FakeIAM, generate_fleet
+from sleuth import services
+
+
+def run(name, collect, iam):
+    services.IAM = iam
+    start = time.perf_counter()
+    users = collect()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:<20} users={:<7} api_calls={:<7} wall={:.2f}s".format(
+            name, len(users), iam.total_calls, elapsed
+        )
+    )
+    for op, count in sorted(iam.calls.items()):
+        print("    {:<28} {}".format(op, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    args = parser.parse_args()
+
+    services.CREDENTIAL_REPORT_POLL_INTERVAL = 0
+    fleet = generate_fleet(args.users)
+
+    run("api", services.get_iam_users, FakeIAM(fleet, latency=args.latency))
+    run(
+        "credential_report",
+        services.get_iam_users_from_credential_report,
+        FakeIAM(fleet, latency=args.latency),
+    )
+
+
+if __name__ == "__main__":
+    main()
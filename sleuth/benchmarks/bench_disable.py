@@ -0,0 +1,84 @@
+"""Compares disabling expired keys one at a time with the disable executor
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_disable --keys 2000 --latency 0.05
+"""
+
+import argparse
+import datetime as dt
+import logging
+import time
+
+from benchmarks.fakes import FakeIAM
+from sleuth.auditor import Key
+from sleuth.disable import DisableExecutor
+from sleuth.services import disable_key
+
+
+def expired_fleet(count, now):
+    """One user per key, every key past any expiration age"""
+    created = now - dt.timedelta(days=365)
+    return [
+        {
+            "UserName": "user{:06d}".format(i),
+            "UserId": "AIDA{:012d}".format(i),
+            "Path": "/",
+            "CreateDate": created,
+            "Tags": [],
+            "Keys": [
+                {
+                    "AccessKeyId": "AKIA{:012d}".format(i),
+                    "Status": "Active",
+                    "CreateDate": created,
+                }
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per call")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    now = dt.datetime.now(dt.timezone.utc)
+
+    for run in ("serial", "executor"):
+        fleet = expired_fleet(args.keys, now)
+        iam = FakeIAM(fleet, latency=args.latency)
+        keys = [
+            Key(
+                u["UserName"],
+                k["AccessKeyId"],
+                k["Status"],
+                k["CreateDate"],
+                k["CreateDate"],
+                now,
+            )
+            for u in fleet
+            for k in u["Keys"]
+        ]
+
+        start = time.perf_counter()
+        if run == "serial":
+            for k in keys:
+                disable_key(k, k.username, iam)
+        else:
+            disabler = DisableExecutor(workers=args.workers)
+            for k in keys:
+                disabler.submit(k, k.username, iam)
+            disabler.close()
+        elapsed = time.perf_counter() - start
+
+        print(
+            "{:<9} api_calls={:<6} wall={:.2f}s".format(run, iam.total_calls, elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main()
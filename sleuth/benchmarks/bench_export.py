@@ -0,0 +1,98 @@
+"""Compares the peak memory of streaming the key inventory to an export with
+building the DEBUG report table
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_export --users 5000 20000 --format csv
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeIAM, FakeS3, generate_fleet
+from sleuth.auditor import iter_audit_account
+from sleuth.config import EXPORT_FORMATS, Config
+from sleuth.export import Exporter
+
+
+class NullS3(FakeS3):
+    """FakeS3 that drops uploaded parts so only the exporter's memory shows"""
+
+    def upload_part(self, Body, **kwargs):
+        return super().upload_part(Body=b"", **kwargs)
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.uploads.pop(UploadId)
+        return {}
+
+
+def table(iam, config):
+    """The rows print_key_report hands to tabulate, kept in memory"""
+    from tabulate import tabulate
+
+    rows = [
+        [u.username, u.slack_id, k.key_id, k.audit_state, k.creation_age]
+        for u in iter_audit_account(iam, config=config)
+        for k in u.keys
+    ]
+    return len(tabulate(rows))
+
+
+def export(iam, config, url, fmt, s3):
+    exporter = Exporter(url, fmt, client=s3)
+    for u in iter_audit_account(iam, config=config):
+        exporter.write_user(u)
+    return exporter.close()
+
+
+def measure(run):
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[5000, 20000])
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    config = Config(80, 90, 90, 80)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.users:
+            fleet = generate_fleet(count)
+            s3 = NullS3()
+            path = os.path.join(tmp, "export.gz")
+            runs = (
+                ("table", lambda iam: table(iam, config)),
+                ("file.gz", lambda iam: export(iam, config, path, args.format, None)),
+                (
+                    "s3",
+                    lambda iam: export(
+                        iam, config, "s3://bucket/export.gz", args.format, s3
+                    ),
+                ),
+            )
+            for name, run in runs:
+                # the fake IAM indexes the fleet, keep that out of the peak
+                iam = FakeIAM(fleet)
+                elapsed, peak = measure(lambda: run(iam))
+                print(
+                    "users={:<7} {:<8} wall={:.2f}s peak={}KB".format(
+                        count, name, elapsed, peak // 1024
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measures the cold start cost of importing the Lambda handler
+
+Every run imports the handler in a fresh interpreter with -X importtime.
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_importtime --repeat 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SLEUTH_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules only some integrations need, they must stay out of the cold start
+LAZY_MODULES = ("requests", "tabulate", "numpy", "asyncio")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import handler
+elapsed = time.perf_counter() - start
+from sleuth import services
+print(elapsed)
+print(",".join(sorted(services._clients)))
+print(",".join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+
+def import_handler():
+    """Imports the handler in a fresh interpreter
+
+    Returns:
+    float: Seconds spent importing
+    list (str): Clients built at import
+    list (str): LAZY_MODULES that got imported
+    dict: Top level package to import time in microseconds
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(lazy=LAZY_MODULES)],
+        cwd=SLEUTH_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, clients, lazy = proc.stdout.splitlines()[-3:]
+
+    # self time of every module, summed per top level package
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:") :].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    return (
+        float(elapsed),
+        [c for c in clients.split(",") if c],
+        [m for m in lazy.split(",") if m],
+        packages,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_handler() for _ in range(args.repeat)]
+    times = [r[0] for r in runs]
+    _, clients, lazy, packages = runs[-1]
+
+    print(
+        "import handler  median={:.3f}s min={:.3f}s clients={} lazy_imported={}".format(
+            statistics.median(times),
+            min(times),
+            ",".join(clients) or "-",
+            ",".join(lazy) or "-",
+        )
+    )
+    for package, us in sorted(packages.items(), key=lambda p: -p[1])[: args.top]:
+        print("    {:<24} {:>8.1f}ms".format(package, us / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Measures the memory used by Key/User objects and checks the audit results
+
+The previous dict based classes are kept here as a baseline.
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_model --keys 100000
+"""
+
+import argparse
+import datetime as dt
+import random
+import time
+import tracemalloc
+
+from sleuth.auditor import Key, User
+
+
+class LegacyKey:
+    def __init__(self, username, key_id, status, created, inactivity_age):
+        self.username = username
+        self.key_id = key_id
+        self.status = status
+        self.created = created
+        self.inactivity_age = inactivity_age
+        self.creation_age = (dt.datetime.now(dt.timezone.utc) - self.created).days
+        self.access_age = (dt.datetime.now(dt.timezone.utc) - self.inactivity_age).days
+
+    def audit(self, rotate_age, expire_age, max_inactivity_age, inactivity_warning_age):
+        self.creation_valid_for = expire_age - self.creation_age
+        self.activity_valid_for = max_inactivity_age - self.access_age
+        if self.creation_age >= expire_age:
+            self.audit_state = "expire"
+        elif self.access_age >= max_inactivity_age:
+            self.audit_state = "stagnant_expire"
+        elif self.creation_age >= rotate_age and self.creation_age < expire_age:
+            self.audit_state = "old"
+        elif (
+            self.access_age >= inactivity_warning_age
+            and self.access_age < max_inactivity_age
+        ):
+            self.audit_state = "stagnant"
+        elif self.creation_age < rotate_age:
+            self.audit_state = "good"
+
+
+class LegacyUser:
+    def __init__(self, user_id, username, slack_id=None, auto_expire=None):
+        self.user_id = user_id
+        self.username = username
+        self.slack_id = slack_id
+        self.auto_expire = auto_expire
+
+
+def build(key_cls, user_cls, rows, **kwargs):
+    users = []
+    for i in range(0, len(rows), 2):
+        user = user_cls("AIDA{}".format(i), "user{}".format(i), "U{}".format(i), "True")
+        user.keys = [key_cls(*row, **kwargs) for row in rows[i : i + 2]]
+        for k in user.keys:
+            k.audit(80, 90, 90, 80)
+        users.append(user)
+    return users
+
+
+def measure(name, key_cls, user_cls, rows, **kwargs):
+    start = time.perf_counter()
+    build(key_cls, user_cls, rows, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    users = build(key_cls, user_cls, rows, **kwargs)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        "{:<8} keys={:<8} memory={:.1f}MB bytes/key={:.0f} build+audit={:.2f}s".format(
+            name, len(rows), size / 2**20, size / len(rows), elapsed
+        )
+    )
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    now = dt.datetime.now(dt.timezone.utc)
+    rows = []
+    for i in range(args.keys):
+        created = now - dt.timedelta(days=rng.randint(0, 200))
+        last_used = created + (now - created) * rng.random()
+        rows.append(
+            ("user{}".format(i // 2), "AKIA{}".format(i), "Active", created, last_used)
+        )
+
+    legacy = measure("legacy", LegacyKey, LegacyUser, rows)
+    current = measure("slots", Key, User, rows, now=now)
+
+    def result(k):
+        return (
+            k.creation_age,
+            k.access_age,
+            k.audit_state,
+            k.creation_valid_for,
+            k.activity_valid_for,
+        )
+
+    # the legacy keys read the clock while being built, so keys sitting right
+    # on a day boundary drift from the run's reference time and differ here
+    mismatches = sum(
+        result(lk) != result(k)
+        for lu, u in zip(legacy, current)
+        for lk, k in zip(lu.keys, u.keys)
+    )
+    print("audit mismatches between models: {}".format(mismatches))
+
+
+if __name__ == "__main__":
+    main()
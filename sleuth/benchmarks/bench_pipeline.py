@@ -0,0 +1,252 @@
+"""Measures every stage of an audit run against the fake AWS backend
+
+Reports wall time, AWS API calls and peak memory per stage, from collecting
+the users to posting the notifications, for one or more fleet sizes.
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_pipeline --users 1000 10000 100000
+    python -m benchmarks.bench_pipeline --users 5000 --latency 0.002 \\
+        --throttle-every 50 --workers 8 --json results.json
+    python -m benchmarks.bench_pipeline --users 10000 --tag-source user bulk
+"""
+
+import argparse
+import collections
+import datetime as dt
+import json
+import logging
+import time
+import tracemalloc
+
+from benchmarks.fakes import (
+    FakeIAM,
+    FakeSlackSession,
+    FakeSNS,
+    FakeSSM,
+    generate_fleet,
+)
+from sleuth import cache, services
+from sleuth.auditor import is_flagged
+from sleuth.config import TAG_SOURCES
+from sleuth.disable import DisableExecutor
+from sleuth.ratelimit import RateLimitedClient
+from sleuth.report import Report
+from sleuth.services import (
+    get_iam_users,
+    get_iam_users_from_credential_report,
+    get_ssm_value,
+    get_user_tags_bulk,
+    list_user_details_pages,
+    prepare_slack_message,
+    prepare_sns_message,
+    send_sns_message,
+)
+from sleuth.slack import SlackWebhook
+
+STAGES = ("collect", "audit", "disable", "report", "notify")
+AGES = (80, 90, 90, 80)
+TITLES = ("Expiring keys", "", "Inactive keys", "")
+SLACK_PARAMETER = "/sleuth/slack_url"
+
+
+class StageTimer:
+    """Records wall time, API calls and peak memory of each stage
+
+    Parameters:
+    fakes (list): Fake clients whose calls are counted
+    """
+
+    def __init__(self, fakes):
+        self.fakes = fakes
+        self.results = []
+
+    def calls(self):
+        counts = collections.Counter()
+        for fake in self.fakes:
+            counts.update(fake.calls)
+        return counts
+
+    def throttles(self):
+        return sum(sum(fake.throttles.values()) for fake in self.fakes)
+
+    def run(self, name, func):
+        before = self.calls()
+        throttles = self.throttles()
+        tracemalloc.reset_peak()
+        start_memory, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        result = func()
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        calls = self.calls() - before
+        self.results.append(
+            {
+                "stage": name,
+                "wall": wall,
+                "calls": dict(sorted(calls.items())),
+                "throttles": self.throttles() - throttles,
+                "peak_kb": max(peak - start_memory, 0) // 1024,
+            }
+        )
+        return result
+
+
+def run_pipeline(
+    count,
+    latency=0.0,
+    throttle_every=0,
+    page_size=100,
+    workers=4,
+    mode="api",
+    rate=1e6,
+    seed=0,
+    tag_source="user",
+):
+    """Runs an audit of a generated fleet stage by stage
+
+    Parameters:
+    count (int): Users in the fleet
+    latency (float): Seconds every fake AWS call and Slack post takes
+    throttle_every (int): Every Nth IAM call is throttled, 0 never
+    page_size (int): Users per list_users page
+    workers (int): Collection and disable threads
+    mode (str): api or credential_report
+    rate (float): Calls per second allowed by the rate limiter for each API
+    seed (int): Seed of the fleet
+    tag_source (str): user lists tags per user, bulk reads them with the
+                      users from get_account_authorization_details
+
+    Returns:
+    list (dict): stage, wall, calls, throttles and peak_kb of every stage in
+                 STAGES
+    """
+    now = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+    fleet = generate_fleet(count, now=now, seed=seed)
+    iam = FakeIAM(fleet, page_size, latency, throttle_every)
+    sns = FakeSNS(latency)
+    ssm = FakeSSM({SLACK_PARAMETER: "https://hooks.slack.invalid/x"}, latency)
+    slack = FakeSlackSession(latency)
+    # throttles are retried by the same wrapper the real clients use
+    client = RateLimitedClient(iam, rate=rate, base_delay=0.001, max_delay=0.01)
+
+    saved = {
+        name: services.__dict__.get(name)
+        for name in ("IAM", "SNS", "SSM", "CREDENTIAL_REPORT_POLL_INTERVAL")
+    }
+    services.IAM, services.SNS, services.SSM = client, sns, ssm
+    services.CREDENTIAL_REPORT_POLL_INTERVAL = 0
+    timer = StageTimer([iam, sns, ssm, slack])
+    # every run starts in a cold container
+    cache.clear()
+    tracemalloc.start()
+    bulk = tag_source == "bulk"
+    try:
+        if mode == "credential_report":
+            users = timer.run(
+                "collect",
+                lambda: get_iam_users_from_credential_report(
+                    workers, now=now, tags=get_user_tags_bulk() if bulk else None
+                ),
+            )
+        else:
+            list_pages = list_user_details_pages if bulk else None
+            users = timer.run(
+                "collect",
+                lambda: get_iam_users(workers, now=now, list_pages=list_pages),
+            )
+
+        def audit():
+            for u in users:
+                u.audit(*AGES, auto_expire_enabled=True)
+            return [u for u in users if is_flagged(u)]
+
+        flagged = timer.run("audit", audit)
+
+        def disable():
+            disabler = DisableExecutor(workers=workers)
+            for u in flagged:
+                for k in u.keys:
+                    if k.audit_state in ("expire", "stagnant_expire"):
+                        disabler.submit(k, u.username, client)
+            return disabler.close()
+
+        timer.run("disable", disable)
+
+        def report():
+            report = Report(flagged)
+            return (
+                prepare_sns_message(report, *TITLES, debug=False)[1],
+                prepare_slack_message(report, *TITLES)[1],
+            )
+
+        sns_msg, slack_msg = timer.run("report", report)
+
+        def notify():
+            send_sns_message("arn:aws:sns:us-west-2:123456789012:sleuth", sns_msg)
+            webhook = SlackWebhook(get_ssm_value(SLACK_PARAMETER), session=slack)
+            return webhook.send(slack_msg)
+
+        timer.run("notify", notify)
+    finally:
+        tracemalloc.stop()
+        for name, value in saved.items():
+            if value is None:
+                delattr(services, name)
+            else:
+                setattr(services, name, value)
+
+    return timer.results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--mode", choices=("api", "credential_report"), default="api")
+    parser.add_argument(
+        "--tag-source", choices=TAG_SOURCES, nargs="+", default=["user"]
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+
+    results = {}
+    for count in args.users:
+        for tag_source in args.tag_source:
+            stages = run_pipeline(
+                count,
+                args.latency,
+                args.throttle_every,
+                args.page_size,
+                args.workers,
+                args.mode,
+                tag_source=tag_source,
+            )
+            results.setdefault(count, {})[tag_source] = stages
+            for s in stages:
+                print(
+                    "users={:<7} tags={:<5} {:<8} wall={:.3f}s calls={:<7} "
+                    "throttles={:<5} peak={}KB {}".format(
+                        count,
+                        tag_source,
+                        s["stage"],
+                        s["wall"],
+                        sum(s["calls"].values()),
+                        s["throttles"],
+                        s["peak_kb"],
+                        " ".join("{}={}".format(k, v) for k, v in s["calls"].items()),
+                    )
+                )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
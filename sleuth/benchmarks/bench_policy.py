@@ -0,0 +1,108 @@
+"""Compares resolving user policies from the rule index with checking every
+rule for every user
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_policy --users 10000 --rules 500
+"""
+
+import argparse
+import random
+import timeit
+
+from sleuth.auditor import User
+from sleuth.policy import Policy, PolicyIndex, glob_pattern
+
+import re
+
+DEFAULT = Policy("default", (80, 90, 90, 80))
+
+
+def generate_rules(count, seed=0):
+    """Tag, path, exact name and glob rules in equal parts"""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        kind = i % 4
+        rule = {"name": "rule{}".format(i), "expiration_age": rng.randint(91, 400)}
+        if kind == 0:
+            rule["tag"] = {"Team": "team{}".format(i)}
+        elif kind == 1:
+            rule["path"] = "/org{}/".format(i)
+        elif kind == 2:
+            rule["username"] = "user{:06d}".format(rng.randrange(count * 40))
+        else:
+            rule["username"] = "svc{}-*".format(i)
+        rules.append(rule)
+    return rules
+
+
+def generate_users(count, rules, seed=0):
+    rng = random.Random(seed)
+    users = []
+    for i in range(count):
+        username = "user{:06d}".format(i)
+        if rng.random() < 0.2:
+            username = "svc{}-{}".format(rng.randrange(len(rules)), i)
+        tags = {
+            "Slack": "U{:08d}".format(i),
+            "Team": "team{}".format(rng.randrange(len(rules) * 2)),
+        }
+        path = "/org{}/sub/".format(rng.randrange(len(rules) * 2))
+        users.append(User(None, username, tags=tags, path=path))
+    return users
+
+
+def scan_resolve(rules, users):
+    """Checks every rule in order until one matches"""
+    compiled = [
+        (rule, re.compile(glob_pattern(rule.get("username", "")) + r"\Z"))
+        for rule in rules
+    ]
+    resolved = []
+    for u in users:
+        name = "default"
+        for rule, pattern in compiled:
+            if "tag" in rule:
+                matched = rule["tag"].items() <= u.tags.items()
+            elif "path" in rule:
+                matched = u.path.startswith(rule["path"])
+            else:
+                matched = pattern.match(u.username) is not None
+            if matched:
+                name = rule["name"]
+                break
+        resolved.append(name)
+    return resolved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--rules", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rules = generate_rules(args.rules)
+    users = generate_users(args.users, rules)
+
+    def indexed():
+        index = PolicyIndex(rules, DEFAULT)
+        return [index.resolve(u).name for u in users]
+
+    assert indexed() == scan_resolve(rules, users)
+
+    scan = min(
+        timeit.repeat(lambda: scan_resolve(rules, users), number=1, repeat=args.repeat)
+    )
+    index = min(timeit.repeat(indexed, number=1, repeat=args.repeat))
+    build = min(
+        timeit.repeat(lambda: PolicyIndex(rules, DEFAULT), number=1, repeat=args.repeat)
+    )
+
+    print("scan   wall={:.3f}s".format(scan))
+    print("index  wall={:.3f}s (build {:.3f}s)".format(index, build))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Compares rendering the notifications from a Report with walking the users
+once per format
+
+The previous per format loops are kept here as a baseline.
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_report --keys 50000
+"""
+
+import argparse
+import datetime as dt
+import random
+import logging
+import timeit
+
+from sleuth.auditor import Key, User
+from sleuth.report import Report
+from sleuth.services import format_slack_id, format_slack_user, format_username
+
+STATES = ("good", "old", "stagnant", "expire", "stagnant_expire", "disabled")
+# most keys of a fleet are fine on any given day
+WEIGHTS = (80, 6, 6, 3, 3, 2)
+
+
+def legacy_format_slack_user(user):
+    # same as format_slack_user, kept so both sides pay the same call overhead
+    mention = format_slack_id(user.slack_id, user.username)
+    if user.account is None:
+        return mention
+    return "{} ({})".format(mention, user.account)
+
+
+def legacy_sns_lines(users):
+    exp_msgs = []
+    stgnt_msgs = []
+    for u in users:
+        for k in u.keys:
+            if k.audit_state == "old":
+                exp_msgs.append(
+                    "{}'s key expires in {} days due to creation age.".format(
+                        format_username(u), k.creation_valid_for
+                    )
+                )
+            elif k.audit_state == "stagnant":
+                stgnt_msgs.append(
+                    "{}'s key expires in {} days due to inactivity.".format(
+                        format_username(u), k.activity_valid_for
+                    )
+                )
+            elif k.audit_state == "expire":
+                exp_msgs.append(
+                    "{}'s key is disabled due to creation age.".format(
+                        format_username(u)
+                    )
+                )
+            elif k.audit_state == "stagnant_expire":
+                stgnt_msgs.append(
+                    "{}'s key is disabled due to inactivity.".format(format_username(u))
+                )
+    return exp_msgs, stgnt_msgs
+
+
+def legacy_slack_lines(users):
+    old_msgs = []
+    stagnant_msgs = []
+    expired_msgs = []
+    stagnant_expired_msgs = []
+    for u in users:
+        for k in u.keys:
+            if k.audit_state == "old":
+                old_msgs.append(
+                    "{}'s key expires in {} days due to creation age.".format(
+                        legacy_format_slack_user(u), k.creation_valid_for
+                    )
+                )
+            elif k.audit_state == "stagnant":
+                stagnant_msgs.append(
+                    "{}'s key expires in {} days due to inactivity.".format(
+                        legacy_format_slack_user(u), k.activity_valid_for
+                    )
+                )
+            elif k.audit_state == "expire":
+                expired_msgs.append(
+                    "{}'s key is disabled due to creation age.".format(
+                        legacy_format_slack_user(u)
+                    )
+                )
+            elif k.audit_state == "stagnant_expire":
+                stagnant_expired_msgs.append(
+                    "{}'s key is disabled due to inactivity.".format(
+                        legacy_format_slack_user(u)
+                    )
+                )
+    return old_msgs, stagnant_msgs, expired_msgs, stagnant_expired_msgs
+
+
+def generate_users(keys, seed=0):
+    """Audited users with two keys each in random states"""
+    rng = random.Random(seed)
+    now = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+    users = []
+    for i in range(0, keys, 2):
+        user = User(
+            "AIDA{}".format(i),
+            "user{}".format(i),
+            rng.choice(("U{}".format(i), "subteam-S{}".format(i % 50), None)),
+            "True",
+            rng.choice((None, "123456789012", "210987654321")),
+        )
+        for n in range(min(2, keys - i)):
+            key = Key(user.username, "AKIA{}{}".format(i, n), "Active", now, now, now)
+            key.audit_state = rng.choices(STATES, WEIGHTS)[0]
+            key.creation_valid_for = rng.randint(-10, 90)
+            key.activity_valid_for = rng.randint(-10, 90)
+            user.keys.append(key)
+        users.append(user)
+    return users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    users = generate_users(args.keys)
+
+    def per_format():
+        legacy_sns_lines(users)
+        legacy_slack_lines(users)
+
+    def single_pass():
+        report = Report(users)
+        report.lines(format_username, "old", "expire")
+        report.lines(format_username, "stagnant", "stagnant_expire")
+        for state in ("old", "stagnant", "expire", "stagnant_expire"):
+            report.lines(format_slack_user, state)
+        return len(report)
+
+    legacy = min(timeit.repeat(per_format, number=1, repeat=args.repeat))
+    single = min(timeit.repeat(single_pass, number=1, repeat=args.repeat))
+
+    print("per_format  wall={:.3f}s".format(legacy))
+    print("report      wall={:.3f}s findings={}".format(single, single_pass()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measures per owner delivery time as the number of owners grows
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_routing --latency 0.1 --workers 16
+"""
+
+import argparse
+import logging
+import time
+
+from benchmarks.bench_report import generate_users
+from sleuth.report import Report
+from sleuth.routing import deliver_by_owner
+
+
+class SlowWebhook:
+    """Stands in for a Slack webhook taking latency seconds per post"""
+
+    latency = 0.0
+
+    def __init__(self, url, session=None):
+        self.url = url
+
+    def send(self, payload):
+        time.sleep(self.latency)
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per post")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    SlowWebhook.latency = args.latency
+    titles = ("Expiring", "", "Inactive", "")
+
+    for owners in (10, 100, 1000):
+        users = generate_users(args.keys)
+        for i, u in enumerate(users):
+            u.slack_id = "U{:06d}".format(i % owners)
+        report = Report(users)
+
+        for workers in (1, args.workers):
+            start = time.perf_counter()
+            summary = deliver_by_owner(
+                report,
+                titles,
+                slack_url="https://hooks.example",
+                workers=workers,
+                webhook_factory=SlowWebhook,
+            )
+            print(
+                "owners={:<5} workers={:<3} delivered={:<5} wall={:.2f}s".format(
+                    owners, workers, summary["delivered"], time.perf_counter() - start
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Compares a full collection with an incremental one from a snapshot
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_snapshot --users 4000
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks.fakes import FakeIAM, generate_fleet
+from sleuth import services
+from sleuth.snapshot import SnapshotCollector
+from sleuth.store import FileStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument("--refresh-age", type=int, default=80)
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    fleet = generate_fleet(args.users)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = FileStore(os.path.join(tmp, "snapshot.json"))
+        for run in ("full", "incremental"):
+            iam = FakeIAM(fleet, latency=args.latency)
+            services.IAM = iam
+            start = time.perf_counter()
+            collector = SnapshotCollector(store, last_used_refresh_age=args.refresh_age)
+            services.get_iam_users(build_user=collector.build_user)
+            collector.save()
+            elapsed = time.perf_counter() - start
+            print(
+                "{:<12} api_calls={:<7} wall={:.2f}s snapshot={}KB".format(
+                    run,
+                    iam.total_calls,
+                    elapsed,
+                    os.path.getsize(store.path) // 1024,
+                )
+            )
+            for op, count in sorted(iam.calls.items()):
+                print("    {:<28} {}".format(op, count))
+
+
+if __name__ == "__main__":
+    main()
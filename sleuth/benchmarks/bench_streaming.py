@@ -0,0 +1,60 @@
+"""Compares keeping every audited user with keeping only flagged ones
+
+Run from the sleuth directory:
+
+    python -m benchmarks.bench_streaming --users 20000
+"""
+
+import argparse
+import logging
+import os
+import time
+import tracemalloc
+
+from benchmarks.fakes import FakeIAM, generate_fleet
+from sleuth.auditor import audit_account, is_flagged
+
+
+class TimedIAM(FakeIAM):
+    """FakeIAM that remembers when the first key was disabled"""
+
+    first_disable = None
+
+    def update_access_key(self, **kwargs):
+        if self.first_disable is None:
+            self.first_disable = time.perf_counter()
+        return super().update_access_key(**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    args = parser.parse_args()
+
+    logging.getLogger("sleuth").setLevel(logging.ERROR)
+    os.environ.setdefault("WARNING_AGE", "80")
+    os.environ.setdefault("EXPIRATION_AGE", "90")
+    os.environ["ENABLE_AUTO_EXPIRE"] = "true"
+
+    for run, keep in (("all", None), ("flagged", is_flagged)):
+        iam = TimedIAM(generate_fleet(args.users), latency=args.latency)
+        tracemalloc.start()
+        start = time.perf_counter()
+        users = audit_account(iam, keep=keep)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(
+            "{:<8} kept={:<6} wall={:.2f}s first_disable={:.3f}s peak={}KB".format(
+                run,
+                len(users),
+                elapsed,
+                iam.first_disable - start,
+                peak // 1024,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
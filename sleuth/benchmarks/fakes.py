@@ -0,0 +1,514 @@
+"""In-process stand-ins for the AWS APIs sleuth talks to
+
+These are used by the benchmarks and the unit tests so the collection and
+notification paths can be exercised offline. Every fake counts the API calls
+made against it.
+"""
+
+import asyncio
+import collections
+import csv
+import datetime as dt
+import io
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+REPORT_COLUMNS = [
+    "user",
+    "arn",
+    "user_creation_time",
+    "password_enabled",
+    "password_last_used",
+    "password_last_changed",
+    "password_next_rotation",
+    "mfa_active",
+    "access_key_1_active",
+    "access_key_1_last_rotated",
+    "access_key_1_last_used_date",
+    "access_key_1_last_used_region",
+    "access_key_1_last_used_service",
+    "access_key_2_active",
+    "access_key_2_last_rotated",
+    "access_key_2_last_used_date",
+    "access_key_2_last_used_region",
+    "access_key_2_last_used_service",
+    "cert_1_active",
+    "cert_1_last_rotated",
+    "cert_2_active",
+    "cert_2_last_rotated",
+]
+
+
+def client_error(code, operation, message=""):
+    """Builds a botocore ClientError the way the real clients raise them"""
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def generate_fleet(count, now=None, seed=0, max_keys=2):
+    """Generates a synthetic IAM fleet
+
+    Key ages are spread so every audit state shows up: most keys are young and
+    recently used, a tail is old, stagnant or never used.
+
+    Parameters:
+    count (int): Number of users to generate
+    now (datetime): Reference time, defaults to now
+    seed (int): Seed for the random generator so fleets are reproducible
+    max_keys (int): Maximum access keys per user
+
+    Returns:
+    list (dict): Users in the shape FakeIAM expects
+    """
+    rng = random.Random(seed)
+    now = now or dt.datetime.now(dt.timezone.utc)
+
+    users = []
+    for i in range(count):
+        username = "user{:06d}".format(i)
+        tags = []
+        if rng.random() < 0.9:
+            tags.append({"Key": "Slack", "Value": "U{:08d}".format(i)})
+        if rng.random() < 0.05:
+            tags.append({"Key": "KeyAutoExpire", "Value": "False"})
+
+        keys = []
+        for n in range(rng.randint(0, max_keys)):
+            created_age = int(rng.expovariate(1 / 60.0))
+            created = now - dt.timedelta(
+                days=created_age, seconds=rng.randint(0, 86399)
+            )
+            created = created.replace(microsecond=0)
+            key = {
+                "AccessKeyId": "AKIA{:010d}{}".format(i, n),
+                "Status": "Active" if rng.random() < 0.95 else "Inactive",
+                "CreateDate": created,
+            }
+            if rng.random() < 0.85:
+                used_age = min(created_age, int(rng.expovariate(1 / 10.0)))
+                key["LastUsedDate"] = now - dt.timedelta(days=used_age)
+            keys.append(key)
+
+        users.append(
+            {
+                "UserName": username,
+                "UserId": "AIDA{:012d}".format(i),
+                "Path": "/",
+                "Arn": "arn:aws:iam::123456789012:user/{}".format(username),
+                "CreateDate": now - dt.timedelta(days=400),
+                "Tags": tags,
+                "Keys": keys,
+            }
+        )
+
+    return users
+
+
+class FakeClient:
+    """Base for the fakes, counts calls and optionally sleeps per call
+
+    Parameters:
+    latency (float): Seconds to sleep on every call
+    throttle_every (int): Fail every Nth call with a Throttling error, 0 never
+    """
+
+    def __init__(self, latency=0.0, throttle_every=0):
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.calls = collections.Counter()
+        self.throttles = collections.Counter()
+        self._attempts = 0
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        with self._lock:
+            self._attempts += 1
+            throttle = self.throttle_every and self._attempts % self.throttle_every == 0
+            if throttle:
+                self.throttles[operation] += 1
+            else:
+                self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            raise client_error("Throttling", operation, "Rate exceeded")
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+
+class FakeIAM(FakeClient):
+    """Fake IAM client backed by a list of generated users
+
+    Parameters:
+    users (list): Users as returned by generate_fleet
+    page_size (int): Users returned per list_users page
+    latency (float): Seconds to sleep on every call
+    throttle_every (int): Fail every Nth call with a Throttling error, 0 never
+    """
+
+    def __init__(self, users, page_size=100, latency=0.0, throttle_every=0):
+        super().__init__(latency, throttle_every)
+        self.users = users
+        self.page_size = page_size
+        self._by_name = {u["UserName"]: u for u in users}
+        self._by_key = {k["AccessKeyId"]: k for u in users for k in u["Keys"]}
+        self._report_ready = False
+
+    def list_users(self, Marker=None, MaxItems=None):
+        self._call("list_users")
+        start = int(Marker) if Marker else 0
+        end = start + (MaxItems or self.page_size)
+        page = [
+            {
+                "UserName": u["UserName"],
+                "UserId": u["UserId"],
+                "Path": u["Path"],
+                "Arn": u["Arn"],
+                "CreateDate": u["CreateDate"],
+            }
+            for u in self.users[start:end]
+        ]
+        resp = {"Users": page, "IsTruncated": end < len(self.users)}
+        if resp["IsTruncated"]:
+            resp["Marker"] = str(end)
+        return resp
+
+    def get_account_authorization_details(self, Filter, MaxItems=None, Marker=None):
+        self._call("get_account_authorization_details")
+        assert Filter == ["User"]
+        start = int(Marker) if Marker else 0
+        end = start + (MaxItems or 100)
+        details = []
+        for u in self.users[start:end]:
+            detail = {
+                "UserName": u["UserName"],
+                "UserId": u["UserId"],
+                "Path": u["Path"],
+                "Arn": u["Arn"],
+                "CreateDate": u["CreateDate"],
+                "UserPolicyList": [],
+                "GroupList": [],
+                "AttachedManagedPolicies": [],
+            }
+            # like IAM, users without tags have no Tags entry
+            if u["Tags"]:
+                detail["Tags"] = list(u["Tags"])
+            details.append(detail)
+        resp = {"UserDetailList": details, "IsTruncated": end < len(self.users)}
+        if resp["IsTruncated"]:
+            resp["Marker"] = str(end)
+        return resp
+
+    def _user(self, username, operation):
+        if username not in self._by_name:
+            raise client_error("NoSuchEntity", operation, username)
+        return self._by_name[username]
+
+    def list_user_tags(self, UserName):
+        self._call("list_user_tags")
+        return {"Tags": list(self._user(UserName, "ListUserTags")["Tags"])}
+
+    def list_access_keys(self, UserName):
+        self._call("list_access_keys")
+        user = self._user(UserName, "ListAccessKeys")
+        return {
+            "AccessKeyMetadata": [
+                {
+                    "UserName": UserName,
+                    "AccessKeyId": k["AccessKeyId"],
+                    "Status": k["Status"],
+                    "CreateDate": k["CreateDate"],
+                }
+                for k in user["Keys"]
+            ]
+        }
+
+    def get_access_key_last_used(self, AccessKeyId):
+        self._call("get_access_key_last_used")
+        last_used = {"Region": "N/A", "ServiceName": "N/A"}
+        if "LastUsedDate" in self._by_key[AccessKeyId]:
+            last_used["LastUsedDate"] = self._by_key[AccessKeyId]["LastUsedDate"]
+        return {"AccessKeyLastUsed": last_used}
+
+    def update_access_key(self, UserName, AccessKeyId, Status):
+        self._call("update_access_key")
+        self._by_key[AccessKeyId]["Status"] = Status
+        return {}
+
+    def generate_credential_report(self):
+        self._call("generate_credential_report")
+        if self._report_ready:
+            return {"State": "COMPLETE"}
+        self._report_ready = True
+        return {"State": "STARTED"}
+
+    def get_credential_report(self):
+        self._call("get_credential_report")
+        if not self._report_ready:
+            raise client_error("ReportNotPresent", "GetCredentialReport")
+
+        def fmt(date):
+            return date.isoformat() if date else "N/A"
+
+        out = io.StringIO()
+        writer = csv.DictWriter(out, REPORT_COLUMNS, restval="N/A")
+        writer.writeheader()
+        writer.writerow(
+            {"user": "<root_account>", "arn": "arn:aws:iam::123456789012:root"}
+        )
+        for u in self.users:
+            row = {
+                "user": u["UserName"],
+                "arn": u["Arn"],
+                "user_creation_time": fmt(u["CreateDate"]),
+            }
+            for n in (1, 2):
+                prefix = "access_key_{}_".format(n)
+                row[prefix + "active"] = "false"
+                if len(u["Keys"]) >= n:
+                    k = u["Keys"][n - 1]
+                    row[prefix + "active"] = str(k["Status"] == "Active").lower()
+                    row[prefix + "last_rotated"] = fmt(k["CreateDate"])
+                    row[prefix + "last_used_date"] = fmt(k.get("LastUsedDate"))
+            writer.writerow(row)
+
+        return {
+            "Content": out.getvalue().encode("utf-8"),
+            "ReportFormat": "text/csv",
+            "GeneratedTime": dt.datetime.now(dt.timezone.utc),
+        }
+
+
+class AsyncFakeIAM:
+    """Async stand-in for an aiobotocore IAM client, backed by a FakeIAM
+
+    Latency is awaited rather than slept so calls overlap on one thread.
+    Calls and throttles are counted by the FakeIAM.
+
+    Parameters:
+    iam (FakeIAM): Fleet and counters, its own latency should be 0
+    latency (float): Seconds every call takes
+    """
+
+    def __init__(self, iam, latency=0.0):
+        self.iam = iam
+        self.latency = latency
+        self.in_flight = collections.Counter()
+        self.max_in_flight = collections.Counter()
+
+    def __getattr__(self, name):
+        method = getattr(self.iam, name)
+
+        async def call(**kwargs):
+            self.in_flight[name] += 1
+            self.max_in_flight[name] = max(
+                self.max_in_flight[name], self.in_flight[name]
+            )
+            try:
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                return method(**kwargs)
+            finally:
+                self.in_flight[name] -= 1
+
+        return call
+
+
+class FakeSTS(FakeClient):
+    """Fake STS client, the returned access key ID is the assumed role ARN"""
+
+    def assume_role(self, RoleArn, RoleSessionName):
+        self._call("assume_role")
+        return {
+            "Credentials": {
+                "AccessKeyId": RoleArn,
+                "SecretAccessKey": "secret",
+                "SessionToken": "token",
+                "Expiration": dt.datetime.now(dt.timezone.utc) + dt.timedelta(hours=1),
+            }
+        }
+
+
+class FakeOrganization:
+    """One FakeIAM per account behind a FakeSTS
+
+    Parameters:
+    accounts (int): Number of accounts to create
+    users (int): Users per account
+    latency (float): Seconds to sleep on every IAM and STS call
+    """
+
+    def __init__(self, accounts, users, latency=0.0, now=None):
+        self.account_ids = ["{:012d}".format(100000000000 + i) for i in range(accounts)]
+        self.sts = FakeSTS(latency)
+        self.iams = {
+            account: FakeIAM(generate_fleet(users, now=now, seed=i), latency=latency)
+            for i, account in enumerate(self.account_ids)
+        }
+
+    def client_factory(self, service_name, aws_access_key_id, **kwargs):
+        """Stands in for create_client, picks the account from the credentials"""
+        return self.iams[aws_access_key_id.split(":")[4]]
+
+    @property
+    def total_calls(self):
+        return self.sts.total_calls + sum(i.total_calls for i in self.iams.values())
+
+
+class FakeS3(FakeClient):
+    """Fake S3 client keeping objects in memory
+
+    Multipart uploads enforce the minimum part size of S3 for every part but
+    the last.
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = 0
+
+    def get_object(self, Bucket, Key):
+        self._call("get_object")
+        if (Bucket, Key) not in self.objects:
+            raise client_error("NoSuchKey", "GetObject", Key)
+        return {"Body": io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self._call("put_object")
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.read()
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("create_multipart_upload")
+        upload_id = "upload{}".format(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._call("upload_part")
+        self.uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": '"{}-{}"'.format(UploadId, PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._call("complete_multipart_upload")
+        parts = self.uploads.pop(UploadId)
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        if numbers != sorted(parts):
+            raise client_error("InvalidPart", "CompleteMultipartUpload")
+        if any(len(parts[n]) < self.MIN_PART_SIZE for n in numbers[:-1]):
+            raise client_error("EntityTooSmall", "CompleteMultipartUpload")
+        self.objects[(Bucket, Key)] = b"".join(parts[n] for n in numbers)
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._call("abort_multipart_upload")
+        self.uploads.pop(UploadId)
+        self.aborted += 1
+        return {}
+
+
+class FakeSNS(FakeClient):
+    """Fake SNS client recording published messages and batches
+
+    PublishBatch enforces the entry count and size limits of SNS. With
+    fail_every set, every Nth entry fails once on the SNS side.
+    """
+
+    def __init__(self, latency=0.0, fail_every=0):
+        super().__init__(latency)
+        self.fail_every = fail_every
+        self.published = []
+        self.batches = []
+        self._entries = 0
+        self._failed = set()
+
+    def publish(self, TopicArn, Message, **kwargs):
+        self._call("publish")
+        with self._lock:
+            self.published.append(dict(kwargs, TopicArn=TopicArn, Message=Message))
+            return {"MessageId": str(len(self.published))}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        self._call("publish_batch")
+        entries = PublishBatchRequestEntries
+        if len(entries) > 10:
+            raise client_error("TooManyEntriesInBatchRequest", "PublishBatch")
+        size = sum(
+            len(e["Message"].encode("utf-8"))
+            + sum(
+                len(k) + len(a["DataType"]) + len(a["StringValue"].encode("utf-8"))
+                for k, a in e.get("MessageAttributes", {}).items()
+            )
+            for e in entries
+        )
+        if size > 256 * 1024:
+            raise client_error("BatchRequestTooLong", "PublishBatch")
+
+        successful = []
+        failed = []
+        with self._lock:
+            self.batches.append([e["Id"] for e in entries])
+            for e in entries:
+                self._entries += 1
+                key = (TopicArn, e["Message"])
+                if (
+                    self.fail_every
+                    and self._entries % self.fail_every == 0
+                    and key not in self._failed
+                ):
+                    self._failed.add(key)
+                    failed.append(
+                        {"Id": e["Id"], "Code": "InternalError", "SenderFault": False}
+                    )
+                    continue
+                self.published.append(dict(e, TopicArn=TopicArn))
+                successful.append(
+                    {"Id": e["Id"], "MessageId": str(len(self.published))}
+                )
+        return {"Successful": successful, "Failed": failed}
+
+
+class FakeSSM(FakeClient):
+    """Fake SSM client serving parameters from a dict"""
+
+    def __init__(self, parameters, latency=0.0):
+        super().__init__(latency)
+        self.parameters = parameters
+
+    def get_parameter(self, Name, WithDecryption=False):
+        self._call("get_parameter")
+        if Name not in self.parameters:
+            raise client_error("ParameterNotFound", "GetParameter", Name)
+        return {"Parameter": {"Name": Name, "Value": self.parameters[Name]}}
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, headers=None, text="ok"):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class FakeSlackSession(FakeClient):
+    """Stands in for the requests session of SlackWebhook, accepting every post
+
+    Parameters:
+    latency (float): Seconds to sleep on every post
+    """
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self._call("post")
+        with self._lock:
+            self.posts.append((url, data))
+        return FakeResponse()
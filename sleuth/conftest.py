@@ -0,0 +1,9 @@
+import pytest
+
+from sleuth import cache
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Every test starts without values cached by an earlier one"""
+    cache.clear()
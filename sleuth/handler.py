@@ -5,6 +5,8 @@ import logging.config
 from pythonjsonlogger import jsonlogger
 
 from sleuth.auditor import audit
+from sleuth.config import Config
+from sleuth.services import create_client
 
 # setup module wide logger
 LOGGER = logging.getLogger("sleuth")
@@ -38,6 +40,16 @@ LOGGER.addHandler(logHandler)
 VERSION = "1.3.0"
 
 
+def reinvoke(event, context):
+    """Invokes this function again, asynchronously, to resume the run"""
+    LOGGER.info("Re-invoking {} to resume".format(context.invoked_function_arn))
+    create_client("lambda").invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps(event or {}),
+    )
+
+
 def handler(event, context):
     """
     Incoming lambda handler
@@ -45,9 +57,15 @@ def handler(event, context):
 
     LOGGER.info("Running aws-iam-sleuth {}".format(VERSION))
 
-    audit()
+    config = Config.from_env()
+    time_left = getattr(context, "get_remaining_time_in_millis", None)
+    complete = audit(config=config, time_left=time_left)
+
+    # otherwise the next scheduled trigger resumes from the checkpoint
+    if not complete and config.checkpoint_reinvoke:
+        reinvoke(event, context)
 
-    body = {}
+    body = {"complete": complete}
     response = {"statusCode": 200, "body": json.dumps(body)}
 
     return response
@@ -0,0 +1,306 @@
+"""Collects IAM users with asyncio instead of threads
+
+Every user costs a few small IAM calls, so collection is bound by latency.
+With threads each call in flight holds a thread, here it is a coroutine and
+the calls to each API are bounded by a semaphore instead.
+
+The client interface is aiobotocore's: the same methods as boto3, as
+coroutines. aiobotocore is only needed when no client is passed in.
+"""
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from sleuth.metrics import record_call
+from sleuth.ratelimit import (
+    NON_API_METHODS,
+    THROTTLE_ERROR_CODES,
+    TRANSIENT_ERROR_CODES,
+)
+from sleuth.services import (
+    USER_DETAILS_PAGE_SIZE,
+    apply_tag_defaults,
+    user_details_page,
+)
+
+LOGGER = logging.getLogger("sleuth")
+
+# async IAM client used instead of an aiobotocore one when set, ex: a stub
+IAM = None
+
+
+def create_async_client(service_name, max_pool_connections=50, **kwargs):
+    """Creates an aiobotocore client
+
+    botocore retries are turned off, AsyncLimitedClient retries on its own.
+
+    Parameters:
+    service_name (str): AWS service, ex: iam
+    max_pool_connections (int): HTTP connections kept open
+    kwargs: Passed through to create_client, ex: credentials
+
+    Returns:
+    async context manager: Yields the client
+    """
+    try:
+        from aiobotocore.config import AioConfig
+        from aiobotocore.session import get_session
+    except ImportError:
+        raise RuntimeError("COLLECTION_MODE=async needs aiobotocore installed")
+
+    return get_session().create_client(
+        service_name,
+        config=AioConfig(
+            retries={"total_max_attempts": 1},
+            max_pool_connections=max_pool_connections,
+        ),
+        **kwargs,
+    )
+
+
+class AsyncLimitedClient:
+    """Wraps an async client with a semaphore per API and retries
+
+    Throttling and transient errors are retried with jittered exponential
+    backoff like RateLimitedClient, without holding the semaphore. Every
+    attempt is recorded in the run metrics.
+
+    Parameters:
+    client: aiobotocore client, or anything with the same coroutine methods
+    concurrency (int): Calls in flight at once for each API
+    max_retries (int): Retries per call before the error is raised
+    base_delay (float): Backoff for the first retry in seconds
+    max_delay (float): Backoff cap in seconds
+    sleep (coroutine function): Used for backoff
+    """
+
+    def __init__(
+        self,
+        client,
+        concurrency=10,
+        max_retries=8,
+        base_delay=0.2,
+        max_delay=20,
+        sleep=asyncio.sleep,
+    ):
+        self._client = client
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        # only used from the event loop thread, no lock needed
+        self._semaphores = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or name in NON_API_METHODS or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            return await self._call(name, attr, *args, **kwargs)
+
+        return call
+
+    def _semaphore(self, operation):
+        if operation not in self._semaphores:
+            self._semaphores[operation] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[operation]
+
+    async def _call(self, operation, method, *args, **kwargs):
+        semaphore = self._semaphore(operation)
+        attempt = 0
+        while True:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    resp = await method(*args, **kwargs)
+                except ClientError as e:
+                    record_call(operation, time.perf_counter() - start, error=True)
+                    code = e.response.get("Error", {}).get("Code")
+                    if code not in THROTTLE_ERROR_CODES | TRANSIENT_ERROR_CODES:
+                        raise
+                    if attempt >= self.max_retries:
+                        raise
+                except (ConnectionError, HTTPClientError):
+                    record_call(operation, time.perf_counter() - start, error=True)
+                    if attempt >= self.max_retries:
+                        raise
+                else:
+                    record_call(operation, time.perf_counter() - start)
+                    return resp
+
+            attempt += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            LOGGER.debug("Retrying {} in {:.2f}s".format(operation, delay))
+            await self.sleep(random.uniform(delay / 2, delay))
+
+
+async def get_iam_user(u, iam, now=None):
+    """Builds a User with tags and key info from a list_users entry
+
+    The tags and the key list are fetched at once, then the last used date of
+    every key. Tags carried by the entry are used instead of list_user_tags.
+
+    Parameters:
+    u (dict): User entry from the list_users API
+    iam: Async IAM client
+    now (datetime): Reference time of the audit run, see Key
+
+    Returns:
+    User: User and related access key info
+    """
+    from sleuth.auditor import Key, User
+
+    username = u["UserName"]
+    if "Tags" in u:
+        key_resp = await iam.list_access_keys(UserName=username)
+        tag_list = u["Tags"]
+    else:
+        tag_resp, key_resp = await asyncio.gather(
+            iam.list_user_tags(UserName=username),
+            iam.list_access_keys(UserName=username),
+        )
+        tag_list = tag_resp["Tags"]
+    tags = apply_tag_defaults(username, {t["Key"]: t["Value"] for t in tag_list})
+    key_info = key_resp["AccessKeyMetadata"]
+    last_used = await asyncio.gather(
+        *(iam.get_access_key_last_used(AccessKeyId=k["AccessKeyId"]) for k in key_info)
+    )
+
+    user = User(
+        u["UserId"],
+        username,
+        tags["Slack"],
+        tags["KeyAutoExpire"],
+        tags=tags,
+        path=u.get("Path", "/"),
+    )
+    user.keys = [
+        Key(
+            k["UserName"],
+            k["AccessKeyId"],
+            k["Status"],
+            k["CreateDate"],
+            resp["AccessKeyLastUsed"].get("LastUsedDate", k["CreateDate"]),
+            now,
+        )
+        for k, resp in zip(key_info, last_used)
+    ]
+    return user
+
+
+async def list_page(iam, marker=None, bulk=False):
+    """Lists a page of users, see aiter_iam_users"""
+    if not bulk:
+        if marker:
+            return await iam.list_users(Marker=marker)
+        return await iam.list_users()
+
+    kwargs = {"Filter": ["User"], "MaxItems": USER_DETAILS_PAGE_SIZE}
+    if marker:
+        kwargs["Marker"] = marker
+    return user_details_page(await iam.get_account_authorization_details(**kwargs))
+
+
+async def aiter_iam_users(
+    concurrency=10, iam=None, now=None, cursor=None, stop=None, bulk=False
+):
+    """Yields IAM users WITH key info as they are collected
+
+    The users of a page are built concurrently while the next page is
+    listed, and yielded in list_users order like services.iter_iam_users.
+
+    Parameters:
+    concurrency (int): Calls in flight at once for each API
+    iam: Async IAM client, defaults to IAM or an aiobotocore client. It is
+         wrapped in an AsyncLimitedClient unless it already is one
+    now (datetime): Reference time of the audit run, see Key
+    cursor (dict): Where listing resumes, see services.iter_iam_users
+    stop (callable): Checked after every page, True stops listing
+    bulk (bool): List users with their tags with
+                 get_account_authorization_details, see
+                 services.list_user_details_pages
+
+    Yields:
+    User: User and related access key info
+    """
+    cursor = cursor if cursor is not None else {}
+    async with contextlib.AsyncExitStack() as stack:
+        iam = iam or IAM
+        if iam is None:
+            iam = await stack.enter_async_context(
+                create_async_client("iam", max_pool_connections=concurrency * 3)
+            )
+        if not isinstance(iam, AsyncLimitedClient):
+            iam = AsyncLimitedClient(iam, concurrency)
+
+        pending = []
+        marker = cursor.get("marker")
+        try:
+            while True:
+                resp = await list_page(iam, marker, bulk)
+                tasks = [
+                    asyncio.ensure_future(get_iam_user(u, iam, now))
+                    for u in resp["Users"]
+                ]
+                for task in pending:
+                    yield await task
+                pending = tasks
+                marker = resp["Marker"] if resp.get("IsTruncated") else None
+                if marker is None or (stop is not None and stop()):
+                    break
+
+            for task in pending:
+                yield await task
+        finally:
+            # the consumer stopped early, or a call failed
+            for task in pending:
+                task.cancel()
+        cursor["marker"] = marker
+        cursor["done"] = marker is None
+
+
+def iter_iam_users(
+    concurrency=10, iam=None, now=None, cursor=None, stop=None, bulk=False
+):
+    """Runs aiter_iam_users on its own event loop, for synchronous callers
+
+    Collection only makes progress while the caller waits for the next user,
+    auditing a user takes microseconds so that costs little.
+
+    Parameters:
+    See aiter_iam_users
+
+    Yields:
+    User: User and related access key info
+    """
+    loop = asyncio.new_event_loop()
+    users = aiter_iam_users(concurrency, iam, now, cursor, stop, bulk)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(users.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(users.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def get_iam_users(concurrency=10, iam=None, now=None, bulk=False):
+    """Fetches IAM users WITH key info
+
+    Parameters:
+    See aiter_iam_users
+
+    Returns:
+    list (User): User and related access key info
+    """
+    return list(iter_iam_users(concurrency, iam, now, bulk=bulk))
@@ -1,56 +1,114 @@
 import datetime as dt
+import hashlib
+import json
 import logging
 import os
-
-from tabulate import tabulate
-
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sleuth import cache, metrics
+from sleuth.checkpoint import Checkpoint, dump_user, load_user
+from sleuth.config import Config
+from sleuth.directory import load_directory
+from sleuth.disable import DisableExecutor
+from sleuth.export import Exporter
 from sleuth.services import (
-    disable_key,
-    get_iam_users,
+    assume_role_client,
+    format_username,
+    get_account_role_arn,
+    get_api_stats,
+    get_user_tags_bulk,
+    iter_iam_users,
+    iter_iam_users_from_credential_report,
+    list_user_details_pages,
     prepare_slack_message,
     prepare_sns_message,
+    resolve_parameter,
     send_slack_message,
     send_sns_message,
 )
+from sleuth.policy import load_policy
+from sleuth.report import NOTIFY_STATES, Report
+from sleuth.snapshot import SnapshotCollector
+from sleuth.sns import publish_findings
+from sleuth.store import get_store
 
 LOGGER = logging.getLogger("sleuth")
 
 
 class Key:
-    username = ""
-    key_id = ""
-    created = None
-    status = ""
-    inactivity = None
-    audit_state = None
-
-    creation_age = 0
-    access_age = 0
-    creation_valid_for = 0
-    activity_valid_for = 0
-
-    def __init__(self, username, key_id, status, created, inactivity_age):
+    __slots__ = (
+        "username",
+        "key_id",
+        "status",
+        "created",
+        "inactivity_age",
+        "audit_state",
+        "creation_age",
+        "access_age",
+        "creation_valid_for",
+        "activity_valid_for",
+        "next_check",
+        "_now",
+    )
+
+    def __init__(self, username, key_id, status, created, inactivity_age, now=None):
+        """
+        Parameters:
+        username (str): Owner of the key
+        key_id (str): Access key ID
+        status (str): AWS status, Active or Inactive
+        created (datetime): Key creation date
+        inactivity_age (datetime): Date the key was last used
+        now (datetime): Reference time of the audit run the ages are computed
+                        from, defaults to the current time
+        """
         self.username = username
         self.key_id = key_id
         self.status = status
         self.created = created
         self.inactivity_age = inactivity_age
-
-        self.creation_age = (dt.datetime.now(dt.timezone.utc) - self.created).days
-        self.access_age = (dt.datetime.now(dt.timezone.utc) - self.inactivity_age).days
-
-    def audit(self, rotate_age, expire_age, max_inactivity_age, inactivity_warning_age):
+        self.audit_state = None
+        self._now = now or dt.datetime.now(dt.timezone.utc)
+
+        self.creation_age = (self._now - self.created).days
+        self.access_age = (self._now - self.inactivity_age).days
+        self.creation_valid_for = 0
+        self.activity_valid_for = 0
+        self.next_check = None
+
+    @property
+    def now(self):
+        """Reference time the ages were computed from"""
+        return self._now
+
+    def audit(
+        self,
+        rotate_age,
+        expire_age,
+        max_inactivity_age,
+        inactivity_warning_age,
+        auto_expire_enabled=None,
+    ):
         """
         Audits the key and sets the status state based on key creation age and last used age
 
         Note if the key is below rotate or last used age, the audit_state=good.
         If the key is disabled will be marked as disabled.
 
+        next_check is set to the first date the audit_state can change as the
+        key ages. Good and old keys keep their state until an age crosses a
+        threshold, a more recent last used date only makes them younger. Keys
+        in any other state are due right away, using the key again can lift
+        a stagnant key for instance.
+
         Parameters:
         rotate (int): Age key must be before audit_state=old
         expire (int): Age key must be before audit_state=expire
         inactivity_age (int): Age of last key usage must be before audit_state=expire
         inactivity_warning_age (int): Age of last key usage must be before audit_state=stagnant
+        auto_expire_enabled (bool): Mark Inactive keys as disabled, defaults to
+                                    ENABLE_AUTO_EXPIRE
 
         Returns:
         None
@@ -82,29 +140,67 @@ class Key:
             self.audit_state = "good"
 
         # lets audit the status
-        if (
-            self.status == "Inactive"
-            and os.environ.get("ENABLE_AUTO_EXPIRE", False) == "true"
-        ):
+        if auto_expire_enabled is None:
+            auto_expire_enabled = os.environ.get("ENABLE_AUTO_EXPIRE", False) == "true"
+        if self.status == "Inactive" and auto_expire_enabled:
             self.audit_state = "disabled"
 
+        if self.audit_state in ("good", "old"):
+            crossings = [
+                self.created + dt.timedelta(days=age)
+                for age in (rotate_age, expire_age)
+            ] + [
+                self.inactivity_age + dt.timedelta(days=age)
+                for age in (inactivity_warning_age, max_inactivity_age)
+            ]
+            self.next_check = min(d for d in crossings if d > self._now)
+        else:
+            self.next_check = self._now
+
 
 class User:
-    username = ""
-    user_id = ""
-    slack_id = ""
-    auto_expire = ""
-    keys = []
+    __slots__ = (
+        "user_id",
+        "username",
+        "slack_id",
+        "auto_expire",
+        "account",
+        "tags",
+        "path",
+        "keys",
+    )
 
-    def __init__(self, user_id, username, slack_id=None, auto_expire=None):
+    def __init__(
+        self,
+        user_id,
+        username,
+        slack_id=None,
+        auto_expire=None,
+        account=None,
+        tags=None,
+        path="/",
+    ):
         self.user_id = user_id
         self.username = username
         self.slack_id = slack_id
         self.auto_expire = auto_expire
-
-    def audit(self, rotate=80, expire=90, inactivity=90, inactivity_warn=80):
+        self.account = account
+        self.tags = tags if tags is not None else {}
+        self.path = path
+        self.keys = []
+
+    def audit(
+        self,
+        rotate=80,
+        expire=90,
+        inactivity=90,
+        inactivity_warn=80,
+        auto_expire_enabled=None,
+    ):
+        if auto_expire_enabled is None:
+            auto_expire_enabled = os.environ.get("ENABLE_AUTO_EXPIRE", False) == "true"
         for k in self.keys:
-            k.audit(rotate, expire, inactivity, inactivity_warn)
+            k.audit(rotate, expire, inactivity, inactivity_warn, auto_expire_enabled)
 
 
 def print_key_report(users):
@@ -117,13 +213,16 @@ def print_key_report(users):
     None
     """
 
+    # only needed for DEBUG runs, keep it out of the cold start
+    from tabulate import tabulate
+
     tbl_data = []
 
     for u in users:
         for k in u.keys:
             tbl_data.append(
                 [
-                    u.username,
+                    format_username(u),
                     u.slack_id,
                     k.key_id,
                     u.auto_expire,
@@ -149,85 +248,552 @@ def print_key_report(users):
     )
 
 
-def audit():
-    iam_users = get_iam_users()
+def get_schedule_version(config, policy):
+    """Digest of the settings audit states depend on
 
-    # Check for optional env vars
-    if (
-        os.environ.get("INACTIVITY_AGE")
-        and not os.environ.get("INACTIVITY_WARNING_AGE")
-    ) or (
-        os.environ.get("INACTIVITY_WARNING_AGE")
-        and not os.environ.get("INACTIVITY_AGE")
-    ):
-        raise RuntimeError(
-            "Must set env var INACTIVITY_WARNING_AGE and INACTIVITY_AGE together"
-        )
+    Only the thresholds, ENABLE_AUTO_EXPIRE and the policy rules count, so
+    editing a message title or a worker count keeps the snapshot schedule.
+
+    Parameters:
+    config (Config): Settings of the run
+    policy (PolicyIndex): Thresholds per user
+
+    Returns:
+    str: Schedule version, see SnapshotCollector
+    """
+    settings = json.dumps([config.enable_auto_expire, policy.version])
+    return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+
+def get_snapshot_collector(config, account=None, now=None, policy=None):
+    """Builds the SnapshotCollector configured by SNAPSHOT_URL
+
+    Parameters:
+    config (Config): Settings of the run
+    account (str): Account being audited, fills the {account} placeholder
+    now (datetime): Reference time of the audit run
+    policy (PolicyIndex): Thresholds per user, defaults to the rules at
+                          POLICY_URL
+
+    Returns:
+    SnapshotCollector
+    """
+    if policy is None:
+        policy = load_policy(config)
+    url = config.snapshot_url
+    if account is not None and "{account}" not in url:
+        raise RuntimeError("SNAPSHOT_URL must contain {account} to audit accounts")
+
+    return SnapshotCollector(
+        get_store(url.format(account=account)),
+        full_refresh_runs=config.snapshot_full_refresh_runs,
+        last_used_refresh_age=config.inactivity_warning_age,
+        now=now,
+        schedule_version=get_schedule_version(config, policy),
+    )
+
+
+def is_flagged(user):
+    """True if any key of the user shows up in the notifications"""
+    return any(k.audit_state in NOTIFY_STATES for k in user.keys)
 
-    # lets audit keys so the ages and state are set
-    for u in iam_users:
-        # Do not audit keys that are set to not allow auto-expire
-        if u.auto_expire.lower() == "false":
-            LOGGER.info("{} key is set to not expire".format(u.username))
-            for k in u.keys:
-                k.audit_state = "good"
-        else:
-            # Do not require last used age, set to expiration age as default
-            u.audit(
-                int(os.environ["WARNING_AGE"]),
-                int(os.environ["EXPIRATION_AGE"]),
-                int(os.environ.get("INACTIVITY_AGE", os.environ["EXPIRATION_AGE"])),
-                int(
-                    os.environ.get("INACTIVITY_WARNING_AGE", os.environ["WARNING_AGE"])
-                ),
-            )
 
-    if os.environ.get("DEBUG", False):
-        print_key_report(iam_users)
+def collect_users(
+    config, iam=None, account=None, now=None, cursor=None, stop=None, policy=None
+):
+    """Yields the users of an account as they are collected
 
-    # lets disabled expired keys and build list of old and expired for slack
-    if os.environ.get("ENABLE_AUTO_EXPIRE", False) == "true":
-        for u in iam_users:
-            for k in u.keys:
-                if k.audit_state == "expire" or k.audit_state == "stagnant_expire":
-                    disable_key(k, u.username)
+    Parameters:
+    config (Config): Settings of the run
+    iam: IAM client for the account, defaults to the module client
+    account (str): Account being audited, None for the local account
+    now (datetime): Reference time key ages are computed from
+    cursor (dict): Where listing resumes, see iter_iam_users. The credential
+                   report is always read in one go
+    stop (callable): True stops listing at the next page, see iter_iam_users
+    policy (PolicyIndex): Thresholds per user, versions the snapshot schedule
+
+    Yields:
+    User: User and related access key info
+    """
+    workers = config.collection_workers
+    cursor = cursor if cursor is not None else {}
+    bulk = config.tag_source == "bulk"
+    # users and their tags come from get_account_authorization_details
+    list_pages = list_user_details_pages if bulk else None
+    if config.collection_mode == "credential_report":
+        LOGGER.info("Collecting key info from the IAM credential report")
+        tags = get_user_tags_bulk(iam) if bulk else None
+        yield from iter_iam_users_from_credential_report(workers, iam, now, tags)
+        cursor["done"] = True
+    elif config.collection_mode == "async":
+        if account is not None:
+            raise RuntimeError("COLLECTION_MODE=async only audits the local account")
+        # imported here so other modes do not load asyncio on cold starts
+        from sleuth import aio
+
+        LOGGER.info("Collecting key info with the async collector")
+        yield from aio.iter_iam_users(
+            config.async_concurrency, now=now, cursor=cursor, stop=stop, bulk=bulk
+        )
+    elif config.snapshot_url:
+        collector = get_snapshot_collector(config, account, now, policy)
+        complete = cursor.get("marker") is None
+        yield from iter_iam_users(
+            workers, iam, collector.build_user, now, cursor, stop, list_pages
+        )
+        # only a snapshot of every user is saved, after a resume the users
+        # listed before it are fetched in full on the next run instead
+        if complete and cursor["done"]:
+            collector.save()
     else:
-        LOGGER.warn("Cannot disable AWS Keys, ENABLE_AUTO_EXPIRE set to False")
+        yield from iter_iam_users(
+            workers, iam, now=now, cursor=cursor, stop=stop, list_pages=list_pages
+        )
+
 
-    # Default expiration headers
-    EXP_MSG_TITLE = os.environ.get(
-        "EXPIRE_NOTIFICATION_TITLE", "AWS IAM Key Expiration Report"
+def get_disable_executor(config):
+    """Builds the DisableExecutor configured by DISABLE_WORKERS, DISABLE_RETRIES
+    and DISABLE_DRY_RUN
+
+    Parameters:
+    config (Config): Settings of the run
+
+    Returns:
+    DisableExecutor
+    """
+    return DisableExecutor(
+        workers=config.disable_workers,
+        dry_run=config.disable_dry_run,
+        retries=config.disable_retries,
+        debug=config.debug,
     )
-    EXP_MSG_TEXT = os.environ.get("EXPIRE_NOTIFICATION_TEXT", "")
-    STGNT_MSG_TITLE = os.environ.get(
-        "INACTIVE_NOTIFICATION_TITLE", "AWS IAM Key Inactivity Report"
+
+
+def iter_audit_account(
+    iam=None,
+    account=None,
+    now=None,
+    disabler=None,
+    config=None,
+    policy=None,
+    exporter=None,
+    cursor=None,
+    stop=None,
+    directory=None,
+):
+    """Audits the users of an account as they are collected
+
+    Expired keys are handed to the disable executor as soon as their user is
+    audited rather than after the whole account has been collected.
+
+    Parameters:
+    iam: IAM client for the account, defaults to the module client
+    account (str): Account to tag users with, None for the local account
+    now (datetime): Reference time key ages are computed from
+    disabler (DisableExecutor): Disables expired keys, the caller closes it.
+                                Defaults to one from get_disable_executor
+                                that is closed once the account is done
+    config (Config): Settings of the run, defaults to Config.from_env
+    policy (PolicyIndex): Thresholds per user, defaults to the rules at
+                          POLICY_URL
+    exporter (Exporter): Every audited user is written to it, the caller
+                         closes it
+    cursor (dict): Where listing resumes and whether it is done, see
+                   collect_users
+    stop (callable): True stops listing at the next page
+    directory (Directory): Slack IDs of untagged users, defaults to the
+                           index at DIRECTORY_URL
+
+    Yields:
+    User: Audited user
+    """
+    config = config or Config.from_env()
+    if policy is None:
+        policy = load_policy(config)
+    if directory is None:
+        directory = load_directory(config)
+    enable_auto_expire = config.enable_auto_expire
+    owned = None
+    if not enable_auto_expire:
+        LOGGER.warn("Cannot disable AWS Keys, ENABLE_AUTO_EXPIRE set to False")
+        disabler = None
+    elif disabler is None:
+        owned = disabler = get_disable_executor(config)
+
+    run_metrics = metrics.current()
+    try:
+        for u in collect_users(config, iam, account, now, cursor, stop, policy):
+            start = time.perf_counter()
+            u.account = account
+            if directory is not None:
+                directory.fill(u)
+            rule = policy.resolve(u)
+            # Do not audit keys that are set to not allow auto-expire
+            if rule.auto_expire is False or (
+                rule.auto_expire is None and u.auto_expire.lower() == "false"
+            ):
+                LOGGER.info("{} key is set to not expire".format(u.username))
+                for k in u.keys:
+                    k.audit_state = "good"
+            else:
+                u.audit(*rule.ages, auto_expire_enabled=enable_auto_expire)
+            run_metrics.add_time("audit", time.perf_counter() - start)
+
+            # lets disabled expired keys
+            if disabler is not None:
+                for k in u.keys:
+                    if k.audit_state == "expire" or k.audit_state == "stagnant_expire":
+                        disabler.submit(k, u.username, iam, account)
+
+            if exporter is not None:
+                exporter.write_user(u)
+
+            yield u
+    finally:
+        if owned is not None:
+            LOGGER.info("Disabled keys: {}".format(json.dumps(owned.close())))
+
+
+def audit_account(
+    iam=None,
+    account=None,
+    now=None,
+    keep=None,
+    disabler=None,
+    config=None,
+    policy=None,
+    exporter=None,
+    cursor=None,
+    stop=None,
+    directory=None,
+):
+    """Collects, audits and disables keys for a single account
+
+    Parameters:
+    iam: IAM client for the account, defaults to the module client
+    account (str): Account to tag users with, None for the local account
+    now (datetime): Reference time key ages are computed from
+    keep (callable): Only users it returns True for are returned, e.g.
+                     is_flagged, defaults to every user
+    disabler (DisableExecutor): Disables expired keys, see iter_audit_account
+    config (Config): Settings of the run, defaults to Config.from_env
+    policy (PolicyIndex): Thresholds per user, see iter_audit_account
+    exporter (Exporter): Every audited user is written to it
+    cursor (dict): Where listing resumes, see iter_audit_account
+    stop (callable): True stops listing at the next page
+    directory (Directory): Slack IDs of untagged users, see iter_audit_account
+
+    Returns:
+    list (User): Audited users
+    """
+    users = iter_audit_account(
+        iam, account, now, disabler, config, policy, exporter, cursor, stop, directory
     )
-    STGNT_MSG_TEXT = os.environ.get("INACTIVE_NOTIFICATION_TEXT", "")
+    if keep is None:
+        return list(users)
+    return [u for u in users if keep(u)]
+
+
+def audit_accounts(
+    accounts,
+    client_factory=None,
+    workers=None,
+    now=None,
+    keep=None,
+    disabler=None,
+    config=None,
+    policy=None,
+    exporter=None,
+    cursors=None,
+    stop=None,
+    directory=None,
+):
+    """Audits several accounts in parallel
+
+    Parameters:
+    accounts (list): Account IDs or role ARNs, see get_account_role_arn
+    client_factory (callable): Returns an IAM client for a role ARN,
+                               defaults to assume_role_client
+    workers (int): Accounts audited at once, defaults to ACCOUNT_WORKERS
+    now (datetime): Reference time key ages are computed from
+    keep (callable): Only users it returns True for are returned
+    disabler (DisableExecutor): Disables expired keys of every account
+    config (Config): Settings of the run, defaults to Config.from_env
+    policy (PolicyIndex): Thresholds per user, loaded once for every account
+    exporter (Exporter): Every audited user of every account is written to it
+    cursors (dict): Listing cursor per account ID, see iter_audit_account.
+                    Missing ones are added, accounts whose listing is done
+                    are skipped
+    stop (callable): True stops listing at the next page of every account
+    directory (Directory): Slack IDs of untagged users, loaded once for every
+                           account so a stale index is synced only once
+
+    Returns:
+    list (User): Audited users of all accounts, in account order
+    """
+    config = config or Config.from_env()
+    if policy is None:
+        policy = load_policy(config)
+    if directory is None:
+        directory = load_directory(config)
+    client_factory = client_factory or assume_role_client
+    workers = workers or config.account_workers
+    cursors = cursors if cursors is not None else {}
+
+    role_arns = [get_account_role_arn(a, config.audit_role_name) for a in accounts]
+    for role_arn in role_arns:
+        cursors.setdefault(role_arn.split(":")[4], {})
+
+    def run(role_arn):
+        account = role_arn.split(":")[4]
+        cursor = cursors[account]
+        if cursor.get("done"):
+            return []
+        LOGGER.info("Auditing account {}".format(account))
+        return audit_account(
+            client_factory(role_arn),
+            account,
+            now,
+            keep,
+            disabler,
+            config,
+            policy,
+            exporter,
+            cursor,
+            stop,
+            directory,
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, role_arns))
+
+    return [u for users in results for u in users]
+
+
+def notify_channel(report, config):
+    """Sends the whole report to SNS_TOPIC and SLACK_URL
+
+    Parameters:
+    report (Report): Findings of the run
+    config (Config): Settings of the run
+
+    Returns:
+    None
+    """
+    titles = config.titles
+
+    # one structured message per finding instead of the text report
+    if config.sns_topic is not None and config.sns_mode == "findings":
+        LOGGER.info("Detected SNS settings, publishing a message per finding")
+        publish_findings(config.sns_topic, report)
 
     # lets assemble the SNS message
-    if os.environ.get("SNS_TOPIC", None) is not None:
+    elif config.sns_topic is not None:
         LOGGER.info("Detected SNS settings, preparing and sending message via SNS")
         send_to_slack, slack_msg = prepare_sns_message(
-            iam_users, EXP_MSG_TITLE, EXP_MSG_TEXT, STGNT_MSG_TITLE, STGNT_MSG_TEXT
+            report, *titles, debug=config.debug
         )
 
         if send_to_slack:
-            send_sns_message(os.environ["SNS_TOPIC"], slack_msg)
+            send_sns_message(config.sns_topic, slack_msg, debug=config.debug)
         else:
             LOGGER.info("Nothing to report")
 
     # lets assemble and send Slack msg
-    if os.environ.get("SLACK_URL", None) is not None:
+    if config.slack_url is not None:
         LOGGER.info(
             "Detected Slack settings, preparing and sending message via Slack API"
         )
         # lets assemble the slack message
-        send_to_slack, slack_msg = prepare_slack_message(
-            iam_users, EXP_MSG_TITLE, EXP_MSG_TEXT, STGNT_MSG_TITLE, STGNT_MSG_TEXT
-        )
-        if os.environ.get("DEBUG", False):
+        send_to_slack, slack_msg = prepare_slack_message(report, *titles)
+        if config.debug:
             print("slack message:", slack_msg)
         elif send_to_slack:
-            send_slack_message(os.environ["SLACK_URL"], slack_msg)
+            send_slack_message(resolve_parameter(config.slack_url), slack_msg)
         else:
             LOGGER.info("Nothing to report")
+
+
+def notify_owners(report, config):
+    """Sends one digest per owner, see deliver_by_owner
+
+    Digests go to the owner's webhook in OWNER_WEBHOOKS or SLACK_URL, and to
+    SNS_TOPIC, DELIVERY_WORKERS of them at once.
+
+    Parameters:
+    report (Report): Findings of the run
+    config (Config): Settings of the run
+
+    Returns:
+    dict: Delivery summary
+    """
+    from sleuth.routing import deliver_by_owner
+
+    LOGGER.info("Sending one digest per owner")
+    summary = deliver_by_owner(
+        report,
+        config.titles,
+        slack_url=resolve_parameter(config.slack_url),
+        sns_topic=config.sns_topic,
+        webhooks={
+            slack_id: resolve_parameter(url)
+            for slack_id, url in config.owner_webhooks.items()
+        },
+        workers=config.delivery_workers,
+        debug=config.debug,
+    )
+    LOGGER.info("Delivery summary: {}".format(json.dumps(summary)))
+    return summary
+
+
+def audit(accounts=None, client_factory=None, config=None, time_left=None):
+    """Audits keys and sends the notifications
+
+    With CHECKPOINT_URL set and time_left given, listing stops once less than
+    CHECKPOINT_MARGIN_SECONDS are left. The progress is saved to the
+    checkpoint and the next call resumes from it, the notifications are only
+    sent by the call that completes the run.
+
+    Parameters:
+    accounts (list): Account IDs or role ARNs to audit, defaults to
+                     AUDIT_ACCOUNTS, or only the local account if unset
+    client_factory (callable): Returns an IAM client for a role ARN
+    config (Config): Settings of the run, defaults to Config.from_env
+    time_left (callable): Milliseconds left to run, ex: the Lambda context's
+                          get_remaining_time_in_millis
+
+    Returns:
+    bool: True if the run is complete, False if it was checkpointed
+    """
+    config = config or Config.from_env()
+    run_metrics = metrics.reset()
+    start = time.perf_counter()
+
+    # values cached by an earlier invocation of this container are reused
+    cache.configure(
+        config.cache_ttl, config.cache_max_entries, config.cache_tags, config.version
+    )
+
+    checkpoint = None
+    state = None
+    if config.checkpoint_url:
+        checkpoint = Checkpoint(get_store(config.checkpoint_url))
+        state = checkpoint.load()
+
+    if state is not None:
+        LOGGER.info(
+            "Resuming run from checkpoint, invocation {}".format(
+                state["invocations"] + 1
+            )
+        )
+        # the run keeps the reference time it started with
+        now = dt.datetime.fromisoformat(state["now"])
+        cursors = state["accounts"]
+    else:
+        # one reference time for every key age in this run
+        now = dt.datetime.now(dt.timezone.utc)
+        cursors = {}
+
+    stop = None
+    if checkpoint is not None and time_left is not None:
+        margin = config.checkpoint_margin * 1000
+
+        def stop():
+            return time_left() < margin
+
+    # only users that show up in the notifications are kept, unless the full
+    # report is printed
+    keep = None if config.debug else is_flagged
+
+    # one executor for every account so the run has a single plan
+    disabler = None
+    if config.enable_auto_expire:
+        disabler = get_disable_executor(config)
+        if state is not None:
+            disabler.restore(state["disabled"])
+
+    # the full inventory is streamed out while only flagged users are kept
+    exporter = None
+    if config.export_url:
+        exporter = Exporter(config.export_url, config.export_format)
+
+    accounts = accounts if accounts is not None else config.audit_accounts
+    try:
+        if accounts:
+            iam_users = audit_accounts(
+                accounts,
+                client_factory,
+                now=now,
+                keep=keep,
+                disabler=disabler,
+                config=config,
+                exporter=exporter,
+                cursors=cursors,
+                stop=stop,
+            )
+        else:
+            iam_users = audit_account(
+                now=now,
+                keep=keep,
+                disabler=disabler,
+                config=config,
+                exporter=exporter,
+                cursor=cursors.setdefault("local", {}),
+                stop=stop,
+            )
+    except BaseException:
+        if exporter is not None:
+            exporter.abort()
+        raise
+    else:
+        if exporter is not None:
+            exporter.close()
+    finally:
+        if disabler is not None:
+            LOGGER.info("Disabled keys: {}".format(json.dumps(disabler.close())))
+            if config.disable_plan_url:
+                get_store(config.disable_plan_url).save(disabler.plan())
+
+    if state is not None:
+        iam_users = [load_user(u, now) for u in state["users"]] + iam_users
+
+    complete = all(c.get("done") for c in cursors.values())
+    if checkpoint is not None and not complete:
+        invocations = state["invocations"] + 1 if state is not None else 1
+        checkpoint.save(
+            {
+                "now": now.isoformat(),
+                "invocations": invocations,
+                "accounts": cursors,
+                "users": [dump_user(u) for u in iam_users],
+                "disabled": disabler.entries if disabler is not None else [],
+            }
+        )
+        LOGGER.info(
+            "Out of time after invocation {}, saved {} users to the checkpoint".format(
+                invocations, len(iam_users)
+            )
+        )
+    else:
+        if state is not None:
+            checkpoint.clear()
+
+        if config.debug:
+            print_key_report(iam_users)
+
+        # every notification format renders from the same report
+        with run_metrics.timer("report"):
+            report = Report(iam_users)
+
+        if config.notify_routing == "owner":
+            notify_owners(report, config)
+        else:
+            notify_channel(report, config)
+
+    LOGGER.info("AWS API usage: {}".format(json.dumps(get_api_stats())))
+    LOGGER.info("Cache usage: {}".format(json.dumps(cache.stats())))
+
+    run_metrics.add_time("run", time.perf_counter() - start)
+    metrics.publish(run_metrics, config.metrics_emf, config.metrics_namespace)
+    return complete
@@ -0,0 +1,161 @@
+import importlib.util
+import os
+
+# codes used by the numpy path, index into STATES
+STATES = ("good", "old", "stagnant", "expire", "stagnant_expire", "disabled")
+
+
+def have_numpy():
+    """True if numpy can be imported, without importing it"""
+    return importlib.util.find_spec("numpy") is not None
+
+
+def audit_batch(
+    creation_ages,
+    access_ages,
+    statuses,
+    auto_expire,
+    rotate_age,
+    expire_age,
+    max_inactivity_age,
+    inactivity_warning_age,
+    enable_auto_expire=None,
+    use_numpy=None,
+):
+    """Audits many keys at once from columns of key data
+
+    Gives the same results as auditing User/Key objects in audit_account:
+    keys of users with KeyAutoExpire=false are good and keep a valid_for of 0,
+    every other key is classified like Key.audit.
+
+    Parameters:
+    creation_ages (sequence of int): Key creation age in days
+    access_ages (sequence of int): Days since the key was last used
+    statuses (sequence of str): AWS key status, Active or Inactive
+    auto_expire (sequence of bool): False for keys of KeyAutoExpire=false users
+    rotate_age (int): Age key must be before audit_state=old
+    expire_age (int): Age key must be before audit_state=expire
+    max_inactivity_age (int): Age of last key usage must be before audit_state=stagnant_expire
+    inactivity_warning_age (int): Age of last key usage must be before audit_state=stagnant
+    enable_auto_expire (bool): Mark Inactive keys as disabled, defaults to
+                               ENABLE_AUTO_EXPIRE
+    use_numpy (bool): Force the numpy or plain python path, defaults to numpy
+                      when it is installed
+
+    Returns:
+    states: audit_state of every key
+    creation_valid_for: Days until the key expires due to creation age
+    activity_valid_for: Days until the key expires due to inactivity
+
+    The three are numpy arrays on the numpy path and lists otherwise.
+    """
+    assert rotate_age < expire_age
+    assert max_inactivity_age <= expire_age
+    assert inactivity_warning_age < max_inactivity_age
+
+    if enable_auto_expire is None:
+        enable_auto_expire = os.environ.get("ENABLE_AUTO_EXPIRE", False) == "true"
+    # numpy is optional, fall back to plain python
+    if use_numpy is None:
+        use_numpy = have_numpy()
+    if use_numpy and not have_numpy():
+        raise RuntimeError("numpy is not installed")
+
+    audit = audit_batch_numpy if use_numpy else audit_batch_python
+    return audit(
+        creation_ages,
+        access_ages,
+        statuses,
+        auto_expire,
+        rotate_age,
+        expire_age,
+        max_inactivity_age,
+        inactivity_warning_age,
+        enable_auto_expire,
+    )
+
+
+def audit_batch_python(
+    creation_ages,
+    access_ages,
+    statuses,
+    auto_expire,
+    rotate_age,
+    expire_age,
+    max_inactivity_age,
+    inactivity_warning_age,
+    enable_auto_expire,
+):
+    """Plain python path of audit_batch"""
+    states = []
+    creation_valid_for = []
+    activity_valid_for = []
+    for creation_age, access_age, status, expires in zip(
+        creation_ages, access_ages, statuses, auto_expire
+    ):
+        if not expires:
+            states.append("good")
+            creation_valid_for.append(0)
+            activity_valid_for.append(0)
+            continue
+
+        creation_valid_for.append(expire_age - creation_age)
+        activity_valid_for.append(max_inactivity_age - access_age)
+
+        if enable_auto_expire and status == "Inactive":
+            states.append("disabled")
+        elif creation_age >= expire_age:
+            states.append("expire")
+        elif access_age >= max_inactivity_age:
+            states.append("stagnant_expire")
+        elif creation_age >= rotate_age:
+            states.append("old")
+        elif access_age >= inactivity_warning_age:
+            states.append("stagnant")
+        else:
+            states.append("good")
+
+    return states, creation_valid_for, activity_valid_for
+
+
+def audit_batch_numpy(
+    creation_ages,
+    access_ages,
+    statuses,
+    auto_expire,
+    rotate_age,
+    expire_age,
+    max_inactivity_age,
+    inactivity_warning_age,
+    enable_auto_expire,
+):
+    """numpy path of audit_batch"""
+    # imported here so cold starts skip it, see bench_importtime
+    import numpy as np
+
+    creation_ages = np.asarray(creation_ages, dtype=np.int64)
+    access_ages = np.asarray(access_ages, dtype=np.int64)
+    expires = np.asarray(auto_expire, dtype=bool)
+    disabled = np.asarray(statuses) == "Inactive"
+    if not enable_auto_expire:
+        disabled = np.zeros_like(expires)
+
+    # np.select picks the first matching condition, same order as Key.audit
+    codes = np.select(
+        [
+            ~expires,
+            disabled,
+            creation_ages >= expire_age,
+            access_ages >= max_inactivity_age,
+            creation_ages >= rotate_age,
+            access_ages >= inactivity_warning_age,
+        ],
+        [0, 5, 3, 4, 1, 2],
+        default=0,
+    ).astype(np.int8)
+
+    states = np.array(STATES, dtype=object)[codes]
+    creation_valid_for = np.where(expires, expire_age - creation_ages, 0)
+    activity_valid_for = np.where(expires, max_inactivity_age - access_ages, 0)
+
+    return states, creation_valid_for, activity_valid_for
@@ -0,0 +1,166 @@
+"""Process wide caches that outlive a run in warm Lambda containers
+
+Every cache is an LRU with a time to live. The settings come from the Config
+of the run, see configure, and a run with a different Config starts with
+empty caches.
+"""
+
+import collections
+import threading
+import time
+
+# seconds entries live, 0 disables caching
+DEFAULT_TTL = 900
+DEFAULT_MAX_ENTRIES = 10000
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread safe LRU cache whose entries expire ttl seconds after being set
+
+    Parameters:
+    maxsize (int): Entries kept, the least recently used are evicted first
+    ttl (float): Seconds an entry is served, 0 or less disables the cache
+    clock (callable): Monotonic time source
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock or time.monotonic
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the live entry for key, default if missing or expired"""
+        if self.ttl <= 0:
+            return default
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Stores value for key, evicting the least recently used entries"""
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, func):
+        """Returns the entry for key, calling func to fill it when missing
+
+        Concurrent misses on the same key may each call func.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = func()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        """Drops every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns hits, misses, evictions and entries"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_caches = {}
+_settings = {"ttl": DEFAULT_TTL, "maxsize": DEFAULT_MAX_ENTRIES, "tags": False}
+_version = None
+_lock = threading.Lock()
+
+
+def _ttl(name):
+    # tags can change at any time, they are only cached when asked for
+    if name == "tags" and not _settings["tags"]:
+        return 0
+    return _settings["ttl"]
+
+
+def get_cache(name):
+    """Returns the process wide cache of a kind, ex: ssm, mentions or tags
+
+    Parameters:
+    name (str): Kind of values held
+
+    Returns:
+    TTLCache
+    """
+    with _lock:
+        if name not in _caches:
+            _caches[name] = TTLCache(_settings["maxsize"], _ttl(name))
+        return _caches[name]
+
+
+def configure(ttl=DEFAULT_TTL, maxsize=DEFAULT_MAX_ENTRIES, tags=False, version=None):
+    """Applies the settings of a run, called once at its start
+
+    Every cache is cleared when version differs from the previous run's, so
+    changed settings never see values cached under the old ones. The hit and
+    miss counters start over for the run.
+
+    Parameters:
+    ttl (float): Seconds entries live, 0 disables caching
+    maxsize (int): Entries kept per cache
+    tags (bool): Also cache user tags
+    version (str): Version of the settings, see Config.version
+    """
+    global _version
+    with _lock:
+        _settings.update(ttl=ttl, maxsize=maxsize, tags=tags)
+        invalidate = version != _version
+        _version = version
+        for name, cache in _caches.items():
+            cache.ttl = _ttl(name)
+            cache.maxsize = maxsize
+            if invalidate:
+                cache.clear()
+            cache.reset_stats()
+
+
+def clear():
+    """Drops every entry of every cache, as in a cold container"""
+    global _version
+    with _lock:
+        _version = None
+        for cache in _caches.values():
+            cache.clear()
+            cache.reset_stats()
+
+
+def stats():
+    """Returns the counters of every cache, see TTLCache.stats"""
+    with _lock:
+        return {name: cache.stats() for name, cache in sorted(_caches.items())}
@@ -0,0 +1,119 @@
+import datetime as dt
+import logging
+
+from sleuth.snapshot import format_date, parse_date
+
+LOGGER = logging.getLogger("sleuth")
+
+CHECKPOINT_VERSION = 1
+
+# a checkpoint left behind by a run that never resumed is not picked up by
+# the next scheduled run
+CHECKPOINT_MAX_AGE_HOURS = 12
+
+
+def dump_user(user):
+    """Serializes an audited user for a checkpoint
+
+    Parameters:
+    user (User): Audited user
+
+    Returns:
+    dict: JSON compatible user with its keys and their audit results
+    """
+    return {
+        "user_id": user.user_id,
+        "username": user.username,
+        "slack_id": user.slack_id,
+        "auto_expire": user.auto_expire,
+        "account": user.account,
+        "tags": user.tags,
+        "path": user.path,
+        "keys": [
+            {
+                "key_id": k.key_id,
+                "status": k.status,
+                "created": format_date(k.created),
+                "last_used": format_date(k.inactivity_age),
+                "audit_state": k.audit_state,
+                "creation_valid_for": k.creation_valid_for,
+                "activity_valid_for": k.activity_valid_for,
+            }
+            for k in user.keys
+        ],
+    }
+
+
+def load_user(data, now):
+    """Rebuilds an audited user from dump_user
+
+    Parameters:
+    data (dict): Output of dump_user
+    now (datetime): Reference time of the run the user was audited in
+
+    Returns:
+    User: User with its keys in the same audit state
+    """
+    from sleuth.auditor import Key, User
+
+    user = User(
+        data["user_id"],
+        data["username"],
+        data["slack_id"],
+        data["auto_expire"],
+        data["account"],
+        data["tags"],
+        data["path"],
+    )
+    for k in data["keys"]:
+        key = Key(
+            user.username,
+            k["key_id"],
+            k["status"],
+            parse_date(k["created"]),
+            parse_date(k["last_used"]),
+            now,
+        )
+        key.audit_state = k["audit_state"]
+        key.creation_valid_for = k["creation_valid_for"]
+        key.activity_valid_for = k["activity_valid_for"]
+        user.keys.append(key)
+    return user
+
+
+class Checkpoint:
+    """Progress of a run that ran out of time, resumed by the next invocation
+
+    The state holds the reference time of the run, a listing cursor per
+    account, the users kept so far and the disable plan entries, see audit.
+
+    Parameters:
+    store: FileStore or S3Store holding the checkpoint
+    max_age (int): Hours after which a checkpoint is ignored
+    """
+
+    def __init__(self, store, max_age=CHECKPOINT_MAX_AGE_HOURS):
+        self.store = store
+        self.max_age = max_age
+
+    def load(self):
+        """Returns the state to resume from, None to start a new run"""
+        state = self.store.load()
+        if state is None:
+            return None
+        if state.get("version") != CHECKPOINT_VERSION:
+            LOGGER.info("Ignoring checkpoint of another version")
+            return None
+        age = dt.datetime.now(dt.timezone.utc) - parse_date(state["now"])
+        if age > dt.timedelta(hours=self.max_age):
+            LOGGER.info("Ignoring checkpoint older than {}h".format(self.max_age))
+            return None
+        return state
+
+    def save(self, state):
+        """Stores the state of an unfinished run"""
+        self.store.save(dict(state, version=CHECKPOINT_VERSION))
+
+    def clear(self):
+        """Drops the state once the run is complete"""
+        self.store.save(None)
@@ -0,0 +1,230 @@
+import dataclasses
+import hashlib
+import json
+import os
+import typing
+
+COLLECTION_MODES = ("api", "credential_report", "async")
+NOTIFY_ROUTINGS = ("channel", "owner")
+SNS_MODES = ("report", "findings")
+EXPORT_FORMATS = ("jsonl", "csv", "parquet")
+TAG_SOURCES = ("user", "bulk")
+
+
+def _bool(environ, name):
+    return environ.get(name, "") == "true"
+
+
+def _int(environ, name, default, minimum=None):
+    try:
+        value = int(environ.get(name, default))
+    except ValueError:
+        raise RuntimeError("Env var {} must be a number".format(name))
+    if minimum is not None and value < minimum:
+        raise RuntimeError("Env var {} must be at least {}".format(name, minimum))
+    return value
+
+
+def _choice(environ, name, choices):
+    value = environ.get(name, choices[0])
+    if value not in choices:
+        raise RuntimeError(
+            "Env var {} must be one of {}".format(name, ", ".join(choices))
+        )
+    return value
+
+
+@dataclasses.dataclass(frozen=True)
+class Config:
+    """Settings of an audit run, parsed once from the environment
+
+    See the README for what each setting does. Runs with different settings
+    can share a process by passing their own Config.
+    """
+
+    # thresholds, in days
+    warning_age: int
+    expiration_age: int
+    inactivity_age: int
+    inactivity_warning_age: int
+    enable_auto_expire: bool = False
+    debug: bool = False
+
+    # integrations
+    slack_url: typing.Optional[str] = None
+    sns_topic: typing.Optional[str] = None
+    sns_mode: str = "report"
+    notify_routing: str = "channel"
+    owner_webhooks: dict = dataclasses.field(default_factory=dict)
+    expire_title: str = "AWS IAM Key Expiration Report"
+    expire_text: str = ""
+    inactive_title: str = "AWS IAM Key Inactivity Report"
+    inactive_text: str = ""
+
+    # concurrency
+    collection_workers: int = 1
+    account_workers: int = 8
+    disable_workers: int = 4
+    disable_retries: int = 2
+    delivery_workers: int = 8
+    async_concurrency: int = 10
+
+    # feature modes
+    collection_mode: str = "api"
+    tag_source: str = "user"
+    snapshot_url: typing.Optional[str] = None
+    snapshot_full_refresh_runs: int = 7
+    audit_accounts: tuple = ()
+    audit_role_name: str = "iam-sleuth"
+    disable_dry_run: bool = False
+    disable_plan_url: typing.Optional[str] = None
+    policy_url: typing.Optional[str] = None
+    export_url: typing.Optional[str] = None
+    export_format: str = "jsonl"
+    metrics_emf: bool = False
+    metrics_namespace: str = "IAMSleuth"
+    checkpoint_url: typing.Optional[str] = None
+    checkpoint_margin: int = 120
+    checkpoint_reinvoke: bool = False
+    cache_ttl: int = 900
+    cache_max_entries: int = 10000
+    cache_tags: bool = False
+    directory_url: typing.Optional[str] = None
+    directory_refresh_hours: int = 24
+    slack_api_token: typing.Optional[str] = None
+
+    @property
+    def audit_ages(self):
+        """Key.audit thresholds: rotate, expire, inactivity and inactivity warning age"""
+        return (
+            self.warning_age,
+            self.expiration_age,
+            self.inactivity_age,
+            self.inactivity_warning_age,
+        )
+
+    @property
+    def titles(self):
+        """Expiration title and text, inactivity title and text"""
+        return (
+            self.expire_title,
+            self.expire_text,
+            self.inactive_title,
+            self.inactive_text,
+        )
+
+    @property
+    def version(self):
+        """Digest of every setting, caches are cleared when it changes"""
+        settings = json.dumps(dataclasses.asdict(self), sort_keys=True, default=str)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Parses and validates the settings
+
+        Parameters:
+        environ (dict): Variables to read, defaults to os.environ
+
+        Returns:
+        Config
+        """
+        environ = os.environ if environ is None else environ
+
+        if "WARNING_AGE" not in environ or "EXPIRATION_AGE" not in environ:
+            raise RuntimeError("Must set env var WARNING_AGE and EXPIRATION_AGE")
+        # Check for optional env vars
+        if bool(environ.get("INACTIVITY_AGE")) != bool(
+            environ.get("INACTIVITY_WARNING_AGE")
+        ):
+            raise RuntimeError(
+                "Must set env var INACTIVITY_WARNING_AGE and INACTIVITY_AGE together"
+            )
+
+        warning_age = _int(environ, "WARNING_AGE", None)
+        expiration_age = _int(environ, "EXPIRATION_AGE", None)
+        # Do not require last used age, set to expiration age as default
+        inactivity_age = _int(environ, "INACTIVITY_AGE", expiration_age)
+        inactivity_warning_age = _int(environ, "INACTIVITY_WARNING_AGE", warning_age)
+
+        # the orderings Key.audit relies on
+        if warning_age >= expiration_age:
+            raise RuntimeError("WARNING_AGE must be lower than EXPIRATION_AGE")
+        if inactivity_age > expiration_age:
+            raise RuntimeError("INACTIVITY_AGE must not exceed EXPIRATION_AGE")
+        if inactivity_warning_age >= inactivity_age:
+            raise RuntimeError(
+                "INACTIVITY_WARNING_AGE must be lower than INACTIVITY_AGE"
+            )
+
+        owner_webhooks = json.loads(environ.get("OWNER_WEBHOOKS", "{}"))
+        if not isinstance(owner_webhooks, dict):
+            raise RuntimeError("OWNER_WEBHOOKS must be a JSON object")
+
+        accounts = environ.get("AUDIT_ACCOUNTS", "")
+
+        # the async collector builds its own client and cannot assume roles
+        if environ.get("COLLECTION_MODE") == "async" and accounts.strip():
+            raise RuntimeError(
+                "Cannot set env var AUDIT_ACCOUNTS with COLLECTION_MODE=async"
+            )
+
+        # an export is a single upload and cannot span invocations
+        if environ.get("CHECKPOINT_URL") and environ.get("EXPORT_URL"):
+            raise RuntimeError("Cannot set env var CHECKPOINT_URL with EXPORT_URL")
+
+        return cls(
+            warning_age=warning_age,
+            expiration_age=expiration_age,
+            inactivity_age=inactivity_age,
+            inactivity_warning_age=inactivity_warning_age,
+            enable_auto_expire=_bool(environ, "ENABLE_AUTO_EXPIRE"),
+            debug=bool(environ.get("DEBUG", False)),
+            slack_url=environ.get("SLACK_URL"),
+            sns_topic=environ.get("SNS_TOPIC"),
+            sns_mode=_choice(environ, "SNS_MODE", SNS_MODES),
+            notify_routing=_choice(environ, "NOTIFY_ROUTING", NOTIFY_ROUTINGS),
+            owner_webhooks=owner_webhooks,
+            expire_title=environ.get(
+                "EXPIRE_NOTIFICATION_TITLE", "AWS IAM Key Expiration Report"
+            ),
+            expire_text=environ.get("EXPIRE_NOTIFICATION_TEXT", ""),
+            inactive_title=environ.get(
+                "INACTIVE_NOTIFICATION_TITLE", "AWS IAM Key Inactivity Report"
+            ),
+            inactive_text=environ.get("INACTIVE_NOTIFICATION_TEXT", ""),
+            collection_workers=_int(environ, "COLLECTION_WORKERS", 1, minimum=1),
+            account_workers=_int(environ, "ACCOUNT_WORKERS", 8, minimum=1),
+            disable_workers=_int(environ, "DISABLE_WORKERS", 4, minimum=1),
+            disable_retries=_int(environ, "DISABLE_RETRIES", 2, minimum=0),
+            delivery_workers=_int(environ, "DELIVERY_WORKERS", 8, minimum=1),
+            async_concurrency=_int(environ, "ASYNC_CONCURRENCY", 10, minimum=1),
+            collection_mode=_choice(environ, "COLLECTION_MODE", COLLECTION_MODES),
+            tag_source=_choice(environ, "TAG_SOURCE", TAG_SOURCES),
+            snapshot_url=environ.get("SNAPSHOT_URL") or None,
+            snapshot_full_refresh_runs=_int(
+                environ, "SNAPSHOT_FULL_REFRESH_RUNS", 7, minimum=1
+            ),
+            audit_accounts=tuple(a.strip() for a in accounts.split(",") if a.strip()),
+            audit_role_name=environ.get("AUDIT_ROLE_NAME", "iam-sleuth"),
+            disable_dry_run=_bool(environ, "DISABLE_DRY_RUN"),
+            disable_plan_url=environ.get("DISABLE_PLAN_URL") or None,
+            policy_url=environ.get("POLICY_URL") or None,
+            export_url=environ.get("EXPORT_URL") or None,
+            export_format=_choice(environ, "EXPORT_FORMAT", EXPORT_FORMATS),
+            metrics_emf=_bool(environ, "METRICS_EMF"),
+            metrics_namespace=environ.get("METRICS_NAMESPACE", "IAMSleuth"),
+            checkpoint_url=environ.get("CHECKPOINT_URL") or None,
+            checkpoint_margin=_int(
+                environ, "CHECKPOINT_MARGIN_SECONDS", 120, minimum=0
+            ),
+            checkpoint_reinvoke=_bool(environ, "CHECKPOINT_REINVOKE"),
+            cache_ttl=_int(environ, "CACHE_TTL_SECONDS", 900, minimum=0),
+            cache_max_entries=_int(environ, "CACHE_MAX_ENTRIES", 10000, minimum=1),
+            cache_tags=_bool(environ, "CACHE_TAGS"),
+            directory_url=environ.get("DIRECTORY_URL") or None,
+            directory_refresh_hours=_int(
+                environ, "DIRECTORY_REFRESH_HOURS", 24, minimum=1
+            ),
+            slack_api_token=environ.get("SLACK_API_TOKEN") or None,
+        )
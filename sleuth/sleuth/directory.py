@@ -0,0 +1,235 @@
+"""Index of the Slack directory to find the Slack ID of untagged IAM users
+
+The members are paged from users.list and indexed by email and handle. The
+index is kept in a store, see get_store, so runs only page through Slack
+again once it is older than DIRECTORY_REFRESH_HOURS.
+"""
+
+import datetime as dt
+import logging
+import time
+
+from sleuth.cache import get_cache
+from sleuth.metrics import record_call
+from sleuth.services import resolve_parameter
+from sleuth.snapshot import parse_date
+from sleuth.store import get_store
+
+LOGGER = logging.getLogger("sleuth")
+
+SLACK_API_URL = "https://slack.com/api/"
+DIRECTORY_VERSION = 1
+# members per users.list page, Slack recommends no more than 200
+PAGE_SIZE = 200
+
+
+def iter_members(
+    token, session=None, api_url=None, limit=PAGE_SIZE, max_retries=5, sleep=None
+):
+    """Yields every member of the Slack workspace, following the cursors
+
+    Rate limited calls are retried after the Retry-After Slack sends.
+
+    Parameters:
+    token (str): Slack API token with the users:read and users:read.email scopes
+    session (requests.Session): Session to call the API with
+    api_url (str): Base URL of the Slack Web API, defaults to SLACK_API_URL
+    limit (int): Members per page
+    max_retries (int): Retries per page before giving up
+    sleep (callable): Used to wait before retrying
+
+    Yields:
+    dict: Member as returned by users.list
+    """
+    # imported here, the handler only needs requests when it syncs
+    import requests
+
+    from sleuth.slack import retry_after
+
+    session = session or requests.Session()
+    api_url = api_url or SLACK_API_URL
+    sleep = sleep or time.sleep
+    cursor = None
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        for attempt in range(max_retries + 1):
+            start = time.perf_counter()
+            resp = session.get(
+                api_url + "users.list",
+                params=params,
+                headers={"Authorization": "Bearer {}".format(token)},
+                timeout=30,
+            )
+            limited = resp.status_code == requests.codes.too_many_requests
+            record_call("slack_users_list", time.perf_counter() - start, error=limited)
+            if not limited or attempt >= max_retries:
+                break
+            sleep(retry_after(resp.headers, 2**attempt))
+
+        body = resp.json() if resp.status_code == requests.codes.ok else {}
+        if not body.get("ok"):
+            raise RuntimeError(
+                "Slack users.list failed: {}".format(
+                    body.get("error", resp.status_code)
+                )
+            )
+        yield from body["members"]
+
+        cursor = body.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            return
+
+
+def build_index(members, synced=None):
+    """Builds the persisted index from Slack members
+
+    Deleted members and bots are left out.
+
+    Parameters:
+    members (iterable): Members, see iter_members
+    synced (datetime): Time of the sync, defaults to now
+
+    Returns:
+    dict: version, synced, emails and handles, both lower cased and mapping
+          to Slack IDs
+    """
+    emails = {}
+    handles = {}
+    for m in members:
+        if m.get("deleted") or m.get("is_bot") or m["id"] == "USLACKBOT":
+            continue
+        profile = m.get("profile", {})
+        if profile.get("email"):
+            emails[profile["email"].lower()] = m["id"]
+        for handle in (m.get("name"), profile.get("display_name_normalized")):
+            if handle:
+                handles.setdefault(handle.lower(), m["id"])
+
+    synced = synced or dt.datetime.now(dt.timezone.utc)
+    return {
+        "version": DIRECTORY_VERSION,
+        "synced": synced.isoformat(),
+        "emails": emails,
+        "handles": handles,
+    }
+
+
+class Directory:
+    """Resolves IAM usernames to Slack IDs with dict lookups
+
+    A username is looked up as an email, then as a handle, then as the local
+    part of an email. Local parts shared by several emails are ambiguous and
+    left out.
+
+    Parameters:
+    index (dict): See build_index
+    """
+
+    def __init__(self, index):
+        self.synced = parse_date(index["synced"])
+        self.emails = index["emails"]
+        self.handles = index["handles"]
+        self.local_parts = {}
+        ambiguous = set()
+        for email, slack_id in self.emails.items():
+            local = email.split("@", 1)[0]
+            if local in self.local_parts and self.local_parts[local] != slack_id:
+                ambiguous.add(local)
+            self.local_parts[local] = slack_id
+        for local in ambiguous:
+            del self.local_parts[local]
+
+    def __len__(self):
+        return len(self.emails)
+
+    def resolve(self, username):
+        """Returns the Slack ID of an IAM username, None if it is not found"""
+        name = username.lower()
+        return (
+            self.emails.get(name)
+            or self.handles.get(name)
+            or self.local_parts.get(name)
+        )
+
+    def fill(self, user):
+        """Sets the Slack ID of a user whose Slack tag fell back to its username
+
+        The tags are left alone, they are saved in snapshots and a guess from
+        the directory must not pass for a real tag on later runs.
+
+        Parameters:
+        user (User): Collected user, see apply_tag_defaults
+
+        Returns:
+        bool: True if the Slack ID was found
+        """
+        if user.slack_id != user.username:
+            return False
+        slack_id = self.resolve(user.username)
+        if slack_id is None:
+            return False
+        user.slack_id = slack_id
+        return True
+
+
+def sync_directory(token, store, session=None, api_url=None):
+    """Pages through the Slack directory and saves its index
+
+    Parameters:
+    token (str): Slack API token, see iter_members
+    store: FileStore or S3Store to save the index to
+    session (requests.Session): Session to call the API with
+    api_url (str): Base URL of the Slack Web API, defaults to SLACK_API_URL
+
+    Returns:
+    Directory
+    """
+    index = build_index(iter_members(token, session, api_url))
+    store.save(index)
+    LOGGER.info(
+        "Synced Slack directory: {} emails, {} handles".format(
+            len(index["emails"]), len(index["handles"])
+        )
+    )
+    return Directory(index)
+
+
+def load_directory(config, session=None):
+    """Loads the index at DIRECTORY_URL, syncing it first when it is stale
+
+    With SLACK_API_TOKEN set, a missing index or one older than
+    DIRECTORY_REFRESH_HOURS is synced again. The result is cached, see
+    sleuth.cache, so accounts and warm invocations share it.
+
+    Parameters:
+    config (Config): Settings of the run
+    session (requests.Session): Session to call the Slack API with
+
+    Returns:
+    Directory: None if DIRECTORY_URL is unset, or there is no index and no
+               token to build one
+    """
+    if not config.directory_url:
+        return None
+
+    def load():
+        store = get_store(config.directory_url)
+        index = store.load()
+        if index is not None and index.get("version") != DIRECTORY_VERSION:
+            index = None
+        directory = Directory(index) if index is not None else None
+
+        token = resolve_parameter(config.slack_api_token)
+        max_age = dt.timedelta(hours=config.directory_refresh_hours)
+        if token and (
+            directory is None
+            or dt.datetime.now(dt.timezone.utc) - directory.synced > max_age
+        ):
+            directory = sync_directory(token, store, session)
+        if directory is None:
+            LOGGER.warning("No Slack directory at {}".format(config.directory_url))
+        return directory
+
+    return get_cache("directory").get_or_set(config.directory_url, load)
@@ -0,0 +1,167 @@
+import collections
+import datetime as dt
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from sleuth.services import disable_key
+
+LOGGER = logging.getLogger("sleuth")
+
+
+class DisableExecutor:
+    """Plans and applies disabling of expired keys
+
+    Every submitted key is added to the plan. Unless this is a dry run, keys
+    are disabled right away by a bounded pool of worker threads, so disabling
+    overlaps with the rest of the audit. Keys that are already Inactive, or
+    were submitted before, are skipped, which makes re-running a plan safe.
+
+    Each plan entry ends up with one result:
+    planned: dry run, nothing was changed
+    disabled: the key was disabled
+    skipped: the key was already Inactive or no longer exists
+    failed: disabling still failed after the retries, see error
+
+    Parameters:
+    workers (int): Keys disabled at once
+    dry_run (bool): Only build the plan
+    retries (int): Retries per key for errors the client did not retry itself
+    retry_delay (float): Seconds before the first retry, doubled every retry
+    sleep (callable): Used to wait between retries
+    debug (bool): Log every disabled key
+    """
+
+    def __init__(
+        self,
+        workers=4,
+        dry_run=False,
+        retries=2,
+        retry_delay=1.0,
+        sleep=None,
+        debug=False,
+    ):
+        self.dry_run = dry_run
+        self.debug = debug
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.sleep = sleep or time.sleep
+        self.entries = []
+        self._seen = set()
+        self._futures = []
+        self._lock = threading.Lock()
+        self._pool = None if dry_run else ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, key, username, iam=None, account=None):
+        """Adds a key to the plan and starts disabling it
+
+        Parameters:
+        key (Key): Key to disable
+        username (str): Owner of the key
+        iam: IAM client of the account the key belongs to
+        account (str): Account the key belongs to, None for the local account
+
+        Returns:
+        dict: Plan entry, its result is set once the key has been handled
+        """
+        entry = {
+            "account": account,
+            "username": username,
+            "key_id": key.key_id,
+            "created": key.created.isoformat(),
+            "audit_state": key.audit_state,
+            "result": None,
+            "error": None,
+        }
+        with self._lock:
+            ident = (account, username, key.key_id or entry["created"])
+            if ident in self._seen:
+                return entry
+            self._seen.add(ident)
+            self.entries.append(entry)
+
+        if key.status == "Inactive":
+            entry["result"] = "skipped"
+        elif self.dry_run:
+            entry["result"] = "planned"
+        else:
+            self._futures.append(self._pool.submit(self._apply, entry, key, iam))
+        return entry
+
+    def restore(self, entries):
+        """Adds the entries of an earlier plan, e.g. from a checkpoint
+
+        Their keys are skipped if submitted again.
+
+        Parameters:
+        entries (list): Plan entries, see plan
+        """
+        with self._lock:
+            for entry in entries:
+                ident = (
+                    entry["account"],
+                    entry["username"],
+                    entry["key_id"] or entry["created"],
+                )
+                if ident not in self._seen:
+                    self._seen.add(ident)
+                    self.entries.append(entry)
+
+    def _apply(self, entry, key, iam):
+        for attempt in range(self.retries + 1):
+            try:
+                found = disable_key(key, entry["username"], iam, self.debug)
+            except (BotoCoreError, ClientError) as e:
+                if attempt >= self.retries:
+                    LOGGER.error(
+                        "Failed to disable key of {}: {}".format(entry["username"], e)
+                    )
+                    entry["result"] = "failed"
+                    entry["error"] = str(e)
+                    return
+                self.sleep(self.retry_delay * 2**attempt)
+            else:
+                entry["key_id"] = key.key_id
+                if found:
+                    key.status = "Inactive"
+                    entry["result"] = "disabled"
+                else:
+                    entry["result"] = "skipped"
+                    entry["error"] = "access key not found"
+                return
+
+    def close(self):
+        """Waits for every key to be handled
+
+        Returns:
+        dict: Number of keys per result
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        for f in self._futures:
+            f.result()
+        return self.summary()
+
+    def summary(self):
+        """Returns the number of keys per result"""
+        counts = collections.Counter(e["result"] for e in self.entries)
+        return {
+            result: counts[result]
+            for result in ("planned", "disabled", "skipped", "failed")
+        }
+
+    def plan(self):
+        """Returns the plan with the result of every key
+
+        Returns:
+        dict: dry_run flag, generation time, summary and the key entries
+        """
+        return {
+            "dry_run": self.dry_run,
+            "generated": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "summary": self.summary(),
+            "keys": self.entries,
+        }
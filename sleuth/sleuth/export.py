@@ -0,0 +1,293 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import threading
+
+from sleuth.config import EXPORT_FORMATS
+from sleuth.store import parse_s3_url, s3_client
+
+LOGGER = logging.getLogger("sleuth")
+
+FIELDS = (
+    "account",
+    "user_id",
+    "username",
+    "path",
+    "slack_id",
+    "auto_expire",
+    "key_id",
+    "status",
+    "created",
+    "last_used",
+    "creation_age",
+    "access_age",
+    "audit_state",
+    "creation_valid_for",
+    "activity_valid_for",
+)
+
+# S3 needs at least 5 MiB in every part but the last
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def format_date(date):
+    return date.isoformat() if date is not None else None
+
+
+def user_rows(user):
+    """Export rows of a user, one per key or a single one without key fields
+
+    Parameters:
+    user (User): Audited user
+
+    Yields:
+    dict: Values of FIELDS
+    """
+    base = {
+        "account": user.account,
+        "user_id": user.user_id,
+        "username": user.username,
+        "path": user.path,
+        "slack_id": user.slack_id,
+        "auto_expire": user.auto_expire,
+    }
+    if not user.keys:
+        yield dict(base, **{field: None for field in FIELDS[len(base) :]})
+    for k in user.keys:
+        yield dict(
+            base,
+            key_id=k.key_id,
+            status=k.status,
+            created=format_date(k.created),
+            last_used=format_date(k.inactivity_age),
+            creation_age=k.creation_age,
+            access_age=k.access_age,
+            audit_state=k.audit_state,
+            creation_valid_for=k.creation_valid_for,
+            activity_valid_for=k.activity_valid_for,
+        )
+
+
+class MultipartUpload(io.RawIOBase):
+    """Binary file that uploads to S3 in parts as it is written
+
+    At most one part is buffered, so memory use does not grow with the size
+    of the object. The upload is completed on close and aborted by abort.
+
+    Parameters:
+    bucket (str): Bucket name
+    key (str): Object key
+    client: S3 client, defaults to one from s3_client
+    part_size (int): Bytes per part, at least MIN_PART_SIZE
+    content_type (str): Content type of the object
+    """
+
+    def __init__(
+        self, bucket, key, client=None, part_size=MIN_PART_SIZE, content_type=None
+    ):
+        self.bucket = bucket
+        self.key = key
+        self.client = client or s3_client()
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.parts = []
+        self.size = 0
+        self._buffer = bytearray()
+
+        kwargs = {"ContentType": content_type} if content_type else {}
+        resp = self.client.create_multipart_upload(Bucket=bucket, Key=key, **kwargs)
+        self.upload_id = resp["UploadId"]
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.size
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._upload(bytes(self._buffer[: self.part_size]))
+            del self._buffer[: self.part_size]
+        return len(data)
+
+    def _upload(self, body):
+        number = len(self.parts) + 1
+        resp = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=number,
+            Body=body,
+        )
+        self.parts.append({"ETag": resp["ETag"], "PartNumber": number})
+
+    def close(self):
+        if self.closed:
+            return
+        # the last part may be smaller, and an empty object still needs one
+        if self._buffer or not self.parts:
+            self._upload(bytes(self._buffer))
+            self._buffer = bytearray()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        super().close()
+
+    def abort(self):
+        """Drops the parts uploaded so far"""
+        if self.closed:
+            return
+        self.client.abort_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+        )
+        self._buffer = bytearray()
+        super().close()
+
+
+class JSONLWriter:
+    """Writes rows as JSON lines"""
+
+    def __init__(self, stream):
+        self.text = io.TextIOWrapper(stream, encoding="utf-8", newline="\n")
+
+    def write(self, row):
+        self.text.write(json.dumps(row, separators=(",", ":")))
+        self.text.write("\n")
+
+    def close(self):
+        self.text.close()
+
+
+class CSVWriter:
+    """Writes rows as CSV with a header line"""
+
+    def __init__(self, stream):
+        self.text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.text, FIELDS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.text.close()
+
+
+class ParquetWriter:
+    """Writes rows as Parquet, one row group every row_group_size rows
+
+    Requires pyarrow.
+    """
+
+    def __init__(self, stream, row_group_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("EXPORT_FORMAT=parquet needs pyarrow installed")
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema(
+            [
+                (
+                    field,
+                    pyarrow.int64()
+                    if field.endswith("_age") or field.endswith("_valid_for")
+                    else pyarrow.string(),
+                )
+                for field in FIELDS
+            ]
+        )
+        self.stream = stream
+        self.writer = pyarrow.parquet.ParquetWriter(stream, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(
+                self.pa.Table.from_pylist(self.rows, schema=self.schema)
+            )
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.stream.close()
+
+
+WRITERS = {"jsonl": JSONLWriter, "csv": CSVWriter, "parquet": ParquetWriter}
+
+
+class Exporter:
+    """Streams the audited users and keys to a file or S3 as they are audited
+
+    Rows are written through to the destination, so memory use does not
+    depend on the number of keys. URLs ending in .gz are gzip compressed,
+    Parquet uses its own compression. Safe to use from several threads.
+
+    Parameters:
+    url (str): File path or s3://bucket/key
+    fmt (str): One of EXPORT_FORMATS
+    client: S3 client for s3:// URLs, defaults to one from s3_client
+    """
+
+    def __init__(self, url, fmt="jsonl", client=None):
+        if fmt not in WRITERS:
+            raise RuntimeError(
+                "Export format must be one of {}".format(", ".join(EXPORT_FORMATS))
+            )
+        self.url = url
+        self.rows = 0
+        self._lock = threading.Lock()
+
+        if url.startswith("s3://"):
+            bucket, key = parse_s3_url(url)
+            self.sink = MultipartUpload(bucket, key, client)
+        else:
+            self.sink = open(url, "wb")
+
+        stream = self.sink
+        if url.endswith(".gz") and fmt != "parquet":
+            stream = gzip.GzipFile(fileobj=self.sink, mode="wb")
+        self._stream = stream
+        self.writer = WRITERS[fmt](stream)
+
+    def write_user(self, user):
+        """Writes the rows of an audited user, see user_rows"""
+        with self._lock:
+            for row in user_rows(user):
+                self.writer.write(row)
+                self.rows += 1
+
+    def close(self):
+        """Finishes the export
+
+        Returns:
+        int: Rows written
+        """
+        with self._lock:
+            self.writer.close()
+            if self._stream is not self.sink:
+                self.sink.close()
+        LOGGER.info("Exported {} rows to {}".format(self.rows, self.url))
+        return self.rows
+
+    def abort(self):
+        """Drops a partial S3 upload, a partial file is left as is"""
+        with self._lock:
+            if isinstance(self.sink, MultipartUpload):
+                self.sink.abort()
+            else:
+                self.sink.close()
@@ -0,0 +1,259 @@
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger("sleuth")
+
+# upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# stage the time and calls of an API operation are counted towards
+OPERATION_STAGES = {
+    "list_users": "list",
+    "assume_role": "list",
+    "get_account_authorization_details": "list",
+    "list_user_tags": "tags",
+    "slack_users_list": "tags",
+    "list_access_keys": "keys",
+    "get_access_key_last_used": "keys",
+    "generate_credential_report": "keys",
+    "get_credential_report": "keys",
+    "update_access_key": "disable",
+    "publish": "notify",
+    "publish_batch": "notify",
+    "slack_post": "notify",
+}
+
+
+class Histogram:
+    """Counts observations per LATENCY_BUCKETS_MS bucket, the last one is +Inf"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q
+
+        Returns:
+        int: Bound in milliseconds, "+Inf" for the last bucket and None
+             without observations
+        """
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                break
+        return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else "+Inf"
+
+    def buckets(self):
+        labels = [str(b) for b in LATENCY_BUCKETS_MS] + ["+Inf"]
+        return dict(zip(labels, self.counts))
+
+
+class Metrics:
+    """Stage timers, API call counters and latency histograms of a run
+
+    API calls are recorded by the clients, see RateLimitedClient, and counted
+    towards the stage in OPERATION_STAGES. Their stage time is the time spent
+    in calls summed over every thread, so it can exceed the wall time when
+    calls run in parallel. Everything else is timed with timer.
+
+    Safe to use from several threads.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.operations = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"seconds": 0.0, "count": 0}
+        entry["seconds"] += seconds
+        entry["count"] += 1
+
+    def add_time(self, stage, seconds):
+        """Adds a timed block to a stage"""
+        with self._lock:
+            self._stage(stage, seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Times the block as part of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def record_call(self, operation, seconds, error=False):
+        """Records an API call
+
+        Parameters:
+        operation (str): API operation, ex: list_user_tags
+        seconds (float): Time the call took
+        error (bool): The call failed, including throttles that are retried
+        """
+        with self._lock:
+            entry = self.operations.get(operation)
+            if entry is None:
+                entry = self.operations[operation] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "histogram": Histogram(),
+                }
+            entry["calls"] += 1
+            entry["errors"] += error
+            entry["seconds"] += seconds
+            entry["histogram"].observe(seconds * 1000)
+            self._stage(OPERATION_STAGES.get(operation, "other"), seconds)
+
+    def summary(self):
+        """Totals of the run
+
+        Returns:
+        dict: stages with seconds and count, operations with calls, errors,
+              seconds, p50_ms, p99_ms and the latency histogram
+        """
+        with self._lock:
+            return {
+                "stages": {
+                    name: {"seconds": round(s["seconds"], 3), "count": s["count"]}
+                    for name, s in sorted(self.stages.items())
+                },
+                "operations": {
+                    name: {
+                        "calls": o["calls"],
+                        "errors": o["errors"],
+                        "seconds": round(o["seconds"], 3),
+                        "p50_ms": o["histogram"].quantile(0.5),
+                        "p99_ms": o["histogram"].quantile(0.99),
+                        "histogram": o["histogram"].buckets(),
+                    }
+                    for name, o in sorted(self.operations.items())
+                },
+            }
+
+    def emf(self, namespace, timestamp=None):
+        """The summary in CloudWatch Embedded Metric Format
+
+        Parameters:
+        namespace (str): CloudWatch namespace of the metrics
+        timestamp (float): Seconds since the epoch, defaults to now
+
+        Returns:
+        list (dict): One document per stage and per operation
+        """
+        timestamp = int((timestamp or time.time()) * 1000)
+        summary = self.summary()
+
+        def document(dimension, value, metrics):
+            return dict(
+                {
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": namespace,
+                                "Dimensions": [[dimension]],
+                                "Metrics": [
+                                    {"Name": name, "Unit": unit}
+                                    for name, (unit, _) in metrics.items()
+                                ],
+                            }
+                        ],
+                    },
+                    dimension: value,
+                },
+                **{name: v for name, (_, v) in metrics.items()},
+            )
+
+        documents = []
+        for name, s in summary["stages"].items():
+            documents.append(
+                document(
+                    "Stage",
+                    name,
+                    {
+                        "Duration": ("Milliseconds", round(s["seconds"] * 1000, 1)),
+                        "Count": ("Count", s["count"]),
+                    },
+                )
+            )
+        for name, o in summary["operations"].items():
+            metrics = {
+                "Calls": ("Count", o["calls"]),
+                "Errors": ("Count", o["errors"]),
+            }
+            # EMF values must be numbers
+            for quantile in ("p50_ms", "p99_ms"):
+                if isinstance(o[quantile], int):
+                    metrics["Latency" + quantile[:3].upper()] = (
+                        "Milliseconds",
+                        o[quantile],
+                    )
+            documents.append(document("Operation", name, metrics))
+        return documents
+
+
+_current = Metrics()
+
+
+def current():
+    """Metrics of the run in progress"""
+    return _current
+
+
+def reset():
+    """Starts collecting the metrics of a new run
+
+    Returns:
+    Metrics
+    """
+    global _current
+    _current = Metrics()
+    return _current
+
+
+def record_call(operation, seconds, error=False):
+    """Records an API call in the metrics of the run, see Metrics.record_call"""
+    _current.record_call(operation, seconds, error)
+
+
+def timer(stage):
+    """Times a block in the metrics of the run, see Metrics.timer"""
+    return _current.timer(stage)
+
+
+def publish(metrics, emf=False, namespace="IAMSleuth"):
+    """Logs the summary as one record, and prints EMF documents when enabled
+
+    Lambda ships stdout to CloudWatch Logs, which extracts metrics from the
+    EMF documents.
+
+    Parameters:
+    metrics (Metrics): Metrics of the run
+    emf (bool): Also print the metrics in Embedded Metric Format
+    namespace (str): CloudWatch namespace for EMF
+
+    Returns:
+    dict: The summary
+    """
+    summary = metrics.summary()
+    LOGGER.info("Run metrics", extra={"metrics": summary})
+    if emf:
+        for document in metrics.emf(namespace):
+            print(json.dumps(document, separators=(",", ":")))
+    return summary
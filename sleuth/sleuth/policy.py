@@ -0,0 +1,221 @@
+import dataclasses
+import hashlib
+import json
+import logging
+import re
+import typing
+
+from sleuth.store import get_store
+
+LOGGER = logging.getLogger("sleuth")
+
+AGE_FIELDS = (
+    "warning_age",
+    "expiration_age",
+    "inactivity_age",
+    "inactivity_warning_age",
+)
+MATCH_FIELDS = ("tag", "path", "username")
+
+
+@dataclasses.dataclass(frozen=True)
+class Policy:
+    """Thresholds the keys of a user are audited with
+
+    Parameters:
+    name (str): Rule the policy came from, default for the global thresholds
+    ages (tuple): Rotate, expire, inactivity and inactivity warning age, see
+                  Key.audit
+    auto_expire (bool): False never audits the keys, like KeyAutoExpire=false.
+                        True audits them even if KeyAutoExpire=false. None
+                        follows the KeyAutoExpire tag
+    """
+
+    name: str
+    ages: tuple
+    auto_expire: typing.Optional[bool] = None
+
+
+def glob_pattern(glob):
+    """Regex for a username glob, * matches any run of characters and ? one"""
+    return "".join(
+        ".*" if c == "*" else "." if c == "?" else re.escape(c) for c in glob
+    )
+
+
+def compile_policy(rule, default):
+    """Turns a rule into a Policy, unset thresholds come from default
+
+    Parameters:
+    rule (dict): Policy rule, see PolicyIndex
+    default (Policy): Global thresholds
+
+    Returns:
+    Policy
+    """
+    name = rule.get("name", "unnamed")
+    ages = tuple(
+        int(rule.get(field, age)) for field, age in zip(AGE_FIELDS, default.ages)
+    )
+    rotate, expire, inactivity, inactivity_warn = ages
+    if not (rotate < expire and inactivity <= expire and inactivity_warn < inactivity):
+        raise RuntimeError(
+            "Policy rule {} needs warning_age < expiration_age and "
+            "inactivity_warning_age < inactivity_age <= expiration_age".format(name)
+        )
+
+    auto_expire = rule.get("auto_expire")
+    if auto_expire is not None and not isinstance(auto_expire, bool):
+        raise RuntimeError("Policy rule {} auto_expire must be a boolean".format(name))
+
+    return Policy(name, ages, auto_expire)
+
+
+class PolicyIndex:
+    """Resolves the Policy of a user from an ordered list of rules
+
+    Every rule matches on exactly one of:
+    tag: {"Key": "Value"}, a user tag
+    path: "/service/", a prefix of the IAM path, must start and end with "/"
+    username: "svc-*", a glob, or an exact name
+
+    The first matching rule wins, users matching none get the default.
+
+    Rules are compiled into an index once: tags and exact names are looked up
+    in dicts, path prefixes by walking the segments of the user's path, and
+    globs are grouped by the literal text before their first wildcard so only
+    the globs sharing a prefix with the username are tried. Resolving a user
+    does not depend on the number of rules.
+
+    Parameters:
+    rules (list): Rules in priority order
+    default (Policy): Policy for users no rule matches
+    """
+
+    def __init__(self, rules, default):
+        self.default = default
+        self.rules = rules
+        self.policies = []
+        self._tags = {}
+        self._paths = {}
+        self._names = {}
+        self._globs = {}
+
+        for i, rule in enumerate(rules):
+            self.policies.append(compile_policy(rule, default))
+
+            matches = [field for field in MATCH_FIELDS if field in rule]
+            if len(matches) != 1:
+                raise RuntimeError(
+                    "Policy rule {} must match on one of {}".format(
+                        rule.get("name", i), ", ".join(MATCH_FIELDS)
+                    )
+                )
+
+            value = rule[matches[0]]
+            if matches[0] == "tag":
+                if not isinstance(value, dict) or len(value) != 1:
+                    raise RuntimeError(
+                        "Policy rule {} tag must be a single Key: Value".format(
+                            rule.get("name", i)
+                        )
+                    )
+                # earlier rules win, do not let a later duplicate replace them
+                self._tags.setdefault(next(iter(value.items())), i)
+            elif matches[0] == "path":
+                if not value.startswith("/") or not value.endswith("/"):
+                    raise RuntimeError(
+                        "Policy rule {} path must start and end with /".format(
+                            rule.get("name", i)
+                        )
+                    )
+                self._paths.setdefault(value, i)
+            elif "*" in value or "?" in value:
+                prefix = re.split(r"[*?]", value, 1)[0]
+                self._globs.setdefault(prefix, []).append(
+                    (i, re.compile(glob_pattern(value) + r"\Z"))
+                )
+            else:
+                self._names.setdefault(value, i)
+
+        self._prefix_lengths = sorted({len(prefix) for prefix in self._globs})
+
+    def __len__(self):
+        return len(self.policies)
+
+    @property
+    def version(self):
+        """Digest of the rules and default thresholds"""
+        rules = json.dumps([self.default.ages, self.rules], sort_keys=True, default=str)
+        return hashlib.sha256(rules.encode("utf-8")).hexdigest()[:16]
+
+    def match(self, user):
+        """Index of the first rule matching the user, None if no rule does
+
+        Parameters:
+        user (User): User with tags and path
+
+        Returns:
+        int
+        """
+        best = self._names.get(user.username)
+
+        for item in user.tags.items():
+            i = self._tags.get(item)
+            if i is not None and (best is None or i < best):
+                best = i
+
+        # every prefix of /a/b/ that ends in a /: /, /a/ and /a/b/
+        path = user.path or "/"
+        end = path.find("/")
+        while end != -1:
+            i = self._paths.get(path[: end + 1])
+            if i is not None and (best is None or i < best):
+                best = i
+            end = path.find("/", end + 1)
+
+        for length in self._prefix_lengths:
+            for i, pattern in self._globs.get(user.username[:length], ()):
+                if best is not None and i > best:
+                    break
+                if pattern.match(user.username):
+                    best = i
+                    break
+
+        return best
+
+    def resolve(self, user):
+        """Policy of the user
+
+        Parameters:
+        user (User): User with tags and path
+
+        Returns:
+        Policy
+        """
+        if not self.policies:
+            return self.default
+        i = self.match(user)
+        return self.default if i is None else self.policies[i]
+
+
+def load_policy(config):
+    """Builds the PolicyIndex of a run from the rules at POLICY_URL
+
+    Parameters:
+    config (Config): Settings of the run, supplies the default thresholds
+
+    Returns:
+    PolicyIndex: Without rules if POLICY_URL is not set
+    """
+    default = Policy("default", config.audit_ages)
+    if not config.policy_url:
+        return PolicyIndex([], default)
+
+    document = get_store(config.policy_url).load()
+    if document is None:
+        raise RuntimeError("No policy rules found at {}".format(config.policy_url))
+
+    index = PolicyIndex(document.get("rules", []), default)
+    LOGGER.info("Loaded {} policy rules".format(len(index)))
+    return index
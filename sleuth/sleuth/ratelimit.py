@@ -0,0 +1,214 @@
+import logging
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+from sleuth.metrics import record_call
+
+LOGGER = logging.getLogger("sleuth")
+
+THROTTLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+
+TRANSIENT_ERROR_CODES = {
+    "InternalError",
+    "InternalFailure",
+    "RequestTimeout",
+    "RequestTimeoutException",
+    "ServiceUnavailable",
+}
+
+# client methods that are not API calls and should not be rate limited
+NON_API_METHODS = {
+    "can_paginate",
+    "close",
+    "generate_presigned_url",
+    "get_paginator",
+    "get_waiter",
+}
+
+
+class TokenBucket:
+    """Thread safe token bucket with an adaptive refill rate
+
+    The rate is halved every time the API throttles us and recovers additively
+    on every successful call until it is back at max_rate.
+
+    Parameters:
+    max_rate (float): Calls per second allowed when nothing is throttled
+    burst (float): Tokens that can be spent at once, defaults to max_rate
+    min_rate (float): Floor for the rate after repeated throttles
+    clock (callable): Monotonic time source
+    sleep (callable): Used to wait for tokens
+    """
+
+    def __init__(
+        self,
+        max_rate,
+        burst=None,
+        min_rate=0.5,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate = self.max_rate
+        self.capacity = float(burst or max_rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self):
+        """Spends a token, blocking until the bucket has refilled enough
+
+        The token is reserved up front so concurrent callers queue up behind
+        each other instead of racing for the same refill.
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            self.sleep(wait)
+
+    def throttled(self):
+        """Backs off after the API returned a throttling error"""
+        with self._lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        """Slowly recovers the rate after a successful call"""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RateLimitedClient:
+    """Wraps a boto3 client with a token bucket per API and retries
+
+    Throttling and transient errors are retried with jittered exponential
+    backoff, throttles also slow down the bucket of the API that was
+    throttled. Everything else is passed through untouched. Every attempt is
+    recorded in the run metrics, see sleuth.metrics.
+
+    Parameters:
+    client: boto3 client, or anything with the same method names
+    rate (float): Max calls per second for each API
+    burst (float): Burst size for each API, defaults to rate
+    max_retries (int): Retries per call before the error is raised
+    base_delay (float): Backoff for the first retry in seconds
+    max_delay (float): Backoff cap in seconds
+    clock (callable): Monotonic time source for the buckets
+    sleep (callable): Used for backoff and waiting for tokens
+    """
+
+    def __init__(
+        self,
+        client,
+        rate=20,
+        burst=None,
+        max_retries=8,
+        base_delay=0.2,
+        max_delay=20,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self._client = client
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith("_") or name in NON_API_METHODS or not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return self._call(name, attr, *args, **kwargs)
+
+        return call
+
+    def _bucket(self, operation):
+        with self._lock:
+            if operation not in self._buckets:
+                self._buckets[operation] = TokenBucket(
+                    self.rate, self.burst, clock=self.clock, sleep=self.sleep
+                )
+                self._stats[operation] = {"calls": 0, "retries": 0, "throttles": 0}
+            return self._buckets[operation]
+
+    def _count(self, operation, counter):
+        with self._lock:
+            self._stats[operation][counter] += 1
+
+    def _call(self, operation, method, *args, **kwargs):
+        bucket = self._bucket(operation)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            self._count(operation, "calls")
+            start = time.perf_counter()
+            try:
+                resp = method(*args, **kwargs)
+            except ClientError as e:
+                record_call(operation, time.perf_counter() - start, error=True)
+                code = e.response.get("Error", {}).get("Code")
+                if code in THROTTLE_ERROR_CODES:
+                    self._count(operation, "throttles")
+                    bucket.throttled()
+                elif code not in TRANSIENT_ERROR_CODES:
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+            except (ConnectionError, HTTPClientError):
+                record_call(operation, time.perf_counter() - start, error=True)
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                record_call(operation, time.perf_counter() - start)
+                bucket.succeeded()
+                return resp
+
+            attempt += 1
+            self._count(operation, "retries")
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            LOGGER.debug("Retrying {} in {:.2f}s".format(operation, delay))
+            self.sleep(random.uniform(delay / 2, delay))
+
+    def stats(self):
+        """Returns calls, retries and throttles counted per API
+
+        Returns:
+        dict: API name to dict of counters
+        """
+        with self._lock:
+            return {op: dict(counters) for op, counters in self._stats.items()}
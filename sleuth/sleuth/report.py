@@ -0,0 +1,99 @@
+# audit states that are reported in the notifications
+NOTIFY_STATES = ("old", "stagnant", "expire", "stagnant_expire")
+
+# message line of each state, formatted with the user and the days left
+LINE_FORMATS = {
+    "old": "{}'s key expires in {} days due to creation age.",
+    "stagnant": "{}'s key expires in {} days due to inactivity.",
+    "expire": "{}'s key is disabled due to creation age.",
+    "stagnant_expire": "{}'s key is disabled due to inactivity.",
+}
+
+
+class Report:
+    """Keys that show up in the notifications, grouped by audit state
+
+    Users are classified once, every notification format renders from the
+    report instead of going over the users again.
+
+    Parameters:
+    users (iterable): Audited users to add, see add
+    """
+
+    def __init__(self, users=()):
+        self.findings = {state: [] for state in NOTIFY_STATES}
+        self._ordered = []
+        self.extend(users)
+
+    def add(self, user):
+        """Adds the keys of an audited user that need a notification
+
+        Parameters:
+        user (User): Audited user
+        """
+        self.extend((user,))
+
+    def extend(self, users):
+        """Adds the keys of several audited users, see add"""
+        findings = self.findings
+        ordered = self._ordered
+        for user in users:
+            for k in user.keys:
+                found = findings.get(k.audit_state)
+                if found is not None:
+                    found.append((user, k))
+                    ordered.append((user, k))
+
+    def by_owner(self):
+        """Splits the report into one report per owner
+
+        Returns:
+        dict: User.slack_id to Report, in the order owners were first added
+        """
+        owners = {}
+        for user, k in self._ordered:
+            owner = owners.get(user.slack_id)
+            if owner is None:
+                owner = owners[user.slack_id] = Report()
+            owner.findings[k.audit_state].append((user, k))
+            owner._ordered.append((user, k))
+        return owners
+
+    def __bool__(self):
+        return len(self._ordered) > 0
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def items(self, *states):
+        """Returns (user, key) pairs of the given states in the order they were added
+
+        Parameters:
+        states (str): Audit states to include
+
+        Returns:
+        list (tuple): User and key
+        """
+        if len(states) == 1:
+            return self.findings[states[0]]
+        return [(u, k) for u, k in self._ordered if k.audit_state in states]
+
+    def lines(self, format_user, *states):
+        """Renders the message lines of the given states
+
+        Parameters:
+        format_user (callable): Formats the user a line is about
+        states (str): Audit states to include, lines keep the order they
+                      were added in
+
+        Returns:
+        list (str): Message lines
+        """
+        lines = []
+        for user, key in self.items(*states):
+            if key.audit_state == "stagnant":
+                days = key.activity_valid_for
+            else:
+                days = key.creation_valid_for
+            lines.append(LINE_FORMATS[key.audit_state].format(format_user(user), days))
+        return lines
@@ -0,0 +1,118 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from sleuth.report import NOTIFY_STATES
+from sleuth.services import (
+    format_slack_id,
+    format_username,
+    prepare_slack_message,
+    prepare_sns_message,
+    send_sns_message,
+)
+from sleuth.slack import SlackWebhook
+
+LOGGER = logging.getLogger("sleuth")
+
+
+def prepare_owner_digest(slack_id, report, titles):
+    """Prepares the Slack message for the findings of one owner
+
+    The owner is mentioned once at the top instead of on every line.
+
+    Parameters:
+    slack_id (str): Slack tag of the owner
+    report (Report): Findings of the owner, see Report.by_owner
+    titles (tuple): Expiration title and text, inactivity title and text
+
+    Returns:
+    dict: Message prepared for slack API
+    """
+    _, msg = prepare_slack_message(report, *titles, format_user=format_username)
+    user, _ = report.items(*NOTIFY_STATES)[0]
+    msg["text"] = "{}, IAM access keys that need your attention: {}".format(
+        format_slack_id(slack_id, user.username), len(report)
+    )
+    return msg
+
+
+def deliver_by_owner(
+    report,
+    titles,
+    slack_url=None,
+    sns_topic=None,
+    webhooks=None,
+    workers=8,
+    webhook_factory=None,
+    debug=None,
+):
+    """Sends one digest per owner, several owners at once
+
+    An owner's digest goes to its webhook in webhooks, or to slack_url when it
+    has none. With an SNS topic every digest is also published with a slack_id
+    message attribute, so subscriptions can filter on the owner. An owner
+    whose delivery raises is logged and counted as failed, the others are
+    still delivered.
+
+    Parameters:
+    report (Report): Findings to deliver
+    titles (tuple): Expiration title and text, inactivity title and text
+    slack_url (str): Fallback Slack webhook
+    sns_topic (str): SNS topic ARN
+    webhooks (dict): Slack ID to webhook URL, see Config.owner_webhooks
+    workers (int): Digests delivered at once
+    webhook_factory (callable): Builds a SlackWebhook from a URL and session
+    debug (bool): Print SNS messages instead of publishing them, defaults to
+                  DEBUG
+
+    Returns:
+    dict: Number of owners and of digests delivered, failed and unrouted
+    """
+    webhooks = webhooks or {}
+    webhook_factory = webhook_factory or SlackWebhook
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    owners = report.by_owner()
+    summary = {"owners": len(owners), "delivered": 0, "failed": 0, "unrouted": 0}
+    lock = threading.Lock()
+
+    def count(result):
+        with lock:
+            summary[result] += 1
+
+    def deliver(slack_id, owner_report):
+        try:
+            send(slack_id, owner_report)
+        except Exception as e:
+            LOGGER.error("Delivering findings of {} failed: {}".format(slack_id, e))
+            count("failed")
+
+    def send(slack_id, owner_report):
+        url = webhooks.get(slack_id, slack_url)
+        if url is None and sns_topic is None:
+            LOGGER.warning("No destination for findings of {}".format(slack_id))
+            count("unrouted")
+            return
+
+        if url is not None:
+            msg = prepare_owner_digest(slack_id, owner_report, titles)
+            ok = webhook_factory(url, session=session).send(msg)
+            count("delivered" if ok else "failed")
+        if sns_topic is not None:
+            _, msg = prepare_sns_message(owner_report, *titles, debug=debug)
+            ok = send_sns_message(
+                sns_topic, msg, {"slack_id": slack_id or ""}, debug=debug
+            )
+            count("delivered" if ok else "failed")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for f in [pool.submit(deliver, *owner) for owner in owners.items()]:
+            f.result()
+
+    return summary
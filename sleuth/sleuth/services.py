@@ -1,63 +1,171 @@
+import csv
+import datetime as dt
+import io
 import json
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-import requests
+from botocore.config import Config
 
-IAM = boto3.client("iam")
-SSM = boto3.client("ssm")
-SNS = boto3.client("sns")
+from sleuth.cache import get_cache
+from sleuth.ratelimit import RateLimitedClient
+from sleuth.report import Report
 
 LOGGER = logging.getLogger("sleuth")
 
+
+def create_client(service_name, **kwargs):
+    """Creates a rate limited boto3 client
+
+    botocore retries are turned off so throttles surface to the rate limiter,
+    which backs off per API and retries on its own.
+
+    Parameters:
+    service_name (str): AWS service, ex: iam
+    kwargs: Passed through to boto3.client, ex: credentials
+
+    Returns:
+    RateLimitedClient: Client limited to API_RATE_LIMIT calls per second per API
+    """
+    client = boto3.client(
+        service_name,
+        config=Config(retries={"total_max_attempts": 1}),
+        **kwargs,
+    )
+    return RateLimitedClient(
+        client,
+        rate=float(os.environ.get("API_RATE_LIMIT", 20)),
+        max_retries=int(os.environ.get("API_MAX_RETRIES", 8)),
+    )
+
+
+# module level clients, built on first use so integrations that are not
+# configured cost nothing at cold start
+CLIENT_NAMES = {"IAM": "iam", "SSM": "ssm", "SNS": "sns"}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """Returns the module client of a service, building it on first use
+
+    A client assigned to the module attribute, ex: services.IAM = client,
+    takes precedence.
+
+    Parameters:
+    service_name (str): iam, ssm or sns
+
+    Returns:
+    RateLimitedClient: Client shared by the whole run
+    """
+    override = globals().get(service_name.upper())
+    if override is not None:
+        return override
+    with _clients_lock:
+        if service_name not in _clients:
+            _clients[service_name] = create_client(service_name)
+        return _clients[service_name]
+
+
+def __getattr__(name):
+    if name in CLIENT_NAMES:
+        return get_client(CLIENT_NAMES[name])
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# seconds between credential report generation polls and max polls before giving up
+CREDENTIAL_REPORT_POLL_INTERVAL = 2
+CREDENTIAL_REPORT_MAX_POLLS = 30
+# report rows whose tags are fetched together
+CREDENTIAL_REPORT_BATCH_SIZE = 100
+
 ###################
 # AWS
 ###################
 
 
-def get_iam_key_info(user):
+def list_access_keys(username, iam=None):
+    """Lists the access keys of a user
+
+    Parameters:
+    username (str): User to list keys for
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    list (dict): AccessKeyMetadata entries
+    """
+    return (iam or get_client("iam")).list_access_keys(UserName=username)[
+        "AccessKeyMetadata"
+    ]
+
+
+def get_key_last_used(key_id, created, iam=None):
+    """Fetches when a key was last used
+
+    Parameters:
+    key_id (str): Access key ID
+    created (datetime): Key creation date, returned if the key was never used
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    datetime: Last used date
+    """
+    access_date = (iam or get_client("iam")).get_access_key_last_used(
+        AccessKeyId=key_id
+    )
+    return access_date["AccessKeyLastUsed"].get("LastUsedDate", created)
+
+
+def get_iam_key_info(user, iam=None, key_info=None, now=None):
     """Fetches User key info
 
     Parameters:
     user (str): user to fetch key info for
+    iam: IAM client to use, defaults to the module client
+    key_info (list): AccessKeyMetadata entries when already listed
+    now (datetime): Reference time of the audit run, see Key
 
     Returns:
     list (Key): Return list of keys for a single user
     """
     from sleuth.auditor import Key
 
+    if key_info is None:
+        key_info = list_access_keys(user.username, iam)
+
     keys = []
-    key_info = IAM.list_access_keys(UserName=user.username)
-    for k in key_info["AccessKeyMetadata"]:
-        access_date = IAM.get_access_key_last_used(AccessKeyId=k["AccessKeyId"])
+    for k in key_info:
         keys.append(
             Key(
                 k["UserName"],
                 k["AccessKeyId"],
                 k["Status"],
                 k["CreateDate"],
-                access_date["AccessKeyLastUsed"]["LastUsedDate"]
-                if "LastUsedDate" in access_date["AccessKeyLastUsed"]
-                else k["CreateDate"],
+                get_key_last_used(k["AccessKeyId"], k["CreateDate"], iam),
+                now,
             )
         )
 
     return keys
 
 
-def get_user_tag(username):
+def get_user_tag(username, iam=None):
     """Fetches User Tags
 
     A helper function to unpack the API response in a python friendly way
 
     Parameters:
     username (str): Username of the user to fetch tags for
+    iam: IAM client to use, defaults to the module client
 
     Returns:
     dict: key val of the tags
     """
-    resp = IAM.list_user_tags(UserName=username)
+    resp = (iam or get_client("iam")).list_user_tags(UserName=username)
 
     tags = {}
     for t in resp["Tags"]:
@@ -66,9 +174,68 @@ def get_user_tag(username):
     return tags
 
 
+def get_user_tag_defaults(username, iam=None):
+    """Fetches User Tags and fills in the ones sleuth relies on
+
+    Parameters:
+    username (str): Username of the user to fetch tags for
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    dict: key val of the tags, always containing Slack and KeyAutoExpire
+    """
+    return apply_tag_defaults(username, get_user_tag(username, iam))
+
+
+def get_entry_tag_defaults(u, iam=None):
+    """Tags of a user entry with the ones sleuth relies on filled in
+
+    Tags carried by the entry, ex: from list_user_details_pages, are used as
+    is. Otherwise they are fetched with list_user_tags, and cached by ARN,
+    which is unique across accounts, when CACHE_TAGS is set.
+
+    Parameters:
+    u (dict): User entry with a UserName and optionally Tags
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    dict: key val of the tags, always containing Slack and KeyAutoExpire
+    """
+    if "Tags" not in u:
+        if "Arn" not in u:
+            return get_user_tag_defaults(u["UserName"], iam)
+        tags = get_cache("tags").get_or_set(
+            u["Arn"], lambda: get_user_tag(u["UserName"], iam)
+        )
+        return apply_tag_defaults(u["UserName"], dict(tags))
+    return apply_tag_defaults(u["UserName"], {t["Key"]: t["Value"] for t in u["Tags"]})
+
+
+def apply_tag_defaults(username, tags):
+    """Fills in the tags sleuth relies on, see get_user_tag_defaults
+
+    Parameters:
+    username (str): Owner of the tags
+    tags (dict): key val of the user's tags, updated in place
+
+    Returns:
+    dict: The tags, always containing Slack and KeyAutoExpire
+    """
+    if "Slack" not in tags:
+        LOGGER.info("IAM User: {} is missing Slack tag!".format(username))
+        # since no slack id, lets fill in the username so at least we know the account
+        tags["Slack"] = username
+    if "KeyAutoExpire" not in tags:
+        tags["KeyAutoExpire"] = "True"
+
+    return tags
+
+
 def format_slack_id(slackid, display_name=None):
     """Helper function that formats the slack message to mention a user or group id such as Infra etc
 
+    Mentions are cached, see sleuth.cache and _format_slack_id.
+
     Parameters:
     slackid (str): User unique id, starts with a 'U', or group unique id starts with a 'subteam'
                    If slackid isn't recognized as user or team ID will return slackid itself as last ditch effort
@@ -78,7 +245,13 @@ def format_slack_id(slackid, display_name=None):
     Returns:
     str: The user or team id in a slack mention, example: <@U12345> or <!subteam^T1234>
     """
+    return get_cache("mentions").get_or_set(
+        (slackid, display_name), lambda: _format_slack_id(slackid, display_name)
+    )
+
 
+def _format_slack_id(slackid, display_name=None):
+    """Formats a mention without the cache, see format_slack_id"""
     if slackid is None or len(slackid) == 0:
         LOGGER.warning("Slack ID is None, which it should not be")
         return "UNKNOWN"
@@ -101,78 +274,521 @@ def format_slack_id(slackid, display_name=None):
         return slackid
 
 
-def get_iam_users():
+def get_collection_workers():
+    """Number of threads used to enrich users, from COLLECTION_WORKERS (default 1)"""
+    workers = int(os.environ.get("COLLECTION_WORKERS", 1))
+    if workers < 1:
+        raise RuntimeError("COLLECTION_WORKERS must be at least 1")
+    return workers
+
+
+def get_iam_user(u, iam=None, now=None):
+    """Builds a User with tags and key info from a list_users entry
+
+    Parameters:
+    u (dict): User entry from the list_users API
+    iam: IAM client to use, defaults to the module client
+    now (datetime): Reference time of the audit run, see Key
+
+    Returns:
+    User: User and related access key info
+    """
+    from sleuth.auditor import User
+
+    tags = get_entry_tag_defaults(u, iam)
+    user = User(
+        u["UserId"],
+        u["UserName"],
+        tags["Slack"],
+        tags["KeyAutoExpire"],
+        tags=tags,
+        path=u.get("Path", "/"),
+    )
+    user.keys = get_iam_key_info(user, iam, now=now)
+
+    return user
+
+
+def list_users_pages(marker=None, iam=None):
+    """Yields list_users pages
+
+    The Marker is followed by hand instead of through a boto3 paginator so
+    every page goes through the rate limited client.
+
+    Parameters:
+    marker (str): Marker to resume listing from
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    generator (dict): list_users responses
+    """
+    iam = iam or get_client("iam")
+    while True:
+        resp = iam.list_users(Marker=marker) if marker else iam.list_users()
+        yield resp
+        if not resp.get("IsTruncated"):
+            return
+        marker = resp["Marker"]
+
+
+# fields of a get_account_authorization_details user kept for the audit
+USER_DETAIL_FIELDS = ("UserName", "UserId", "Path", "Arn", "CreateDate", "Tags")
+USER_DETAILS_PAGE_SIZE = 1000
+
+
+def user_details_page(resp):
+    """Reshapes a get_account_authorization_details response like list_users
+
+    Only USER_DETAIL_FIELDS are kept, the policies and groups are dropped.
+    Users without tags come without a Tags entry.
+
+    Parameters:
+    resp (dict): get_account_authorization_details response
+
+    Returns:
+    dict: Users, IsTruncated and Marker
+    """
+    page = {
+        "Users": [
+            {f: u[f] for f in USER_DETAIL_FIELDS if f in u}
+            for u in resp["UserDetailList"]
+        ],
+        "IsTruncated": resp.get("IsTruncated", False),
+    }
+    if page["IsTruncated"]:
+        page["Marker"] = resp["Marker"]
+    return page
+
+
+def list_user_details_pages(marker=None, iam=None):
+    """Yields users together with their tags, see user_details_page
+
+    get_account_authorization_details returns up to USER_DETAILS_PAGE_SIZE
+    users with their tags per call, which replaces a list_user_tags call per
+    user with tags.
+
+    Parameters:
+    marker (str): Marker to resume listing from
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    generator (dict): Pages shaped like list_users responses
+    """
+    iam = iam or get_client("iam")
+    while True:
+        kwargs = {"Filter": ["User"], "MaxItems": USER_DETAILS_PAGE_SIZE}
+        if marker:
+            kwargs["Marker"] = marker
+        page = user_details_page(iam.get_account_authorization_details(**kwargs))
+        yield page
+        if not page["IsTruncated"]:
+            return
+        marker = page["Marker"]
+
+
+def get_user_tags_bulk(iam=None):
+    """Fetches the tags of every user with tags, see list_user_details_pages
+
+    Parameters:
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    dict: Username to its Tags entries, users without tags are left out
+    """
+    return {
+        u["UserName"]: u["Tags"]
+        for page in list_user_details_pages(iam=iam)
+        for u in page["Users"]
+        if "Tags" in u
+    }
+
+
+def get_api_stats():
+    """Returns the calls, retries and throttles counted by the AWS clients
+
+    Returns:
+    dict: service name to per API counters
+    """
+    clients = dict(_clients)
+    for attr, name in CLIENT_NAMES.items():
+        if globals().get(attr) is not None:
+            clients[name] = globals()[attr]
+    return {
+        name: client.stats()
+        for name, client in clients.items()
+        if isinstance(client, RateLimitedClient)
+    }
+
+
+def iter_iam_users(
+    workers=None,
+    iam=None,
+    build_user=None,
+    now=None,
+    cursor=None,
+    stop=None,
+    list_pages=None,
+):
+    """Yields IAM users WITH key info as they are collected
+
+    Each page of users is enriched by a pool of worker threads while the
+    previous page is handed to the caller, so at most two pages of users are
+    held at once and the first user is available before the listing is done.
+    Users are yielded in list_users order regardless of the worker count.
+
+    Listing can be stopped between pages and resumed later from the cursor.
+
+    Parameters:
+    workers (int): Enrichment threads, defaults to COLLECTION_WORKERS
+    iam: IAM client to use, defaults to the module client
+    build_user (callable): Builds a User from a list_users entry, the IAM
+                           client and now, defaults to get_iam_user
+    now (datetime): Reference time of the audit run, see Key
+    cursor (dict): Listing starts from its marker. Once the users are
+                   yielded, marker is where listing resumes and done is True
+                   if every user was listed
+    stop (callable): Checked after every page, True stops listing
+    list_pages (callable): Yields list_users shaped pages from a marker and
+                           the IAM client, defaults to list_users_pages. See
+                           list_user_details_pages
+
+    Yields:
+    User: User and related access key info
+    """
+    build_user = build_user or get_iam_user
+    list_pages = list_pages or list_users_pages
+    cursor = cursor if cursor is not None else {}
+    with ThreadPoolExecutor(max_workers=workers or get_collection_workers()) as pool:
+        pending = []
+        marker = cursor.get("marker")
+        for resp in list_pages(marker, iam):
+            futures = [pool.submit(build_user, u, iam, now) for u in resp["Users"]]
+            for f in pending:
+                yield f.result()
+            pending = futures
+            marker = resp["Marker"] if resp.get("IsTruncated") else None
+            if marker is not None and stop is not None and stop():
+                break
+
+        for f in pending:
+            yield f.result()
+        cursor["marker"] = marker
+        cursor["done"] = marker is None
+
+
+def get_iam_users(workers=None, iam=None, build_user=None, now=None, list_pages=None):
     """Fetches IAM users WITH key info
 
     Parameters:
-    None
+    See iter_iam_users
 
     Returns:
     list (User): User and related access key info
     """
-    from sleuth.auditor import User
+    return list(iter_iam_users(workers, iam, build_user, now, list_pages=list_pages))
 
-    pag = IAM.get_paginator("list_users")
-    iter = pag.paginate()
-
-    users = []
-    for resp in iter:
-        for u in resp["Users"]:
-            tags = get_user_tag(u["UserName"])
-            if "Slack" not in tags:
-                LOGGER.info("IAM User: {} is missing Slack tag!".format(u["UserName"]))
-                # since no slack id, lets fill in the username so at least we know the account
-                tags["Slack"] = u["UserName"]
-            if "KeyAutoExpire" not in tags:
-                tags["KeyAutoExpire"] = "True"
-            user = User(
-                u["UserId"], u["UserName"], tags["Slack"], tags["KeyAutoExpire"]
-            )
-            user.keys = get_iam_key_info(user)
-            users.append(user)
 
-    return users
+def get_credential_report(iam=None):
+    """Generates and fetches the IAM credential report
+
+    Note the report is cached by AWS for up to 4 hours, so key state can lag
+    behind the per key API calls by that much.
+
+    Parameters:
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    bytes: CSV content of the credential report
+    """
+    iam = iam or get_client("iam")
+    for _ in range(CREDENTIAL_REPORT_MAX_POLLS):
+        if iam.generate_credential_report()["State"] == "COMPLETE":
+            return iam.get_credential_report()["Content"]
+        time.sleep(CREDENTIAL_REPORT_POLL_INTERVAL)
+
+    raise RuntimeError("Timed out waiting for the IAM credential report")
+
+
+def parse_report_date(value):
+    """Parses a credential report date, returns None for N/A style values"""
+    if value in ("N/A", "no_information", "not_supported", ""):
+        return None
+    return dt.datetime.fromisoformat(value)
+
+
+def arn_path(arn):
+    """IAM path of a user ARN, arn:aws:iam::1:user/a/b/name has path /a/b/"""
+    name = arn.split(":user", 1)[-1]
+    return name[: name.rfind("/") + 1] or "/"
+
+
+def iter_iam_users_from_credential_report(workers=None, iam=None, now=None, tags=None):
+    """Yields IAM users WITH key info from the credential report
+
+    Key creation date, last used date and status are read from a single
+    credential report instead of one list_access_keys call per user and one
+    get_access_key_last_used call per key. Tags still need a call per user,
+    they are fetched for a batch of CREDENTIAL_REPORT_BATCH_SIZE rows while
+    the previous batch is handed to the caller.
+
+    The report does not include access key IDs, so keys are returned with
+    key_id=None and resolved by disable_key only when they need disabling.
+
+    Parameters:
+    workers (int): Tag fetching threads, defaults to COLLECTION_WORKERS
+    iam: IAM client to use, defaults to the module client
+    now (datetime): Reference time of the audit run, see Key
+    tags (dict): Tags entries per username, see get_user_tags_bulk. Only
+                 users missing from it are asked for their tags
+
+    Yields:
+    User: User and related access key info
+    """
+    from sleuth.auditor import Key, User
+
+    content = io.TextIOWrapper(io.BytesIO(get_credential_report(iam)), encoding="utf-8")
+    tags = tags if tags is not None else {}
+
+    def finish(batch):
+        for user, f in batch:
+            user.tags = f.result()
+            user.slack_id = user.tags["Slack"]
+            user.auto_expire = user.tags["KeyAutoExpire"]
+            yield user
+
+    with ThreadPoolExecutor(max_workers=workers or get_collection_workers()) as pool:
+        pending = []
+        batch = []
+        for row in csv.DictReader(content):
+            if row["user"] == "<root_account>":
+                continue
+
+            user = User(None, row["user"], path=arn_path(row["arn"]))
+            for n in (1, 2):
+                prefix = "access_key_{}_".format(n)
+                created = parse_report_date(row[prefix + "last_rotated"])
+                if created is None:
+                    continue
+                last_used = parse_report_date(row[prefix + "last_used_date"])
+                user.keys.append(
+                    Key(
+                        row["user"],
+                        None,
+                        "Active" if row[prefix + "active"] == "true" else "Inactive",
+                        created,
+                        last_used if last_used is not None else created,
+                        now,
+                    )
+                )
+            entry = {"UserName": row["user"], "Arn": row["arn"]}
+            if row["user"] in tags:
+                entry["Tags"] = tags[row["user"]]
+            batch.append((user, pool.submit(get_entry_tag_defaults, entry, iam)))
+
+            if len(batch) >= CREDENTIAL_REPORT_BATCH_SIZE:
+                yield from finish(pending)
+                pending, batch = batch, []
 
+        yield from finish(pending)
+        yield from finish(batch)
 
-def disable_key(key, username):
+
+def get_iam_users_from_credential_report(workers=None, iam=None, now=None, tags=None):
+    """Fetches IAM users WITH key info from the credential report
+
+    Parameters:
+    See iter_iam_users_from_credential_report
+
+    Returns:
+    list (User): User and related access key info
+    """
+    return list(iter_iam_users_from_credential_report(workers, iam, now, tags))
+
+
+def resolve_key_id(key, iam=None):
+    """Looks up the access key ID of a key that was built without one
+
+    Keys are matched on creation date, which the credential report reports
+    as the key's last rotated date.
+
+    Parameters:
+    key (Key): Key with key_id=None
+    iam: IAM client to use, defaults to the module client
+
+    Returns:
+    str: Access key ID, None if no key matches
+    """
+    for k in list_access_keys(key.username, iam):
+        if k["CreateDate"].replace(microsecond=0) == key.created.replace(microsecond=0):
+            return k["AccessKeyId"]
+
+    return None
+
+
+def disable_key(key, username, iam=None, debug=None):
     """Disables an AWS access key
 
     Parameters:
     user (str): User ID of key to disable
     key (str): Key ID to disable
+    iam: IAM client to use, defaults to the module client
+    debug (bool): Log the disabled key, defaults to DEBUG
 
     Returns:
-    None
+    bool: False if the key could not be found
     """
-    if os.environ.get("DEBUG", False):
+    if key.key_id is None:
+        key.key_id = resolve_key_id(key, iam)
+        if key.key_id is None:
+            LOGGER.error("Could not find access key to disable for {}".format(username))
+            return False
+
+    if debug is None:
+        debug = bool(os.environ.get("DEBUG", False))
+    if debug:
         LOGGER.info("Disabling key {} for User {}".format(key.key_id, username))
-    IAM.update_access_key(
+    (iam or get_client("iam")).update_access_key(
         UserName=key.username, AccessKeyId=key.key_id, Status="Inactive"
     )
+    return True
+
+
+def get_account_role_arn(account, role_name=None):
+    """Turns an AUDIT_ACCOUNTS entry into a role ARN
+
+    Parameters:
+    account (str): Role ARN, or account ID to combine with role_name
+    role_name (str): Role to assume in the account, defaults to AUDIT_ROLE_NAME
+
+    Returns:
+    str: Role ARN to assume
+    """
+    if account.startswith("arn:"):
+        return account
+    if role_name is None:
+        role_name = os.environ.get("AUDIT_ROLE_NAME", "iam-sleuth")
+    return "arn:aws:iam::{}:role/{}".format(account, role_name)
+
+
+def assume_role_client(role_arn, sts=None, client_factory=None):
+    """Assumes a role and returns an IAM client for the target account
+
+    Parameters:
+    role_arn (str): Role to assume
+    sts: STS client, one is created when not given
+    client_factory (callable): Builds the IAM client, defaults to create_client
+
+    Returns:
+    IAM client using the assumed role credentials
+    """
+    sts = sts or create_client("sts")
+    creds = sts.assume_role(RoleArn=role_arn, RoleSessionName="iam-sleuth")[
+        "Credentials"
+    ]
+    return (client_factory or create_client)(
+        "iam",
+        aws_access_key_id=creds["AccessKeyId"],
+        aws_secret_access_key=creds["SecretAccessKey"],
+        aws_session_token=creds["SessionToken"],
+    )
+
+
+def format_username(user):
+    """Username to show in reports, with the account when auditing several
+
+    Parameters:
+    user (User): User to format
+
+    Returns:
+    str: username, or username (account)
+    """
+    if user.account is None:
+        return user.username
+    return "{} ({})".format(user.username, user.account)
+
+
+def format_slack_user(user):
+    """Slack mention for a user, with the account when auditing several
+
+    Parameters:
+    user (User): User to mention
+
+    Returns:
+    str: Slack mention, see format_slack_id
+    """
+    mention = format_slack_id(user.slack_id, user.username)
+    if user.account is None:
+        return mention
+    return "{} ({})".format(mention, user.account)
 
 
 def get_ssm_value(ssm_path):
     """Get SSM Parameter value
 
+    Values are cached, warm invocations do not ask SSM again, see sleuth.cache.
+
     Parameters:
     ssm_path (str): Path of the parameter to return
 
     Returns:
     str: Value of parameter
     """
-    resp = SSM.get_parameter(Name=ssm_path, WithDecryption=True)
-    return resp["Parameter"]["Value"]
 
+    def fetch():
+        resp = get_client("ssm").get_parameter(Name=ssm_path, WithDecryption=True)
+        return resp["Parameter"]["Value"]
+
+    return get_cache("ssm").get_or_set(ssm_path, fetch)
+
+
+# settings starting with it name an SSM parameter holding the value
+SSM_PREFIX = "ssm:"
+
+
+def resolve_parameter(value):
+    """Reads a setting of the form ssm:/path from SSM
+
+    Parameters:
+    value (str): Setting, ex: a webhook URL or ssm:/sleuth/slack_url
+
+    Returns:
+    str: The parameter's value, other settings are returned as is
+    """
+    if value is None or not value.startswith(SSM_PREFIX):
+        return value
+    return get_ssm_value(value[len(SSM_PREFIX) :])
+
+
+def send_sns_message(topic_arn, payload, attributes=None, debug=None):
+    """Send SNS message
 
-def send_sns_message(topic_arn, payload):
-    """Send SNS message"""
+    Parameters:
+    topic_arn (str): Topic to publish to
+    payload: Message, sent JSON encoded
+    attributes (dict): String message attributes, ex: for subscription
+                       filter policies
+    debug (bool): Print the message, defaults to DEBUG
+
+    Returns:
+    bool: True if the message was published
+    """
 
-    if os.environ.get("DEBUG", False):
+    if debug is None:
+        debug = bool(os.environ.get("DEBUG", False))
+    if debug:
         print(payload)
 
-    payload = json.dumps(payload)
+    kwargs = {
+        "TopicArn": topic_arn,
+        "Message": json.dumps(payload),
+        "Subject": "IAM Sleuth Bot",
+    }
+    if attributes:
+        kwargs["MessageAttributes"] = {
+            k: {"DataType": "String", "StringValue": v} for k, v in attributes.items()
+        }
 
-    resp = SNS.publish(TopicArn=topic_arn, Message=payload, Subject="IAM Sleuth Bot")
+    resp = get_client("sns").publish(**kwargs)
 
     if "MessageId" in resp:
         LOGGER.info(
@@ -180,65 +796,53 @@ def send_sns_message(topic_arn, payload):
                 topic_arn,
             )
         )
-    else:
-        LOGGER.error("Message could NOT be sent {}".format(topic_arn))
+        return True
+    LOGGER.error("Message could NOT be sent {}".format(topic_arn))
+    return False
 
 
 ###################
 # Slack
 ###################
 def send_slack_message(webhook, payload):
-    LOGGER.info("Calling webhook: {}".format(webhook[0:15]))
+    """Sends a message to a Slack webhook, split up if it is too large
 
-    resp = requests.post(
-        webhook, data=json.dumps(payload), headers={"Content-Type": "application/json"}
-    )
+    Parameters:
+    webhook (str): Incoming webhook URL
+    payload (dict): Message, see prepare_slack_message
+
+    Returns:
+    bool: True if Slack accepted every part of the message
+    """
+    from sleuth.slack import SlackWebhook
 
-    if resp.status_code == requests.codes.ok:
+    LOGGER.info("Calling webhook: {}".format(webhook[0:15]))
+
+    if SlackWebhook(webhook).send(payload):
         LOGGER.info("Successfully posted to slack")
-    else:
-        msg = "Unsuccessfully posted to slack, response {}, {}".format(
-            resp.status_code, resp.text
-        )
-        LOGGER.error(msg)
+        return True
+    return False
 
 
-def prepare_sns_message(users, exp_title, exp_addltext, stgn_title, stgn_addltext):
+def prepare_sns_message(
+    users, exp_title, exp_addltext, stgn_title, stgn_addltext, debug=None
+):
     """Prepares message for sending via SNS topic (plain text)
 
     Parameters:
-    users (list): Users with slack and key info attached to user object
+    users (list or Report): Users with slack and key info attached to user
+                            object, or a Report built from them
     title (str): Title of the message
     addltext (str): Additional text such as further instructions etc
+    debug (bool): Print the message, defaults to DEBUG
 
     Returns:
     bool: True if slack send, false if not
     dict: Message prepared for slack API
     """
-    exp_msgs = []
-    stgnt_msgs = []
-    for u in users:
-        for k in u.keys:
-            if k.audit_state == "old":
-                exp_msgs.append(
-                    "{}'s key expires in {} days due to creation age.".format(
-                        u.username, k.creation_valid_for
-                    )
-                )
-            elif k.audit_state == "stagnant":
-                stgnt_msgs.append(
-                    "{}'s key expires in {} days due to inactivity.".format(
-                        u.username, k.activity_valid_for
-                    )
-                )
-            elif k.audit_state == "expire":
-                exp_msgs.append(
-                    "{}'s key is disabled due to creation age.".format(u.username)
-                )
-            elif k.audit_state == "stagnant_expire":
-                stgnt_msgs.append(
-                    "{}'s key is disabled due to inactivity.".format(u.username)
-                )
+    report = users if isinstance(users, Report) else Report(users)
+    exp_msgs = report.lines(format_username, "old", "expire")
+    stgnt_msgs = report.lines(format_username, "stagnant", "stagnant_expire")
 
     msg = ""
     # Only send titles/messages if there are users
@@ -251,55 +855,42 @@ def prepare_sns_message(users, exp_title, exp_addltext, stgn_title, stgn_addltex
     if len(msg) > 0:
         send_to_slack = True
 
-    if os.environ.get("DEBUG", False):
+    if debug is None:
+        debug = bool(os.environ.get("DEBUG", False))
+    if debug:
         print(msg)
 
     return send_to_slack, msg
 
 
-def prepare_slack_message(users, exp_title, exp_addltext, stgn_title, stgn_addltext):
+def prepare_slack_message(
+    users,
+    exp_title,
+    exp_addltext,
+    stgn_title,
+    stgn_addltext,
+    format_user=format_slack_user,
+):
     """Prepares message for sending via Slack webhook
 
     Parameters:
-    users (list): Users with slack and key info attached to user object
+    users (list or Report): Users with slack and key info attached to user
+                            object, or a Report built from them
     title (str): Title of the message
     addltext (str): Additional text such as further instructions etc
+    format_user (callable): Formats the user of each line, defaults to a
+                            Slack mention
 
     Returns:
     bool: True if slack send, false if not
     dict: Message prepared for slack API
     """
 
-    old_msgs = []
-    stagnant_msgs = []
-    expired_msgs = []
-    stagnant_expired_msgs = []
-    for u in users:
-        for k in u.keys:
-            if k.audit_state == "old":
-                old_msgs.append(
-                    "{}'s key expires in {} days due to creation age.".format(
-                        format_slack_id(u.slack_id, u.username), k.creation_valid_for
-                    )
-                )
-            elif k.audit_state == "stagnant":
-                stagnant_msgs.append(
-                    "{}'s key expires in {} days due to inactivity.".format(
-                        format_slack_id(u.slack_id, u.username), k.activity_valid_for
-                    )
-                )
-            elif k.audit_state == "expire":
-                expired_msgs.append(
-                    "{}'s key is disabled due to creation age.".format(
-                        format_slack_id(u.slack_id, u.username)
-                    )
-                )
-            elif k.audit_state == "stagnant_expire":
-                stagnant_expired_msgs.append(
-                    "{}'s key is disabled due to inactivity.".format(
-                        format_slack_id(u.slack_id, u.username)
-                    )
-                )
+    report = users if isinstance(users, Report) else Report(users)
+    old_msgs = report.lines(format_user, "old")
+    stagnant_msgs = report.lines(format_user, "stagnant")
+    expired_msgs = report.lines(format_user, "expire")
+    stagnant_expired_msgs = report.lines(format_user, "stagnant_expire")
 
     old_attachment = {
         "title": "IAM users with access keys expiring due to creation age",
@@ -0,0 +1,213 @@
+import json
+import logging
+import time
+
+import requests
+
+from sleuth.metrics import record_call
+
+LOGGER = logging.getLogger("sleuth")
+
+# Slack truncates long attachment fields and rejects large payloads, stay
+# well below its limits
+MAX_FIELD_LENGTH = 3000
+MAX_ATTACHMENTS = 20
+MAX_MESSAGE_BYTES = 30000
+
+
+def split_lines(text, max_length):
+    """Splits text on line breaks into chunks of at most max_length
+
+    Lines longer than max_length are cut.
+
+    Parameters:
+    text (str): Text to split
+    max_length (int): Max characters per chunk
+
+    Returns:
+    list (str): Chunks in order
+    """
+    chunks = []
+    current = []
+    size = 0
+    for line in text.split("\n"):
+        line = line[:max_length]
+        if current and size + 1 + len(line) > max_length:
+            chunks.append("\n".join(current))
+            current = []
+            size = 0
+        size += len(line) + (1 if current else 0)
+        current.append(line)
+    chunks.append("\n".join(current))
+    return chunks
+
+
+def split_attachment(attachment, max_field_length=MAX_FIELD_LENGTH):
+    """Splits an attachment whose fields are too long into several
+
+    Parameters:
+    attachment (dict): Slack attachment
+    max_field_length (int): Max characters per field value
+
+    Returns:
+    list (dict): Attachments in order, the ones after the first are titled
+                 as continued
+    """
+    fields = attachment.get("fields", [])
+    if all(len(f.get("value", "")) <= max_field_length for f in fields):
+        return [attachment]
+
+    parts = []
+    for field in fields:
+        for chunk in split_lines(field.get("value", ""), max_field_length):
+            part = dict(attachment, fields=[dict(field, value=chunk)])
+            if parts:
+                part["title"] = "{} (continued)".format(attachment.get("title", ""))
+            parts.append(part)
+    return parts
+
+
+def chunk_message(
+    payload,
+    max_field_length=MAX_FIELD_LENGTH,
+    max_attachments=MAX_ATTACHMENTS,
+    max_bytes=MAX_MESSAGE_BYTES,
+):
+    """Splits a Slack message into messages that fit Slack's limits
+
+    Long attachment fields are split on line breaks, then attachments are
+    packed in order into as few messages as fit max_attachments and
+    max_bytes. Other keys of the payload are kept on the first message.
+
+    Parameters:
+    payload (dict): Slack message, see prepare_slack_message
+    max_field_length (int): Max characters per attachment field value
+    max_attachments (int): Max attachments per message
+    max_bytes (int): Max size of a serialized message
+
+    Returns:
+    list (dict): Messages to post in order
+    """
+    first = {k: v for k, v in payload.items() if k != "attachments"}
+    messages = []
+    current = dict(first, attachments=[])
+    size = len(json.dumps(current))
+    for attachment in payload.get("attachments", []):
+        for part in split_attachment(attachment, max_field_length):
+            part_size = len(json.dumps(part)) + 2
+            if current["attachments"] and (
+                len(current["attachments"]) >= max_attachments
+                or size + part_size > max_bytes
+            ):
+                messages.append(current)
+                current = {"attachments": []}
+                size = len(json.dumps(current))
+            current["attachments"].append(part)
+            size += part_size
+    messages.append(current)
+    return messages
+
+
+def retry_after(headers, default):
+    """Seconds to wait before retrying a rate limited call
+
+    Parameters:
+    headers (dict): Response headers
+    default (float): Backoff used when Retry-After is missing or not a number
+                     of seconds, ex: an HTTP date
+
+    Returns:
+    float
+    """
+    try:
+        return max(0.0, float(headers["Retry-After"]))
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+class SlackWebhook:
+    """Posts messages to a Slack incoming webhook over a pooled session
+
+    Rate limited posts are retried after the Retry-After Slack sends with
+    the 429, server errors and connection errors with exponential backoff.
+
+    Parameters:
+    url (str): Incoming webhook URL
+    session (requests.Session): Session to post with, defaults to a new one
+    max_retries (int): Retries per message before giving up
+    timeout (float): Seconds to wait for a response
+    sleep (callable): Used to wait before retrying
+    """
+
+    def __init__(self, url, session=None, max_retries=5, timeout=10, sleep=None):
+        self.url = url
+        self.session = session or requests.Session()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.sleep = sleep or time.sleep
+
+    def post(self, payload):
+        """Posts a single message
+
+        Parameters:
+        payload (dict): Slack message
+
+        Returns:
+        bool: True if Slack accepted the message
+        """
+        data = json.dumps(payload)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(
+                    self.url,
+                    data=data,
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                record_call("slack_post", time.perf_counter() - start, error=True)
+                LOGGER.warning("Slack post failed: {}".format(e))
+                delay = 2**attempt
+            else:
+                record_call(
+                    "slack_post",
+                    time.perf_counter() - start,
+                    error=resp.status_code != requests.codes.ok,
+                )
+                if resp.status_code == requests.codes.ok:
+                    return True
+                if resp.status_code == requests.codes.too_many_requests:
+                    delay = retry_after(resp.headers, 2**attempt)
+                elif resp.status_code >= 500:
+                    delay = 2**attempt
+                else:
+                    LOGGER.error(
+                        "Unsuccessfully posted to slack, response {}, {}".format(
+                            resp.status_code, resp.text
+                        )
+                    )
+                    return False
+
+            if attempt < self.max_retries:
+                LOGGER.info("Retrying slack post in {}s".format(delay))
+                self.sleep(delay)
+
+        LOGGER.error("Giving up posting to slack after {} retries".format(attempt))
+        return False
+
+    def send(self, payload):
+        """Posts a message, split into several if it is too large
+
+        Messages are posted one after the other so they show up in order.
+
+        Parameters:
+        payload (dict): Slack message, see prepare_slack_message
+
+        Returns:
+        bool: True if every message was accepted
+        """
+        messages = chunk_message(payload)
+        if len(messages) > 1:
+            LOGGER.info("Splitting slack message into {}".format(len(messages)))
+        return all([self.post(m) for m in messages])
@@ -0,0 +1,242 @@
+import bisect
+import datetime as dt
+import logging
+import threading
+
+from sleuth.services import (
+    get_entry_tag_defaults,
+    get_iam_key_info,
+    get_key_last_used,
+    list_access_keys,
+)
+
+LOGGER = logging.getLogger("sleuth")
+
+SNAPSHOT_VERSION = 1
+
+
+def format_date(date):
+    return date.isoformat() if date is not None else None
+
+
+def format_utc(date):
+    # one offset for every date so the ISO strings sort chronologically
+    return date.astimezone(dt.timezone.utc).isoformat(timespec="microseconds")
+
+
+def parse_date(value):
+    return dt.datetime.fromisoformat(value) if value is not None else None
+
+
+def user_fingerprint(u):
+    """Fields of a list_users entry that mark a user as changed between runs
+
+    Parameters:
+    u (dict): User entry from the list_users API
+
+    Returns:
+    list: Values to compare with the previous snapshot
+    """
+    return [
+        u["UserId"],
+        u.get("Path"),
+        format_date(u.get("CreateDate")),
+        format_date(u.get("PasswordLastUsed")),
+    ]
+
+
+class SnapshotCollector:
+    """Builds users from the previous run's snapshot where nothing changed
+
+    Users whose list_users entry changed, or who are missing from the
+    snapshot, are fetched in full. For the others only the key list is
+    fetched; if it still matches the snapshot the tags and last used dates
+    are reused. Entries that carry their tags, see list_user_details_pages,
+    use those instead of the snapshot's. A reused last used date can only
+    make a key look older than it is, so it is refreshed once the key is old
+    enough for that to change the audit state.
+
+    The snapshot keeps a schedule, the keys ordered by Key.next_check. Keys
+    whose date has come are the only ones whose last used date is refreshed,
+    found with a binary search. Keys the previous run did not audit fall back
+    to last_used_refresh_age, and so does every key when the thresholds or
+    policy rules changed, see schedule_version.
+
+    Tag changes do not show up in list_users, so every full_refresh_runs runs
+    the snapshot is ignored and everything is fetched again.
+
+    Parameters:
+    store: FileStore or S3Store holding the snapshot
+    full_refresh_runs (int): Runs between full refreshes, 1 refreshes every run
+    last_used_refresh_age (int): Days since last use from which a reused last
+                                 used date is fetched again, normally the
+                                 inactivity warning age. None always fetches
+    now (datetime): Reference time for the last used age
+    schedule_version (str): Version of the audit settings, a schedule saved
+                            with another one is ignored, see
+                            get_schedule_version
+    """
+
+    def __init__(
+        self,
+        store,
+        full_refresh_runs=7,
+        last_used_refresh_age=None,
+        now=None,
+        schedule_version=None,
+    ):
+        self.store = store
+        self.schedule_version = schedule_version
+        self.last_used_refresh_age = last_used_refresh_age
+        self.now = now or dt.datetime.now(dt.timezone.utc)
+
+        previous = store.load()
+        if (
+            previous is None
+            or previous.get("version") != SNAPSHOT_VERSION
+            or previous["runs_since_full"] + 1 >= full_refresh_runs
+        ):
+            LOGGER.info("No usable snapshot, fetching every user")
+            self.previous = {}
+            self.runs_since_full = 0
+        else:
+            self.previous = previous["users"]
+            self.runs_since_full = previous["runs_since_full"] + 1
+
+        self.scheduled = (
+            bool(self.previous)
+            and "schedule" in previous
+            and previous.get("schedule_version") == schedule_version
+        )
+        # schedule is a list of [next_check, key_id] ordered by date
+        schedule = previous["schedule"] if self.scheduled else []
+        due = bisect.bisect_right(schedule, [format_utc(self.now), "\uffff"])
+        self.due = {key_id for _, key_id in schedule[:due]}
+        if self.scheduled:
+            LOGGER.info("Schedule: {} of {} keys due".format(due, len(schedule)))
+
+        self.entries = {}
+        self.counts = {"fetched": 0, "keys_changed": 0, "reused": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            self.counts[counter] += 1
+
+    def build_user(self, u, iam=None, now=None):
+        """Builds a User from a list_users entry, see get_iam_users
+
+        Parameters:
+        u (dict): User entry from the list_users API
+        iam: IAM client to use, defaults to the module client
+        now (datetime): Reference time of the audit run, defaults to self.now
+
+        Returns:
+        User: User and related access key info
+        """
+        from sleuth.auditor import User
+
+        now = now or self.now
+        fingerprint = user_fingerprint(u)
+        prev = self.previous.get(u["UserName"])
+        user = User(u["UserId"], u["UserName"], path=u.get("Path", "/"))
+
+        if prev is None or prev["fingerprint"] != fingerprint:
+            self._count("fetched")
+            tags = get_entry_tag_defaults(u, iam)
+            user.keys = get_iam_key_info(user, iam, now=now)
+        else:
+            key_info = list_access_keys(u["UserName"], iam)
+            if [(k["AccessKeyId"], k["Status"]) for k in key_info] != [
+                (k["key_id"], k["status"]) for k in prev["keys"]
+            ]:
+                self._count("keys_changed")
+                tags = get_entry_tag_defaults(u, iam)
+                user.keys = get_iam_key_info(user, iam, key_info, now)
+            else:
+                self._count("reused")
+                # bulk listings carry the current tags at no extra cost
+                tags = get_entry_tag_defaults(u, iam) if "Tags" in u else prev["tags"]
+                user.keys = self.reuse_keys(u["UserName"], prev["keys"], iam, now)
+
+        user.slack_id = tags["Slack"]
+        user.auto_expire = tags["KeyAutoExpire"]
+        user.tags = tags
+
+        # the keys are written out by save, once audited
+        self.entries[u["UserName"]] = {
+            "fingerprint": fingerprint,
+            "tags": tags,
+            "keys": user.keys,
+        }
+
+        return user
+
+    def reuse_keys(self, username, keys, iam=None, now=None):
+        """Builds Keys from the snapshot, refreshing last used dates that matter
+
+        Parameters:
+        username (str): Owner of the keys
+        keys (list): Key entries from the snapshot
+        iam: IAM client to use, defaults to the module client
+        now (datetime): Reference time of the audit run, defaults to self.now
+
+        Returns:
+        list (Key): Keys of the user
+        """
+        from sleuth.auditor import Key
+
+        now = now or self.now
+        reused = []
+        for k in keys:
+            created = parse_date(k["created"])
+            last_used = parse_date(k["last_used"])
+            if self.scheduled and k.get("scheduled"):
+                refresh = k["key_id"] in self.due
+            else:
+                refresh = (
+                    self.last_used_refresh_age is None
+                    or (now - last_used).days >= self.last_used_refresh_age
+                )
+            if refresh:
+                last_used = get_key_last_used(k["key_id"], created, iam)
+            reused.append(
+                Key(username, k["key_id"], k["status"], created, last_used, now)
+            )
+
+        return reused
+
+    def save(self):
+        """Stores the users built during this run as the next snapshot"""
+        LOGGER.info(
+            "Snapshot: {fetched} users fetched, {keys_changed} with changed keys, "
+            "{reused} reused".format(**self.counts)
+        )
+        users = {}
+        schedule = []
+        for username, entry in self.entries.items():
+            keys = []
+            for k in entry["keys"]:
+                keys.append(
+                    {
+                        "key_id": k.key_id,
+                        "status": k.status,
+                        "created": format_date(k.created),
+                        "last_used": format_date(k.inactivity_age),
+                        "scheduled": k.next_check is not None,
+                    }
+                )
+                if k.next_check is not None:
+                    schedule.append([format_utc(k.next_check), k.key_id])
+            users[username] = dict(entry, keys=keys)
+        schedule.sort()
+
+        self.store.save(
+            {
+                "version": SNAPSHOT_VERSION,
+                "runs_since_full": self.runs_since_full,
+                "users": users,
+                "schedule": schedule,
+                "schedule_version": self.schedule_version,
+            }
+        )
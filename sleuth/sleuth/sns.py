@@ -0,0 +1,164 @@
+import json
+import logging
+import time
+
+from sleuth import services
+from sleuth.report import NOTIFY_STATES
+
+LOGGER = logging.getLogger("sleuth")
+
+# PublishBatch limits, the size counts the messages and their attributes
+MAX_BATCH_ENTRIES = 10
+MAX_BATCH_BYTES = 256 * 1024
+
+
+def finding_record(user, key):
+    """Structured record of a single finding
+
+    Parameters:
+    user (User): Owner of the key
+    key (Key): Audited key
+
+    Returns:
+    dict: JSON serializable finding
+    """
+    return {
+        "account": user.account,
+        "username": user.username,
+        "slack_id": user.slack_id,
+        "key_id": key.key_id,
+        "audit_state": key.audit_state,
+        "creation_age": key.creation_age,
+        "access_age": key.access_age,
+        "creation_valid_for": key.creation_valid_for,
+        "activity_valid_for": key.activity_valid_for,
+    }
+
+
+def entry_size(entry):
+    """Bytes an entry counts towards the PublishBatch size limit"""
+    size = len(entry["Message"].encode("utf-8"))
+    for name, attr in entry.get("MessageAttributes", {}).items():
+        size += len(name.encode("utf-8")) + len(attr["DataType"].encode("utf-8"))
+        size += len(attr["StringValue"].encode("utf-8"))
+    return size
+
+
+def pack_batches(entries, max_entries=MAX_BATCH_ENTRIES, max_bytes=MAX_BATCH_BYTES):
+    """Packs PublishBatch entries in order into batches under the limits
+
+    Parameters:
+    entries (iterable): PublishBatch request entries
+    max_entries (int): Max entries per batch
+    max_bytes (int): Max combined size of a batch, see entry_size
+
+    Returns:
+    list (list): Batches of entries, entries over max_bytes on their own are
+                 dropped and logged
+    """
+    batches = []
+    current = []
+    size = 0
+    for entry in entries:
+        esize = entry_size(entry)
+        if esize > max_bytes:
+            LOGGER.error(
+                "Dropping SNS message {} over {} bytes".format(entry["Id"], max_bytes)
+            )
+            continue
+        if current and (len(current) >= max_entries or size + esize > max_bytes):
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(entry)
+        size += esize
+    if current:
+        batches.append(current)
+    return batches
+
+
+def finding_entries(report):
+    """PublishBatch entries for every finding of a report
+
+    Entries carry slack_id and audit_state message attributes so
+    subscriptions can filter on them.
+
+    Parameters:
+    report (Report): Findings of the run
+
+    Returns:
+    list (dict): PublishBatch request entries
+    """
+    entries = []
+    for i, (user, key) in enumerate(report.items(*NOTIFY_STATES)):
+        entries.append(
+            {
+                "Id": str(i),
+                "Message": json.dumps(finding_record(user, key)),
+                "MessageAttributes": {
+                    "slack_id": {
+                        "DataType": "String",
+                        "StringValue": user.slack_id or "",
+                    },
+                    "audit_state": {
+                        "DataType": "String",
+                        "StringValue": key.audit_state,
+                    },
+                },
+            }
+        )
+    return entries
+
+
+def publish_findings(topic_arn, report, sns=None, max_retries=3, sleep=None):
+    """Publishes one JSON message per finding with PublishBatch
+
+    Entries SNS fails on its side are published again with backoff, entries
+    failing with a sender fault are not retried.
+
+    Parameters:
+    topic_arn (str): Topic to publish to
+    report (Report): Findings of the run
+    sns: SNS client, defaults to the module client
+    max_retries (int): Retries for failed entries of a batch
+    sleep (callable): Used to wait before retrying
+
+    Returns:
+    dict: Number of findings published and failed, and batches sent
+    """
+    sns = sns or services.get_client("sns")
+    sleep = sleep or time.sleep
+    summary = {"published": 0, "failed": 0, "batches": 0}
+
+    for batch in pack_batches(finding_entries(report)):
+        for attempt in range(max_retries + 1):
+            summary["batches"] += 1
+            resp = sns.publish_batch(
+                TopicArn=topic_arn, PublishBatchRequestEntries=batch
+            )
+            summary["published"] += len(resp.get("Successful", []))
+
+            failed = {f["Id"]: f for f in resp.get("Failed", [])}
+            retry = [
+                e
+                for e in batch
+                if e["Id"] in failed and not failed[e["Id"]]["SenderFault"]
+            ]
+            summary["failed"] += len(failed) - len(retry)
+            for f in failed.values():
+                if f["SenderFault"]:
+                    LOGGER.error(
+                        "SNS rejected finding {}: {}".format(f["Id"], f.get("Message"))
+                    )
+
+            if not retry:
+                break
+            if attempt == max_retries:
+                summary["failed"] += len(retry)
+                LOGGER.error("Giving up on {} SNS messages".format(len(retry)))
+                break
+            batch = retry
+            sleep(0.5 * 2**attempt)
+
+    LOGGER.info("SNS findings: {}".format(json.dumps(summary)))
+    return summary
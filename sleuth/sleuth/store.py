@@ -0,0 +1,106 @@
+import json
+import logging
+import os
+
+from botocore.exceptions import ClientError
+
+LOGGER = logging.getLogger("sleuth")
+
+
+def s3_client():
+    """S3 client built by create_client, S3_ENDPOINT_URL is the endpoint when set"""
+    from sleuth.services import create_client
+
+    kwargs = {}
+    if os.environ.get("S3_ENDPOINT_URL"):
+        kwargs["endpoint_url"] = os.environ["S3_ENDPOINT_URL"]
+    return create_client("s3", **kwargs)
+
+
+def parse_s3_url(url):
+    """Splits s3://bucket/key into the bucket and the key"""
+    bucket, _, key = url[len("s3://") :].partition("/")
+    if not bucket or not key:
+        raise RuntimeError("S3 URL must look like s3://bucket/key: {}".format(url))
+    return bucket, key
+
+
+class FileStore:
+    """Keeps a JSON document in a local file
+
+    Parameters:
+    path (str): File to read and write
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Returns the stored document, None if nothing was stored yet"""
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, data):
+        """Stores the document, replacing the file atomically"""
+        tmp = "{}.tmp".format(self.path)
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+
+class S3Store:
+    """Keeps a JSON document in an S3 compatible object store
+
+    Parameters:
+    bucket (str): Bucket name
+    key (str): Object key
+    client: S3 client, defaults to one from s3_client
+    """
+
+    def __init__(self, bucket, key, client=None):
+        self.bucket = bucket
+        self.key = key
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = s3_client()
+        return self._client
+
+    def load(self):
+        """Returns the stored document, None if nothing was stored yet"""
+        try:
+            resp = self.client.get_object(Bucket=self.bucket, Key=self.key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(resp["Body"].read())
+
+    def save(self, data):
+        """Stores the document"""
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Body=json.dumps(data, separators=(",", ":")).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+def get_store(url, client=None):
+    """Builds a store from a URL
+
+    Parameters:
+    url (str): s3://bucket/key for S3Store, anything else is a FileStore path
+    client: S3 client passed to S3Store
+
+    Returns:
+    FileStore or S3Store
+    """
+    if url.startswith("s3://"):
+        return S3Store(*parse_s3_url(url), client)
+    return FileStore(url)
@@ -0,0 +1,92 @@
+import datetime
+import importlib.util
+
+import pytest
+
+from benchmarks.fakes import AsyncFakeIAM, FakeIAM, generate_fleet
+from sleuth import aio, services
+from sleuth.aio import AsyncLimitedClient
+from sleuth.auditor import audit_account
+from sleuth.config import Config
+
+now = datetime.datetime(2019, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def key_tuples(users):
+    return [
+        (u.username, u.slack_id, u.auto_expire, u.path, k.key_id, k.inactivity_age)
+        for u in users
+        for k in u.keys
+    ]
+
+
+class TestAsyncCollector:
+    def test_same_users(self):
+        """The async collector returns what the threaded one does, in order"""
+        fleet = generate_fleet(95, now=now)
+        stub = AsyncFakeIAM(FakeIAM(fleet, page_size=10))
+
+        users = aio.get_iam_users(iam=stub, now=now)
+
+        assert key_tuples(users) == key_tuples(
+            services.get_iam_users(iam=FakeIAM(fleet), now=now)
+        )
+        assert stub.iam.calls["list_users"] == 10
+        assert stub.iam.calls["list_user_tags"] == 95
+
+    def test_bulk(self):
+        """Tags listed with the users are not fetched again"""
+        fleet = generate_fleet(95, now=now)
+        stub = AsyncFakeIAM(FakeIAM(fleet))
+
+        users = aio.get_iam_users(iam=stub, now=now, bulk=True)
+
+        assert key_tuples(users) == key_tuples(
+            services.get_iam_users(iam=FakeIAM(fleet), now=now)
+        )
+        assert stub.iam.calls["list_user_tags"] == sum(
+            1 for u in fleet if not u["Tags"]
+        )
+
+    def test_semaphore(self):
+        """Calls in flight are bounded per API"""
+        stub = AsyncFakeIAM(FakeIAM(generate_fleet(60)), latency=0.001)
+        aio.get_iam_users(concurrency=3, iam=stub)
+        assert stub.max_in_flight["list_user_tags"] == 3
+        assert max(stub.max_in_flight.values()) <= 3
+
+    def test_throttled(self):
+        """Throttled calls are retried"""
+        iam = FakeIAM(generate_fleet(50), throttle_every=4)
+        client = AsyncLimitedClient(AsyncFakeIAM(iam), base_delay=0)
+
+        users = aio.get_iam_users(iam=client)
+
+        assert len(users) == 50
+        assert sum(iam.throttles.values()) > 0
+        assert iam.calls["list_user_tags"] == 50
+
+    def test_early_close(self):
+        """Closing the generator early stops listing and cancels the rest"""
+        stub = AsyncFakeIAM(FakeIAM(generate_fleet(50), page_size=10))
+        users = aio.iter_iam_users(iam=stub)
+        next(users)
+        users.close()
+        assert stub.iam.calls["list_users"] == 2
+
+    def test_audit(self, monkeypatch):
+        """COLLECTION_MODE=async feeds the audit of the local account"""
+        monkeypatch.setattr(aio, "IAM", AsyncFakeIAM(FakeIAM(generate_fleet(30))))
+        config = Config(80, 90, 90, 80, collection_mode="async")
+        assert len(audit_account(config=config)) == 30
+        with pytest.raises(RuntimeError):
+            audit_account(account="123456789012", config=config)
+
+    @pytest.mark.skipif(
+        importlib.util.find_spec("aiobotocore") is not None,
+        reason="aiobotocore is installed",
+    )
+    def test_needs_aiobotocore(self):
+        """Without a client the async collector needs aiobotocore"""
+        with pytest.raises(RuntimeError):
+            aio.get_iam_users()
@@ -1,9 +1,20 @@
 import datetime
+import functools
 
 import pytest
 from freezegun import freeze_time
 
-from sleuth.auditor import Key
+from benchmarks.fakes import FakeIAM, FakeOrganization, generate_fleet
+from sleuth import services
+from sleuth.auditor import (
+    Key,
+    User,
+    audit_account,
+    audit_accounts,
+    is_flagged,
+    iter_audit_account,
+)
+from sleuth.disable import DisableExecutor
 
 
 @freeze_time("2019-01-16")
@@ -81,6 +92,23 @@ class TestKey:
         key.audit(60, 80, 30, 20)
         assert key.audit_state == "disabled"
 
+    def test_next_check(self):
+        """Good and old keys are next due when an age crosses a threshold"""
+        created = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+        last_used = datetime.datetime(2019, 1, 10, tzinfo=datetime.timezone.utc)
+        key = Key("username", "keyid", "Active", created, last_used)
+        key.audit(60, 80, 20, 19)
+        # last used 6 days ago, stagnant at 19 days
+        assert key.next_check == last_used + datetime.timedelta(days=19)
+
+        key.audit(10, 20, 20, 19)
+        assert key.audit_state == "old"
+        assert key.next_check == created + datetime.timedelta(days=20)
+
+        key.audit(60, 80, 10, 5)
+        assert key.audit_state == "stagnant"
+        assert key.next_check == key.now
+
     def test_invalid(self):
         """Key is disabled AWS status of Inactive, key marked is disabled"""
         created = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
@@ -88,3 +116,116 @@ class TestKey:
         key = Key("user2", "ldasfkk", "Inactive", created, last_used)
         with pytest.raises(AssertionError):
             key.audit(5, 1, 1, 1)
+
+
+class TestModel:
+    def test_reference_time(self):
+        """Ages are computed from the reference time of the run"""
+        now = datetime.datetime(2019, 3, 1, 23, 59, tzinfo=datetime.timezone.utc)
+        created = datetime.datetime(2019, 1, 1, tzinfo=datetime.timezone.utc)
+        last_used = datetime.datetime(2019, 2, 1, tzinfo=datetime.timezone.utc)
+        key = Key("username", "keyid", "Active", created, last_used, now)
+        assert key.now == now
+        assert key.creation_age == 59
+        assert key.access_age == 28
+        with pytest.raises(AttributeError):
+            key.now = created
+
+    def test_slots(self):
+        """Keys are not shared between users and no attributes can be added"""
+        user1 = User("id1", "user1")
+        user2 = User("id2", "user2")
+        user1.keys.append("key")
+        assert user2.keys == []
+        with pytest.raises(AttributeError):
+            user1.extra = True
+
+
+class TestAuditAccounts:
+    def test_fan_out(self, monkeypatch):
+        """Every account is assumed and its users tagged with the account"""
+        monkeypatch.setenv("WARNING_AGE", "80")
+        monkeypatch.setenv("EXPIRATION_AGE", "90")
+        monkeypatch.setenv("ENABLE_AUTO_EXPIRE", "true")
+        org = FakeOrganization(accounts=5, users=10)
+        factory = functools.partial(
+            services.assume_role_client,
+            sts=org.sts,
+            client_factory=org.client_factory,
+        )
+
+        users = audit_accounts(org.account_ids, factory, workers=3)
+
+        assert org.sts.calls["assume_role"] == 5
+        assert [u.account for u in users] == [
+            a for a in org.account_ids for _ in range(10)
+        ]
+        # expired keys are disabled in the account they belong to
+        for u in users:
+            iam = org.iams[u.account]
+            for k in u.keys:
+                if k.audit_state in ("expire", "stagnant_expire"):
+                    assert iam._by_key[k.key_id]["Status"] == "Inactive"
+
+    def test_role_arn(self, monkeypatch):
+        """Account IDs are combined with AUDIT_ROLE_NAME, ARNs are used as is"""
+        monkeypatch.setenv("AUDIT_ROLE_NAME", "sleuth")
+        arn = "arn:aws:iam::123456789012:role/other"
+        assert services.get_account_role_arn(arn) == arn
+        assert (
+            services.get_account_role_arn("210987654321")
+            == "arn:aws:iam::210987654321:role/sleuth"
+        )
+
+
+class TestStreaming:
+    @pytest.fixture(autouse=True)
+    def ages(self, monkeypatch):
+        monkeypatch.setenv("WARNING_AGE", "80")
+        monkeypatch.setenv("EXPIRATION_AGE", "90")
+        monkeypatch.setenv("ENABLE_AUTO_EXPIRE", "true")
+
+    def test_first_user_before_listing_done(self):
+        """Users are handed out while later pages are still to be listed"""
+        iam = FakeIAM(generate_fleet(50), page_size=10)
+        users = services.iter_iam_users(workers=2, iam=iam)
+
+        next(users)
+        assert iam.calls["list_users"] == 2
+        assert len(list(users)) == 49
+        assert iam.calls["list_users"] == 5
+
+    def test_disable_while_collecting(self):
+        """Expired keys are disabled before the rest of the account is listed"""
+        fleet = generate_fleet(200)
+        iam = FakeIAM(fleet, page_size=10)
+        disabler = DisableExecutor(workers=2)
+
+        for u in iter_audit_account(iam, disabler=disabler):
+            expired = [
+                k for k in u.keys if k.audit_state in ("expire", "stagnant_expire")
+            ]
+            if expired:
+                break
+        assert disabler.close()["disabled"] == len(expired)
+        assert iam.calls["update_access_key"] == len(expired)
+        assert iam.calls["list_users"] < len(fleet) // 10
+        for k in expired:
+            assert iam._by_key[k.key_id]["Status"] == "Inactive"
+
+    def test_keep_flagged(self):
+        """Only flagged users are kept and the messages are unchanged"""
+        now = datetime.datetime(2019, 1, 16, tzinfo=datetime.timezone.utc)
+        # disabling keys changes the fleet, so each run gets its own
+        all_users = audit_account(FakeIAM(generate_fleet(200, now)), now=now)
+        flagged = audit_account(
+            FakeIAM(generate_fleet(200, now)), now=now, keep=is_flagged
+        )
+
+        assert 0 < len(flagged) < len(all_users)
+        assert [u.username for u in flagged] == [
+            u.username for u in all_users if is_flagged(u)
+        ]
+        assert services.prepare_slack_message(
+            flagged, "t", "", "t", ""
+        ) == services.prepare_slack_message(all_users, "t", "", "t", "")
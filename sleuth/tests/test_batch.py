@@ -0,0 +1,93 @@
+import datetime
+import random
+
+import pytest
+
+from sleuth.auditor import Key
+from sleuth.batch import audit_batch
+
+now = datetime.datetime(2019, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def corpus(seed, size=3000):
+    """Random thresholds and keys, ages clustered around the thresholds"""
+    rng = random.Random(seed)
+    rotate = rng.randint(1, 90)
+    expire = rotate + rng.randint(1, 30)
+    warn = rng.randint(0, expire - 1)
+    inactivity = rng.randint(warn + 1, expire)
+    thresholds = (rotate, expire, inactivity, warn)
+    near = [t + d for t in thresholds for d in (-1, 0, 1)]
+
+    keys = []
+    for _ in range(size):
+        creation_age = rng.choice(near) if rng.random() < 0.5 else rng.randint(0, 200)
+        creation_age = max(creation_age, 0)
+        access_age = min(creation_age, max(rng.choice(near + [0]), 0))
+        status = rng.choice(["Active", "Active", "Inactive"])
+        keys.append((creation_age, access_age, status, rng.random() < 0.9))
+
+    return thresholds, keys
+
+
+def audit_keys(thresholds, keys, enable_auto_expire, monkeypatch):
+    """Reference results from Key.audit, the way audit_account applies it"""
+    monkeypatch.setenv("ENABLE_AUTO_EXPIRE", "true" if enable_auto_expire else "false")
+    results = []
+    for creation_age, access_age, status, expires in keys:
+        key = Key(
+            "user",
+            "key",
+            status,
+            now - datetime.timedelta(days=creation_age),
+            now - datetime.timedelta(days=access_age),
+            now,
+        )
+        if expires:
+            key.audit(*thresholds)
+        else:
+            key.audit_state = "good"
+        results.append(
+            (key.audit_state, key.creation_valid_for, key.activity_valid_for)
+        )
+    return results
+
+
+def audit_columns(thresholds, keys, enable_auto_expire, use_numpy):
+    states, creation_valid_for, activity_valid_for = audit_batch(
+        [k[0] for k in keys],
+        [k[1] for k in keys],
+        [k[2] for k in keys],
+        [k[3] for k in keys],
+        *thresholds,
+        enable_auto_expire=enable_auto_expire,
+        use_numpy=use_numpy,
+    )
+    return [
+        (str(s), int(c), int(a))
+        for s, c, a in zip(states, creation_valid_for, activity_valid_for)
+    ]
+
+
+class TestAuditBatch:
+    @pytest.mark.parametrize("seed", range(10))
+    @pytest.mark.parametrize("enable_auto_expire", [True, False])
+    def test_python_matches_key_audit(self, seed, enable_auto_expire, monkeypatch):
+        """The plain python path matches Key.audit on a random corpus"""
+        thresholds, keys = corpus(seed)
+        expected = audit_keys(thresholds, keys, enable_auto_expire, monkeypatch)
+        assert audit_columns(thresholds, keys, enable_auto_expire, False) == expected
+
+    @pytest.mark.parametrize("seed", range(10))
+    @pytest.mark.parametrize("enable_auto_expire", [True, False])
+    def test_numpy_matches_key_audit(self, seed, enable_auto_expire, monkeypatch):
+        """The numpy path matches Key.audit on a random corpus"""
+        pytest.importorskip("numpy")
+        thresholds, keys = corpus(seed)
+        expected = audit_keys(thresholds, keys, enable_auto_expire, monkeypatch)
+        assert audit_columns(thresholds, keys, enable_auto_expire, True) == expected
+
+    def test_invalid(self):
+        """Thresholds are validated like Key.audit"""
+        with pytest.raises(AssertionError):
+            audit_batch([1], [1], ["Active"], [True], 5, 1, 1, 1)
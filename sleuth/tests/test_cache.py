@@ -0,0 +1,92 @@
+from benchmarks.fakes import FakeIAM, FakeSNS, FakeSSM, generate_fleet
+from sleuth import auditor, cache, services
+from sleuth.cache import TTLCache
+from sleuth.config import Config
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    def test_expiry(self):
+        """Entries are served until their TTL runs out"""
+        clock = Clock()
+        c = TTLCache(ttl=10, clock=clock)
+        c.set("a", 1)
+        clock.now = 9.9
+        assert c.get("a") == 1
+        clock.now = 10
+        assert c.get("a") is None
+        assert c.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 0}
+
+    def test_lru(self):
+        """The least recently used entry is evicted first"""
+        c = TTLCache(maxsize=2)
+        c.set("a", 1)
+        c.set("b", 2)
+        c.get("a")
+        c.set("c", 3)
+        assert c.get("b") is None
+        assert (c.get("a"), c.get("c")) == (1, 3)
+        assert c.evictions == 1
+
+    def test_disabled(self):
+        """A TTL of 0 calls through every time and counts nothing"""
+        c = TTLCache(ttl=0)
+        calls = []
+        for _ in range(3):
+            c.get_or_set("a", lambda: calls.append(1))
+        assert len(calls) == 3
+        assert c.stats()["misses"] == 0
+
+
+class TestWarmInvocations:
+    def run(self, monkeypatch, config, ssm):
+        monkeypatch.setattr(services, "IAM", FakeIAM(generate_fleet(40)))
+        monkeypatch.setattr(services, "SNS", FakeSNS())
+        monkeypatch.setattr(services, "SSM", ssm)
+        monkeypatch.setattr(auditor, "send_slack_message", lambda url, msg: True)
+        auditor.audit(config=config)
+
+    def test_ssm_and_mentions(self, monkeypatch):
+        """A warm invocation with the same settings asks SSM nothing"""
+        ssm = FakeSSM({"/sleuth/slack": "https://hooks.slack.invalid/x"})
+        config = Config(80, 90, 90, 80, slack_url="ssm:/sleuth/slack")
+
+        self.run(monkeypatch, config, ssm)
+        mentions = cache.stats()["mentions"]["misses"]
+        assert mentions > 0
+        self.run(monkeypatch, config, ssm)
+
+        stats = cache.stats()
+        assert ssm.calls["get_parameter"] == 1
+        assert stats["ssm"]["hits"] == 1
+        assert stats["mentions"]["misses"] == 0
+        assert stats["mentions"]["hits"] >= mentions
+
+    def test_config_version(self, monkeypatch):
+        """Changed settings start with empty caches"""
+        ssm = FakeSSM({"/sleuth/slack": "https://hooks.slack.invalid/x"})
+        config = Config(80, 90, 90, 80, slack_url="ssm:/sleuth/slack")
+
+        self.run(monkeypatch, config, ssm)
+        self.run(monkeypatch, Config(70, 90, 90, 80, slack_url=config.slack_url), ssm)
+        assert ssm.calls["get_parameter"] == 2
+
+    def test_tags(self, monkeypatch):
+        """User tags are only cached with CACHE_TAGS"""
+        iam = FakeIAM(generate_fleet(30))
+        monkeypatch.setattr(services, "IAM", iam)
+        config = Config(80, 90, 90, 80, cache_tags=True)
+
+        for _ in range(2):
+            auditor.audit(config=config)
+        assert iam.calls["list_user_tags"] == 30
+
+        auditor.audit(config=Config(80, 90, 90, 80))
+        assert iam.calls["list_user_tags"] == 60
@@ -0,0 +1,128 @@
+import datetime
+
+from benchmarks.fakes import FakeIAM, FakeSNS, generate_fleet
+from sleuth import auditor, services
+from sleuth.auditor import Key, User
+from sleuth.checkpoint import Checkpoint, dump_user, load_user
+from sleuth.config import Config
+from sleuth.store import FileStore
+
+now = datetime.datetime(2019, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeContext:
+    """Lambda context whose remaining time drops by step on every check"""
+
+    def __init__(self, remaining=300000, step=60000):
+        self.remaining = remaining
+        self.step = step
+
+    def get_remaining_time_in_millis(self):
+        self.remaining -= self.step
+        return self.remaining
+
+
+def run(fleet, tmp_path, monkeypatch, checkpoint=True):
+    """Audits the fleet until complete, one FakeContext per invocation
+
+    Returns:
+    tuple: Invocations, SNS client and the IAM fleet
+    """
+    iam = FakeIAM(fleet, page_size=10)
+    sns = FakeSNS()
+    monkeypatch.setattr(services, "IAM", iam)
+    monkeypatch.setattr(services, "SNS", sns)
+    config = Config(
+        80,
+        90,
+        90,
+        80,
+        enable_auto_expire=True,
+        sns_topic="arn:topic",
+        checkpoint_url=str(tmp_path / "checkpoint.json") if checkpoint else None,
+    )
+
+    invocations = 0
+    complete = False
+    while not complete:
+        invocations += 1
+        assert not sns.published
+        context = FakeContext()
+        complete = auditor.audit(
+            config=config, time_left=context.get_remaining_time_in_millis
+        )
+    return invocations, sns, iam
+
+
+class TestCheckpoint:
+    def test_user_round_trip(self):
+        """Users come back from a checkpoint in the same audit state"""
+        user = User("id", "alice", "U1", "true", "123", {"Team": "a"}, "/ops/")
+        user.keys.append(
+            Key(
+                "alice",
+                "AKIA1",
+                "Active",
+                now - datetime.timedelta(days=100),
+                now - datetime.timedelta(days=3),
+                now,
+            )
+        )
+        user.audit(80, 90, 90, 80, auto_expire_enabled=True)
+
+        loaded = load_user(dump_user(user), now)
+
+        assert (loaded.username, loaded.tags, loaded.path) == (
+            "alice",
+            {"Team": "a"},
+            "/ops/",
+        )
+        key = loaded.keys[0]
+        assert (key.audit_state, key.creation_age, key.creation_valid_for) == (
+            "expire",
+            100,
+            -10,
+        )
+
+    def test_stale(self, tmp_path):
+        """Old checkpoints and other versions are ignored, clear drops it"""
+        checkpoint = Checkpoint(FileStore(str(tmp_path / "checkpoint.json")))
+        fresh = datetime.datetime.now(datetime.timezone.utc)
+        checkpoint.save({"now": fresh.isoformat()})
+        assert checkpoint.load()["now"] == fresh.isoformat()
+
+        checkpoint.save({"now": (fresh - datetime.timedelta(hours=13)).isoformat()})
+        assert checkpoint.load() is None
+
+        checkpoint.store.save({"version": 0, "now": fresh.isoformat()})
+        assert checkpoint.load() is None
+
+        checkpoint.save({"now": fresh.isoformat()})
+        checkpoint.clear()
+        assert checkpoint.load() is None
+
+
+class TestResume:
+    def test_resume(self, monkeypatch, tmp_path):
+        """A run out of time resumes where it stopped and notifies once"""
+        invocations, sns, iam = run(generate_fleet(100), tmp_path, monkeypatch)
+        _, full_sns, full_iam = run(
+            generate_fleet(100), tmp_path, monkeypatch, checkpoint=False
+        )
+
+        assert invocations == 3
+        # every page is listed once across the invocations
+        assert iam.calls["list_users"] == 10
+        assert iam.calls["list_user_tags"] == 100
+        assert iam.calls["update_access_key"] == full_iam.calls["update_access_key"]
+        assert len(sns.published) == 1
+        assert sns.published[0]["Message"] == full_sns.published[0]["Message"]
+        assert FileStore(str(tmp_path / "checkpoint.json")).load() is None
+
+    def test_no_checkpoint(self, monkeypatch, tmp_path):
+        """Without CHECKPOINT_URL the run ignores the time left"""
+        invocations, sns, iam = run(
+            generate_fleet(100), tmp_path, monkeypatch, checkpoint=False
+        )
+        assert invocations == 1
+        assert iam.calls["list_users"] == 10
@@ -0,0 +1,97 @@
+import datetime as dt
+
+import pytest
+
+from benchmarks.fakes import FakeIAM, generate_fleet
+from sleuth.auditor import Key, audit_account
+from sleuth.config import Config
+
+ENV = {"WARNING_AGE": "80", "EXPIRATION_AGE": "90"}
+
+
+class TestFromEnv:
+    def test_defaults(self):
+        """Optional settings fall back to the documented defaults"""
+        config = Config.from_env(ENV)
+        assert config.audit_ages == (80, 90, 90, 80)
+        assert not config.enable_auto_expire
+        assert not config.debug
+        assert config.collection_workers == 1
+        assert config.collection_mode == "api"
+        assert config.notify_routing == "channel"
+        assert config.audit_accounts == ()
+        assert config.titles[0] == "AWS IAM Key Expiration Report"
+
+    def test_parses(self):
+        """Values are parsed into their types once"""
+        config = Config.from_env(
+            dict(
+                ENV,
+                INACTIVITY_AGE="60",
+                INACTIVITY_WARNING_AGE="30",
+                ENABLE_AUTO_EXPIRE="true",
+                COLLECTION_WORKERS="8",
+                AUDIT_ACCOUNTS="111111111111, arn:aws:iam::2:role/x,",
+                OWNER_WEBHOOKS='{"U1": "https://hooks"}',
+            )
+        )
+        assert config.audit_ages == (80, 90, 60, 30)
+        assert config.enable_auto_expire
+        assert config.collection_workers == 8
+        assert config.audit_accounts == ("111111111111", "arn:aws:iam::2:role/x")
+        assert config.owner_webhooks == {"U1": "https://hooks"}
+
+    @pytest.mark.parametrize(
+        "env",
+        [
+            {"WARNING_AGE": "80"},
+            dict(ENV, INACTIVITY_AGE="60"),
+            dict(ENV, WARNING_AGE="eighty"),
+            dict(ENV, COLLECTION_WORKERS="0"),
+            dict(ENV, COLLECTION_MODE="ftp"),
+            dict(ENV, SNS_MODE="all"),
+            dict(ENV, OWNER_WEBHOOKS="[]"),
+            dict(ENV, COLLECTION_MODE="async", AUDIT_ACCOUNTS="111111111111"),
+            dict(ENV, CHECKPOINT_URL="/tmp/c.json", EXPORT_URL="/tmp/e.jsonl"),
+            dict(ENV, WARNING_AGE="90", EXPIRATION_AGE="90"),
+            dict(ENV, INACTIVITY_AGE="100", INACTIVITY_WARNING_AGE="80"),
+            dict(ENV, INACTIVITY_AGE="60", INACTIVITY_WARNING_AGE="60"),
+        ],
+    )
+    def test_invalid(self, env):
+        """Invalid settings fail before anything is collected"""
+        with pytest.raises(RuntimeError):
+            Config.from_env(env)
+
+
+class TestConfig:
+    def test_auto_expire_without_env(self, monkeypatch):
+        """Key.audit uses the passed setting instead of ENABLE_AUTO_EXPIRE"""
+        monkeypatch.delenv("ENABLE_AUTO_EXPIRE", raising=False)
+        now = dt.datetime.now(dt.timezone.utc)
+        key = Key("user1", "AKIA1", "Inactive", now, now, now)
+
+        key.audit(80, 90, 90, 80, auto_expire_enabled=True)
+        assert key.audit_state == "disabled"
+        key.audit(80, 90, 90, 80, auto_expire_enabled=False)
+        assert key.audit_state == "good"
+
+    def test_side_by_side(self, monkeypatch):
+        """Runs with different configs share a process without touching env"""
+        monkeypatch.delenv("WARNING_AGE", raising=False)
+        monkeypatch.delenv("EXPIRATION_AGE", raising=False)
+        now = dt.datetime(2020, 6, 1, tzinfo=dt.timezone.utc)
+        strict = Config(10, 20, 20, 10, collection_workers=4)
+        lenient = Config(1000, 2000, 2000, 1000)
+
+        strict_users = audit_account(
+            FakeIAM(generate_fleet(30, now=now)), now=now, config=strict
+        )
+        lenient_users = audit_account(
+            FakeIAM(generate_fleet(30, now=now)), now=now, config=lenient
+        )
+
+        strict_states = {k.audit_state for u in strict_users for k in u.keys}
+        lenient_states = {k.audit_state for u in lenient_users for k in u.keys}
+        assert strict_states - {"good"}
+        assert lenient_states == {"good"}
@@ -0,0 +1,233 @@
+import base64
+import datetime
+import functools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from benchmarks.fakes import FakeIAM, FakeOrganization, generate_fleet
+from sleuth import auditor, cache, directory, services
+from sleuth.config import Config
+from sleuth.directory import Directory, build_index, iter_members, load_directory
+from sleuth.store import FileStore
+
+MEMBERS = 25000
+TOKEN = "xoxb-test"
+
+
+def member(i):
+    return {
+        "id": "U{:08d}".format(i),
+        "name": "member{}".format(i),
+        "deleted": i % 1000 == 999,
+        "profile": {"email": "user{:06d}@example.com".format(i)},
+    }
+
+
+class StubSlackAPI(BaseHTTPRequestHandler):
+    """users.list with cursors, answers every fifth call with a 429"""
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with server.lock:
+            server.calls += 1
+            if server.calls % 5 == 0:
+                return self.reply(
+                    429, {"ok": False}, {"Retry-After": server.retry_after}
+                )
+
+        if url.path != "/api/users.list":
+            return self.reply(404, {"ok": False})
+        if self.headers["Authorization"] != "Bearer {}".format(TOKEN):
+            return self.reply(200, {"ok": False, "error": "invalid_auth"})
+
+        start = int(base64.b64decode(query.get("cursor", "MA==")))
+        end = min(start + min(int(query["limit"]), 1000), MEMBERS)
+        next_cursor = base64.b64encode(str(end).encode()).decode()
+        with server.lock:
+            server.pages += 1
+        self.reply(
+            200,
+            {
+                "ok": True,
+                "members": [member(i) for i in range(start, end)],
+                "response_metadata": {
+                    "next_cursor": next_cursor if end < MEMBERS else ""
+                },
+            },
+        )
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSlackAPI)
+    server.lock = threading.Lock()
+    server.calls = 0
+    server.pages = 0
+    server.retry_after = "0"
+    server.api_url = "http://127.0.0.1:{}/api/".format(server.server_port)
+    monkeypatch.setattr(directory, "SLACK_API_URL", server.api_url)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def config(tmp_path, **kwargs):
+    kwargs.setdefault("slack_api_token", TOKEN)
+    return Config(
+        80,
+        90,
+        90,
+        80,
+        directory_url=str(tmp_path / "directory.json"),
+        **kwargs,
+    )
+
+
+class TestIndex:
+    def test_resolve(self):
+        """Usernames match emails, handles, then unambiguous email local parts"""
+        members = [
+            {"id": "U1", "name": "alice", "profile": {"email": "Alice.Smith@a.com"}},
+            {
+                "id": "U2",
+                "name": "bob",
+                "profile": {"display_name_normalized": "Bobby"},
+            },
+            {"id": "U3", "name": "sam1", "profile": {"email": "sam@a.com"}},
+            {"id": "U4", "name": "sam2", "profile": {"email": "sam@b.com"}},
+            {"id": "U5", "name": "gone", "deleted": True, "profile": {}},
+            {"id": "B1", "name": "bot", "is_bot": True, "profile": {}},
+        ]
+        index = Directory(build_index(members))
+
+        assert index.resolve("alice.smith@a.com") == "U1"
+        assert index.resolve("Alice") == "U1"
+        assert index.resolve("alice.smith") == "U1"
+        assert index.resolve("bobby") == "U2"
+        assert index.resolve("sam@b.com") == "U4"
+        assert index.resolve("sam") is None
+        assert index.resolve("gone") is None
+        assert index.resolve("bot") is None
+
+    def test_fill(self):
+        """Only users whose Slack tag fell back to the username are filled"""
+        index = Directory(build_index([{"id": "U1", "name": "alice", "profile": {}}]))
+        untagged = auditor.User("id", "alice", "alice", "True", tags={"Slack": "alice"})
+        tagged = auditor.User("id", "alice", "U9", "True", tags={"Slack": "U9"})
+
+        assert index.fill(untagged)
+        assert (untagged.slack_id, untagged.tags["Slack"]) == ("U1", "alice")
+        assert not index.fill(tagged)
+        assert tagged.slack_id == "U9"
+
+
+class TestSync:
+    def test_pages(self, stub):
+        """Every page is followed through its cursor, 429s are retried"""
+        members = list(iter_members(TOKEN, api_url=stub.api_url, sleep=lambda s: None))
+
+        assert len(members) == MEMBERS
+        assert len({m["id"] for m in members}) == MEMBERS
+        assert stub.pages == MEMBERS // 200
+        assert stub.calls > stub.pages
+
+    def test_retry_after_date(self, stub):
+        """A Retry-After that is not a number of seconds falls back to backoff"""
+        stub.retry_after = "Wed, 21 Oct 2015 07:28:00 GMT"
+        delays = []
+        members = list(iter_members(TOKEN, api_url=stub.api_url, sleep=delays.append))
+        assert len(members) == MEMBERS
+        assert delays and set(delays) == {1}
+
+    def test_error(self, stub):
+        """Slack errors are raised"""
+        with pytest.raises(RuntimeError, match="invalid_auth"):
+            list(iter_members("xoxb-wrong", api_url=stub.api_url))
+
+    def test_load(self, stub, tmp_path):
+        """The index is synced once, then read back until it is stale"""
+        directory = load_directory(config(tmp_path))
+        assert len(directory) == MEMBERS - MEMBERS // 1000
+        assert directory.resolve("user000042") == "U00000042"
+        pages = stub.pages
+
+        # a cold container reads the saved index
+        cache.clear()
+        load_directory(config(tmp_path))
+        assert stub.pages == pages
+
+        store = FileStore(str(tmp_path / "directory.json"))
+        index = store.load()
+        index["synced"] = (
+            datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=25)
+        ).isoformat()
+        store.save(index)
+        cache.clear()
+        load_directory(config(tmp_path))
+        assert stub.pages == 2 * pages
+
+    def test_unset(self, tmp_path):
+        """No DIRECTORY_URL, or no index and no token, means no directory"""
+        assert load_directory(Config(80, 90, 90, 80)) is None
+        assert load_directory(config(tmp_path, slack_api_token=None)) is None
+
+
+class TestAudit:
+    def test_fill_untagged(self, stub, tmp_path, monkeypatch):
+        """Untagged users are notified under the Slack ID found in the directory"""
+        fleet = generate_fleet(500)
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        untagged = [
+            u["UserName"]
+            for u in fleet
+            if not any(t["Key"] == "Slack" for t in u["Tags"])
+        ]
+        assert untagged
+
+        users = auditor.audit_account(config=config(tmp_path, enable_auto_expire=False))
+
+        by_name = {u.username: u for u in users}
+        for username in untagged:
+            i = int(username[len("user") :])
+            expected = username if i % 1000 == 999 else "U{:08d}".format(i)
+            assert by_name[username].slack_id == expected
+
+    def test_accounts_sync_once(self, stub, tmp_path):
+        """Accounts audited in parallel share a single sync of the directory"""
+        org = FakeOrganization(accounts=4, users=10)
+        factory = functools.partial(
+            services.assume_role_client,
+            sts=org.sts,
+            client_factory=org.client_factory,
+        )
+
+        # nothing is shared through the process cache
+        cache.configure(ttl=0)
+        try:
+            auditor.audit_accounts(
+                org.account_ids, factory, workers=4, config=config(tmp_path)
+            )
+        finally:
+            cache.configure()
+        assert stub.pages == MEMBERS // 200
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeIAM, client_error, generate_fleet
+from sleuth import auditor, services
+from sleuth.disable import DisableExecutor
+
+
+class FailingIAM(FakeIAM):
+    """Fails the first failures update_access_key calls"""
+
+    def __init__(self, users, failures):
+        super().__init__(users)
+        self.failures = failures
+
+    def update_access_key(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            self._call("update_access_key")
+            raise client_error("ServiceFailure", "UpdateAccessKey")
+        return super().update_access_key(**kwargs)
+
+
+@pytest.fixture(autouse=True)
+def ages(monkeypatch):
+    monkeypatch.setenv("WARNING_AGE", "80")
+    monkeypatch.setenv("EXPIRATION_AGE", "90")
+    monkeypatch.setenv("ENABLE_AUTO_EXPIRE", "true")
+
+
+def expired_keys(users):
+    return [
+        (u, k)
+        for u in users
+        for k in u.keys
+        if k.audit_state in ("expire", "stagnant_expire")
+    ]
+
+
+class TestDisableExecutor:
+    def test_disables_concurrently(self):
+        """Every submitted key is disabled and reported"""
+        iam = FakeIAM(generate_fleet(200))
+        users = services.get_iam_users(iam=iam)
+        for u in users:
+            u.audit(80, 90, 90, 80)
+        keys = expired_keys(users)
+
+        disabler = DisableExecutor(workers=8)
+        for u, k in keys:
+            disabler.submit(k, u.username, iam)
+
+        assert disabler.close() == {
+            "planned": 0,
+            "disabled": len(keys),
+            "skipped": 0,
+            "failed": 0,
+        }
+        for _, k in keys:
+            assert iam._by_key[k.key_id]["Status"] == "Inactive"
+
+    def test_idempotent(self):
+        """Inactive and already submitted keys are skipped"""
+        iam = FakeIAM(generate_fleet(1))
+        user = services.get_iam_users(iam=iam)[0]
+        key = user.keys[0]
+
+        disabler = DisableExecutor()
+        disabler.submit(key, user.username, iam)
+        disabler.submit(key, user.username, iam)
+        assert disabler.close()["disabled"] == 1
+        assert key.status == "Inactive"
+
+        rerun = DisableExecutor()
+        rerun.submit(key, user.username, iam)
+        assert rerun.close()["skipped"] == 1
+        assert iam.calls["update_access_key"] == 1
+
+    def test_dry_run(self):
+        """A dry run only builds the plan"""
+        iam = FakeIAM(generate_fleet(1))
+        user = services.get_iam_users(iam=iam)[0]
+
+        disabler = DisableExecutor(dry_run=True)
+        disabler.submit(user.keys[0], user.username, iam, "123456789012")
+        assert disabler.close()["planned"] == 1
+
+        plan = disabler.plan()
+        assert plan["dry_run"] is True
+        assert plan["keys"][0]["account"] == "123456789012"
+        assert plan["keys"][0]["key_id"] == user.keys[0].key_id
+        assert iam.calls["update_access_key"] == 0
+
+    def test_retries(self):
+        """Errors are retried until the retries run out"""
+        delays = []
+        iam = FailingIAM(generate_fleet(10), failures=2)
+        user = next(u for u in services.get_iam_users(iam=iam) if len(u.keys) == 2)
+
+        disabler = DisableExecutor(retries=2, sleep=delays.append)
+        disabler.submit(user.keys[0], user.username, iam)
+        assert disabler.close()["disabled"] == 1
+        assert delays == [1.0, 2.0]
+
+        iam.failures = 3
+        disabler = DisableExecutor(retries=2, sleep=delays.append)
+        entry = disabler.submit(user.keys[1], user.username, iam)
+        assert disabler.close()["failed"] == 1
+        assert "ServiceFailure" in entry["error"]
+
+    def test_audit_plan(self, monkeypatch, tmp_path):
+        """audit writes the plan to DISABLE_PLAN_URL"""
+        iam = FakeIAM(generate_fleet(100))
+        monkeypatch.setattr(services, "IAM", iam)
+        monkeypatch.setenv("DISABLE_DRY_RUN", "true")
+        monkeypatch.setenv("DISABLE_PLAN_URL", str(tmp_path / "plan.json"))
+
+        auditor.audit(accounts=[])
+
+        with open(tmp_path / "plan.json") as f:
+            plan = json.load(f)
+        assert plan["summary"]["planned"] == len(plan["keys"]) > 0
+        assert iam.calls["update_access_key"] == 0
@@ -0,0 +1,109 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeIAM, FakeS3, generate_fleet
+from sleuth import auditor, services
+from sleuth.export import FIELDS, MIN_PART_SIZE, Exporter, MultipartUpload
+
+
+@pytest.fixture
+def fleet_iam(monkeypatch):
+    iam = FakeIAM(generate_fleet(200))
+    monkeypatch.setattr(services, "IAM", iam)
+    monkeypatch.setenv("WARNING_AGE", "80")
+    monkeypatch.setenv("EXPIRATION_AGE", "90")
+    return iam
+
+
+def key_count(iam):
+    return sum(max(len(u["Keys"]), 1) for u in iam.users)
+
+
+class TestMultipartUpload:
+    def test_parts(self):
+        """Data is uploaded in parts of part_size as it is written"""
+        s3 = FakeS3()
+        upload = MultipartUpload("bucket", "inventory", s3)
+        chunk = b"x" * (1024 * 1024)
+        for _ in range(12):
+            upload.write(chunk)
+        assert s3.calls["upload_part"] == 2
+        upload.close()
+
+        assert s3.calls["upload_part"] == 3
+        assert s3.objects[("bucket", "inventory")] == chunk * 12
+
+    def test_empty(self):
+        """An empty upload still creates the object"""
+        s3 = FakeS3()
+        MultipartUpload("bucket", "empty", s3).close()
+        assert s3.objects[("bucket", "empty")] == b""
+
+    def test_abort(self):
+        """Aborting drops the uploaded parts"""
+        s3 = FakeS3()
+        upload = MultipartUpload("bucket", "inventory", s3)
+        upload.write(b"x" * MIN_PART_SIZE)
+        upload.abort()
+        assert s3.aborted == 1
+        assert s3.uploads == {}
+        assert ("bucket", "inventory") not in s3.objects
+
+
+class TestExporter:
+    def test_jsonl(self, fleet_iam, monkeypatch, tmp_path):
+        """audit writes a row per key of every user to EXPORT_URL"""
+        monkeypatch.setenv("EXPORT_URL", str(tmp_path / "inventory.jsonl"))
+
+        auditor.audit(accounts=[])
+
+        with open(tmp_path / "inventory.jsonl") as f:
+            rows = [json.loads(line) for line in f]
+        assert len(rows) == key_count(fleet_iam)
+        assert set(rows[0]) == set(FIELDS)
+        assert {r["username"] for r in rows} == {u["UserName"] for u in fleet_iam.users}
+        assert {r["audit_state"] for r in rows} >= {"good", "expire"}
+
+    def test_csv_gzip_s3(self, fleet_iam):
+        """CSV rows are gzipped and uploaded to S3"""
+        s3 = FakeS3()
+        exporter = Exporter("s3://bucket/inventory.csv.gz", "csv", client=s3)
+        for u in auditor.audit_account(fleet_iam):
+            exporter.write_user(u)
+        assert exporter.close() == key_count(fleet_iam)
+
+        body = gzip.decompress(s3.objects[("bucket", "inventory.csv.gz")])
+        rows = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+        assert len(rows) == key_count(fleet_iam)
+        assert tuple(rows[0]) == FIELDS
+
+    def test_abort(self, fleet_iam, monkeypatch):
+        """A failed run does not leave a partial export in S3"""
+        s3 = FakeS3()
+        monkeypatch.setattr(
+            auditor, "Exporter", lambda url, fmt: Exporter(url, fmt, s3)
+        )
+        monkeypatch.setenv("EXPORT_URL", "s3://bucket/inventory.jsonl")
+        fleet_iam.users.append({"UserName": "broken"})
+
+        with pytest.raises(KeyError):
+            auditor.audit(accounts=[])
+        assert s3.aborted == 1
+        assert ("bucket", "inventory.jsonl") not in s3.objects
+
+    def test_parquet(self, fleet_iam, tmp_path):
+        """Parquet rows keep their column types"""
+        pq = pytest.importorskip("pyarrow.parquet")
+        path = str(tmp_path / "inventory.parquet")
+        exporter = Exporter(path, "parquet")
+        for u in auditor.audit_account(fleet_iam):
+            exporter.write_user(u)
+        exporter.close()
+
+        table = pq.read_table(path)
+        assert table.num_rows == key_count(fleet_iam)
+        assert str(table.schema.field("creation_age").type) == "int64"
@@ -0,0 +1,86 @@
+import json
+import logging
+
+from benchmarks.fakes import FakeIAM, FakeSlackSession, generate_fleet
+from sleuth import auditor, metrics, services
+from sleuth.metrics import Histogram, Metrics
+from sleuth.ratelimit import RateLimitedClient
+from sleuth.slack import SlackWebhook
+
+
+class TestMetrics:
+    def test_histogram(self):
+        """Quantiles are read from the bucket bounds"""
+        histogram = Histogram()
+        for ms in [1] * 90 + [30] * 9 + [20000]:
+            histogram.observe(ms)
+        assert histogram.quantile(0.5) == 5
+        assert histogram.quantile(0.99) == 50
+        assert histogram.quantile(1) == "+Inf"
+        assert histogram.buckets()["+Inf"] == 1
+        assert Histogram().quantile(0.5) is None
+
+    def test_stages(self):
+        """Calls count towards their stage, timers towards theirs"""
+        m = Metrics()
+        m.record_call("list_user_tags", 0.02)
+        m.record_call("list_user_tags", 0.03, error=True)
+        m.record_call("get_access_key_last_used", 0.01)
+        with m.timer("audit"):
+            pass
+
+        summary = m.summary()
+        assert summary["stages"]["tags"] == {"seconds": 0.05, "count": 2}
+        assert summary["stages"]["keys"]["count"] == 1
+        assert summary["stages"]["audit"]["count"] == 1
+        assert summary["operations"]["list_user_tags"]["errors"] == 1
+        assert summary["operations"]["list_user_tags"]["p50_ms"] == 25
+
+    def test_clients(self):
+        """Rate limited clients and Slack posts record every attempt"""
+        m = metrics.reset()
+        iam = FakeIAM(generate_fleet(10), throttle_every=4)
+        client = RateLimitedClient(iam, base_delay=0, sleep=lambda s: None)
+        for u in iam.users:
+            client.list_user_tags(UserName=u["UserName"])
+        SlackWebhook("https://hooks", session=FakeSlackSession()).post({"text": "x"})
+
+        operations = m.summary()["operations"]
+        assert (
+            operations["list_user_tags"]["calls"]
+            == 10 + iam.throttles["list_user_tags"]
+        )
+        assert operations["list_user_tags"]["errors"] == iam.throttles["list_user_tags"]
+        assert operations["slack_post"]["calls"] == 1
+
+
+class TestPublish:
+    def test_audit(self, monkeypatch, caplog, capsys):
+        """audit logs one summary record and prints EMF documents"""
+        iam = FakeIAM(generate_fleet(50))
+        monkeypatch.setattr(services, "IAM", RateLimitedClient(iam, rate=1e6))
+        monkeypatch.setenv("WARNING_AGE", "80")
+        monkeypatch.setenv("EXPIRATION_AGE", "90")
+        monkeypatch.setenv("METRICS_EMF", "true")
+
+        with caplog.at_level(logging.INFO, logger="sleuth"):
+            auditor.audit(accounts=[])
+
+        records = [r for r in caplog.records if hasattr(r, "metrics")]
+        assert len(records) == 1
+        stages = records[0].metrics["stages"]
+        assert {"list", "tags", "keys", "audit", "report", "run"} <= set(stages)
+        assert stages["tags"]["count"] == 50
+        assert stages["audit"]["count"] == 50
+
+        documents = [
+            json.loads(line)
+            for line in capsys.readouterr().out.splitlines()
+            if line.startswith('{"_aws"')
+        ]
+        dimensions = {d.get("Stage") or d.get("Operation") for d in documents}
+        assert {"run", "list_user_tags"} <= dimensions
+        for d in documents:
+            directive = d["_aws"]["CloudWatchMetrics"][0]
+            assert directive["Namespace"] == "IAMSleuth"
+            assert all(metric["Name"] in d for metric in directive["Metrics"])
@@ -0,0 +1,60 @@
+import datetime as dt
+
+from benchmarks.bench_pipeline import STAGES, run_pipeline
+from benchmarks.fakes import generate_fleet
+
+USERS = 300
+
+
+def fleet_keys():
+    now = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+    return [k for u in generate_fleet(USERS, now=now) for k in u["Keys"]]
+
+
+class TestPipelineBudget:
+    """AWS call budgets of every stage, so extra calls per user fail in CI"""
+
+    def test_api(self):
+        """The API collection makes one call per user and key, nothing else does"""
+        stages = {s["stage"]: s for s in run_pipeline(USERS)}
+        assert tuple(stages) == STAGES
+
+        assert stages["collect"]["calls"] == {
+            "list_users": 3,
+            "list_user_tags": USERS,
+            "list_access_keys": USERS,
+            "get_access_key_last_used": len(fleet_keys()),
+        }
+        assert stages["audit"]["calls"] == {}
+        assert stages["report"]["calls"] == {}
+        assert 0 < stages["disable"]["calls"]["update_access_key"] < len(fleet_keys())
+        assert stages["notify"]["calls"]["publish"] == 1
+        assert stages["notify"]["calls"]["get_parameter"] == 1
+
+    def test_credential_report(self):
+        """The credential report replaces the per user key calls"""
+        stages = {s["stage"]: s for s in run_pipeline(USERS, mode="credential_report")}
+        assert set(stages["collect"]["calls"]) == {
+            "generate_credential_report",
+            "get_credential_report",
+            "list_user_tags",
+        }
+        assert stages["collect"]["calls"]["list_user_tags"] == USERS
+
+    def test_bulk_tags(self):
+        """Bulk tags replace list_user_tags for every user with tags"""
+        untagged = sum(1 for u in generate_fleet(USERS) if not u["Tags"])
+        for mode in ("api", "credential_report"):
+            stages = {
+                s["stage"]: s for s in run_pipeline(USERS, mode=mode, tag_source="bulk")
+            }
+            calls = stages["collect"]["calls"]
+            assert calls["get_account_authorization_details"] == 1
+            assert calls["list_user_tags"] == untagged
+            assert "list_users" not in calls
+
+    def test_throttled(self):
+        """Throttled calls are retried without changing the results"""
+        stages = {s["stage"]: s for s in run_pipeline(USERS, throttle_every=5)}
+        assert stages["collect"]["throttles"] > 0
+        assert stages["collect"]["calls"]["list_user_tags"] == USERS
@@ -0,0 +1,135 @@
+import dataclasses
+import datetime as dt
+import json
+
+import pytest
+
+from benchmarks.fakes import FakeIAM, generate_fleet
+from sleuth.auditor import User, audit_account
+from sleuth.config import Config
+from sleuth.policy import Policy, PolicyIndex, load_policy
+
+DEFAULT = Policy("default", (80, 90, 90, 80))
+
+RULES = [
+    {"name": "breakglass", "username": "breakglass", "auto_expire": False},
+    {"name": "ci", "username": "ci-*", "expiration_age": 180, "warning_age": 170},
+    {"name": "service", "tag": {"Type": "service"}, "expiration_age": 365},
+    {
+        "name": "contractors",
+        "path": "/contractors/",
+        "expiration_age": 30,
+        "warning_age": 20,
+        "inactivity_age": 30,
+        "inactivity_warning_age": 20,
+    },
+    {
+        "name": "deploy",
+        "username": "ci-*-deploy",
+        "expiration_age": 7,
+        "warning_age": 5,
+        "inactivity_age": 7,
+        "inactivity_warning_age": 5,
+    },
+]
+
+
+def user(username, tags=None, path="/"):
+    return User(None, username, tags=tags, path=path)
+
+
+class TestPolicyIndex:
+    def test_resolve(self):
+        """Users get the policy of the first rule they match"""
+        index = PolicyIndex(RULES, DEFAULT)
+        assert index.resolve(user("breakglass")).auto_expire is False
+        assert index.resolve(user("ci-app-deploy")).name == "ci"
+        assert index.resolve(user("bot", {"Type": "service"})).name == "service"
+        assert index.resolve(user("bob", path="/contractors/acme/")).name == (
+            "contractors"
+        )
+        assert index.resolve(user("bob", path="/staff/")) is DEFAULT
+        assert index.resolve(user("ci")) is DEFAULT
+
+    def test_first_rule_wins(self):
+        """Rule order decides between matches of different kinds"""
+        index = PolicyIndex(RULES, DEFAULT)
+        u = user("ci-tool", {"Type": "service"}, "/contractors/")
+        assert index.resolve(u).name == "ci"
+        u = user("bot", {"Type": "service"}, "/contractors/")
+        assert index.resolve(u).name == "service"
+
+    def test_same_as_scan(self):
+        """The index agrees with checking every rule in order"""
+        rules = []
+        for i in range(60):
+            rules.append({"name": "t{}".format(i), "tag": {"Team": str(i % 7)}})
+            rules.append({"name": "p{}".format(i), "path": "/p{}/".format(i % 5)})
+            rules.append({"name": "n{}".format(i), "username": "u{}*".format(i % 9)})
+        index = PolicyIndex(rules, DEFAULT)
+
+        def scan(u):
+            for rule in rules:
+                if "tag" in rule and rule["tag"].items() <= u.tags.items():
+                    return rule["name"]
+                if "path" in rule and u.path.startswith(rule["path"]):
+                    return rule["name"]
+                if "username" in rule and u.username.startswith(rule["username"][:-1]):
+                    return rule["name"]
+            return "default"
+
+        for i in range(200):
+            u = user("u{}".format(i), {"Team": str(i % 11)}, "/p{}/x/".format(i % 6))
+            assert index.resolve(u).name == scan(u)
+
+    def test_defaults_fill_in(self):
+        """Thresholds a rule leaves out come from the global ones"""
+        index = PolicyIndex(RULES, DEFAULT)
+        assert index.resolve(user("ci-a")).ages == (170, 180, 90, 80)
+
+    @pytest.mark.parametrize(
+        "rule",
+        [
+            {"name": "none"},
+            {"name": "two", "username": "a", "path": "/a/"},
+            {"name": "path", "path": "a"},
+            {"name": "tag", "tag": {"a": "1", "b": "2"}},
+            {"name": "ages", "username": "a", "expiration_age": 10},
+            {"name": "expire", "username": "a", "auto_expire": "no"},
+        ],
+    )
+    def test_invalid(self, rule):
+        """Broken rules fail when the index is built"""
+        with pytest.raises(RuntimeError):
+            PolicyIndex([rule], DEFAULT)
+
+
+class TestAudit:
+    def test_load(self, tmp_path):
+        """Rules are read from POLICY_URL"""
+        path = tmp_path / "policy.json"
+        path.write_text(json.dumps({"rules": RULES}))
+        config = Config(80, 90, 90, 80, policy_url=str(path))
+        assert len(load_policy(config)) == len(RULES)
+
+        config = dataclasses.replace(config, policy_url=str(tmp_path / "missing"))
+        with pytest.raises(RuntimeError):
+            load_policy(config)
+
+    def test_audit_account(self):
+        """Keys are audited with the thresholds of their user's policy"""
+        now = dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc)
+        fleet = generate_fleet(50, now=now)
+        for u in fleet[:25]:
+            u["Tags"].append({"Key": "Type", "Value": "service"})
+        config = Config(10, 20, 20, 10)
+        policy = PolicyIndex(
+            [{"tag": {"Type": "service"}, "auto_expire": False}],
+            Policy("default", config.audit_ages),
+        )
+
+        users = audit_account(FakeIAM(fleet), now=now, config=config, policy=policy)
+
+        for u in users[:25]:
+            assert {k.audit_state for k in u.keys} <= {"good"}
+        assert {k.audit_state for u in users[25:] for k in u.keys} - {"good"}
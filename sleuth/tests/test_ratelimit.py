@@ -0,0 +1,121 @@
+import threading
+
+import pytest
+from botocore.exceptions import ClientError
+
+from benchmarks.fakes import FakeIAM, client_error, generate_fleet
+from sleuth import services
+from sleuth.ratelimit import RateLimitedClient, TokenBucket
+
+
+class FakeClock:
+    """Clock that only moves when something sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now += seconds
+
+
+class WindowThrottleClient:
+    """Throttles when more than limit calls land in the same second"""
+
+    def __init__(self, clock, limit):
+        self.clock = clock
+        self.limit = limit
+        self.windows = {}
+        self.throttles = 0
+
+    def get_user(self, UserName):
+        window = int(self.clock())
+        self.windows[window] = self.windows.get(window, 0) + 1
+        if self.windows[window] > self.limit:
+            self.throttles += 1
+            raise client_error("Throttling", "GetUser")
+        return {"User": {"UserName": UserName}}
+
+
+class TestTokenBucket:
+    def test_rate(self):
+        """Calls past the burst are spaced out to the rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+        for _ in range(110):
+            bucket.acquire()
+        assert clock.now == pytest.approx(10, abs=0.2)
+
+    def test_adaptive(self):
+        """Throttles halve the rate, successes recover it"""
+        clock = FakeClock()
+        bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+        bucket.throttled()
+        bucket.throttled()
+        assert bucket.rate == 2.5
+        for _ in range(100):
+            bucket.succeeded()
+        assert bucket.rate == 10
+
+
+class TestRateLimitedClient:
+    def test_retries_throttles(self):
+        """Throttled calls are retried and counted"""
+        clock = FakeClock()
+        iam = FakeIAM(generate_fleet(20), throttle_every=3)
+        client = RateLimitedClient(iam, clock=clock, sleep=clock.sleep)
+
+        for u in iam.users:
+            client.list_user_tags(UserName=u["UserName"])
+
+        stats = client.stats()["list_user_tags"]
+        assert iam.calls["list_user_tags"] == 20
+        assert stats["throttles"] == iam.throttles["list_user_tags"]
+        assert stats["retries"] == stats["throttles"]
+        assert stats["calls"] == 20 + stats["throttles"]
+
+    def test_other_errors_raise(self):
+        """Errors that are not throttles or transient are not retried"""
+        clock = FakeClock()
+        client = RateLimitedClient(FakeIAM([]), clock=clock, sleep=clock.sleep)
+        with pytest.raises(ClientError):
+            client.list_user_tags(UserName="missing")
+        assert client.stats()["list_user_tags"]["retries"] == 0
+
+    def test_gives_up(self):
+        """Throttles past max_retries are raised"""
+        clock = FakeClock()
+        iam = FakeIAM(generate_fleet(1), throttle_every=1)
+        client = RateLimitedClient(iam, max_retries=3, clock=clock, sleep=clock.sleep)
+        with pytest.raises(ClientError):
+            client.list_user_tags(UserName="user000000")
+        assert client.stats()["list_user_tags"]["calls"] == 4
+
+    def test_throughput(self):
+        """Starting above the API limit converges instead of failing the audit"""
+        clock = FakeClock()
+        api = WindowThrottleClient(clock, limit=10)
+        client = RateLimitedClient(api, rate=40, clock=clock, sleep=clock.sleep)
+
+        for i in range(300):
+            client.get_user(UserName=str(i))
+
+        # a perfect client would need 30 seconds for 300 calls at 10/s
+        assert clock.now < 60
+        assert client.stats()["get_user"]["throttles"] == api.throttles
+
+    def test_collection(self, monkeypatch):
+        """Concurrent collection through a throttling API returns every user"""
+        clock = FakeClock()
+        fleet = generate_fleet(40)
+        iam = FakeIAM(fleet, page_size=7, throttle_every=4)
+        client = RateLimitedClient(iam, clock=clock, sleep=clock.sleep)
+        monkeypatch.setattr(services, "IAM", client)
+
+        users = services.get_iam_users(workers=4)
+        assert [u.username for u in users] == [u["UserName"] for u in fleet]
+        assert sum(s["throttles"] for s in client.stats().values()) > 0
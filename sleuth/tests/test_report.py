@@ -0,0 +1,50 @@
+from benchmarks.bench_report import generate_users, legacy_slack_lines, legacy_sns_lines
+from sleuth.report import Report
+from sleuth.services import (
+    format_slack_user,
+    format_username,
+    prepare_slack_message,
+    prepare_sns_message,
+)
+
+
+class TestReport:
+    def test_matches_per_format_loops(self):
+        """Lines rendered from the report match walking the users per format"""
+        users = generate_users(2000)
+        report = Report(users)
+
+        assert legacy_sns_lines(users) == (
+            report.lines(format_username, "old", "expire"),
+            report.lines(format_username, "stagnant", "stagnant_expire"),
+        )
+        assert legacy_slack_lines(users) == tuple(
+            report.lines(format_slack_user, state)
+            for state in ("old", "stagnant", "expire", "stagnant_expire")
+        )
+
+    def test_messages_from_report(self):
+        """The message formatters accept a report in place of the users"""
+        users = generate_users(200)
+        report = Report(users)
+
+        assert prepare_sns_message(report, "t", "a", "t2", "a2") == (
+            prepare_sns_message(users, "t", "a", "t2", "a2")
+        )
+        assert prepare_slack_message(report, "t", "a", "t2", "a2") == (
+            prepare_slack_message(users, "t", "a", "t2", "a2")
+        )
+
+    def test_nothing_to_report(self):
+        """Only keys in a notified state are added"""
+        users = generate_users(200)
+        for u in users:
+            for k in u.keys:
+                k.audit_state = "good"
+        report = Report()
+        for u in users:
+            report.add(u)
+
+        assert not report
+        assert len(report) == 0
+        assert prepare_slack_message(report, "t", "a", "t2", "a2")[0] is False
@@ -0,0 +1,131 @@
+import threading
+import time
+
+from benchmarks.bench_report import generate_users
+from benchmarks.fakes import FakeSNS
+from sleuth import services
+from sleuth.report import Report
+from sleuth.routing import deliver_by_owner, prepare_owner_digest
+
+TITLES = ("Expiring", "Rotate", "Inactive", "Log in")
+
+
+class FakeWebhook:
+    """Records posted digests, taking latency seconds per post"""
+
+    posts = []
+    lock = threading.Lock()
+    latency = 0.0
+
+    def __init__(self, url, session=None):
+        self.url = url
+
+    def send(self, payload):
+        time.sleep(self.latency)
+        with self.lock:
+            self.posts.append((self.url, payload))
+        return True
+
+
+class FailingWebhook(FakeWebhook):
+    """Raises for the first owner's webhook"""
+
+    def send(self, payload):
+        if self.url == "https://owner0":
+            raise RuntimeError("boom")
+        return super().send(payload)
+
+
+def owner_report(owners):
+    users = generate_users(400)
+    for i, u in enumerate(users):
+        u.slack_id = "U{:04d}".format(i % owners)
+    return Report(users)
+
+
+class TestRouting:
+    def setup_method(self):
+        FakeWebhook.posts = []
+        FakeWebhook.latency = 0.0
+
+    def test_by_owner(self):
+        """Findings are grouped by Slack ID in the order they were found"""
+        report = owner_report(7)
+        owners = report.by_owner()
+
+        assert len(owners) == 7
+        assert sum(len(r) for r in owners.values()) == len(report)
+        for slack_id, r in owners.items():
+            assert {u.slack_id for u, _ in r.items("old", "expire")} <= {slack_id}
+
+    def test_digest(self):
+        """The owner is mentioned once, lines name the IAM users"""
+        slack_id, report = next(iter(owner_report(7).by_owner().items()))
+        msg = prepare_owner_digest(slack_id, report, TITLES)
+
+        assert msg["text"].startswith("<@{}>".format(slack_id))
+        assert msg["text"].endswith(str(len(report)))
+        for a in msg["attachments"]:
+            for f in a.get("fields", []):
+                assert "<@" not in f["value"]
+
+    def test_concurrent_delivery(self):
+        """Digests go to the owner's webhook or the fallback, several at once"""
+        FakeWebhook.latency = 0.05
+        report = owner_report(20)
+        webhooks = {"U0000": "https://owner0", "U0001": "https://owner1"}
+
+        start = time.perf_counter()
+        summary = deliver_by_owner(
+            report,
+            TITLES,
+            slack_url="https://channel",
+            webhooks=webhooks,
+            workers=10,
+            webhook_factory=FakeWebhook,
+        )
+        elapsed = time.perf_counter() - start
+
+        assert summary == {"owners": 20, "delivered": 20, "failed": 0, "unrouted": 0}
+        assert elapsed < 20 * FakeWebhook.latency
+        urls = sorted(url for url, _ in FakeWebhook.posts)
+        assert urls == ["https://channel"] * 18 + ["https://owner0", "https://owner1"]
+
+    def test_sns_attributes(self, monkeypatch):
+        """Digests published to SNS carry the owner as a message attribute"""
+        sns = FakeSNS()
+        monkeypatch.setattr(services, "SNS", sns)
+        # the debug setting passed in wins over the environment
+        monkeypatch.setenv("DEBUG", "true")
+
+        summary = deliver_by_owner(
+            owner_report(5), TITLES, sns_topic="arn:topic", debug=False
+        )
+
+        assert summary["delivered"] == 5
+        assert sorted(
+            p["MessageAttributes"]["slack_id"]["StringValue"] for p in sns.published
+        ) == ["U{:04d}".format(i) for i in range(5)]
+
+    def test_unrouted(self):
+        """Owners without any destination are counted"""
+        summary = deliver_by_owner(
+            owner_report(3),
+            TITLES,
+            webhooks={"U0000": "x"},
+            webhook_factory=FakeWebhook,
+        )
+        assert summary["delivered"] == 1
+        assert summary["unrouted"] == 2
+
+    def test_failure_isolated(self):
+        """An owner whose delivery raises does not stop the others"""
+        summary = deliver_by_owner(
+            owner_report(5),
+            TITLES,
+            slack_url="https://channel",
+            webhooks={"U0000": "https://owner0"},
+            webhook_factory=FailingWebhook,
+        )
+        assert summary == {"owners": 5, "delivered": 4, "failed": 1, "unrouted": 0}
+        assert len(FakeWebhook.posts) == 4
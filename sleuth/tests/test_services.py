@@ -1,5 +1,10 @@
 import datetime
 
+import pytest
+
+from benchmarks.bench_importtime import import_handler
+from benchmarks.fakes import FakeIAM, FakeSNS, generate_fleet
+from sleuth import services
 from sleuth.auditor import Key, User
 from sleuth.services import format_slack_id, prepare_slack_message, prepare_sns_message
 
@@ -105,3 +110,139 @@ class TestFormatSlackID:
         assert msg["attachments"][4]["title"] == t2
         assert msg["attachments"][4]["text"] == tadd
         assert msg["attachments"][5]["title"] == stgn
+
+
+class TestCredentialReport:
+    def test_matches_api_collection(self, monkeypatch):
+        """Users and keys from the credential report match the per user API calls"""
+        fleet = generate_fleet(50, now=created + datetime.timedelta(days=100))
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet, page_size=7))
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_POLL_INTERVAL", 0)
+
+        api_users = services.get_iam_users()
+        report_users = services.get_iam_users_from_credential_report()
+
+        assert [u.username for u in report_users] == [u.username for u in api_users]
+        for api_user, report_user in zip(api_users, report_users):
+            assert report_user.slack_id == api_user.slack_id
+            assert report_user.auto_expire == api_user.auto_expire
+            assert [
+                (k.status, k.created, k.inactivity_age) for k in report_user.keys
+            ] == [(k.status, k.created, k.inactivity_age) for k in api_user.keys]
+
+    def test_fewer_calls(self, monkeypatch):
+        """Key info comes from the report, only tags are fetched per user"""
+        iam = FakeIAM(generate_fleet(50), page_size=7)
+        monkeypatch.setattr(services, "IAM", iam)
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_POLL_INTERVAL", 0)
+
+        services.get_iam_users_from_credential_report()
+        assert iam.calls["list_user_tags"] == 50
+        assert iam.calls["list_access_keys"] == 0
+        assert iam.calls["get_access_key_last_used"] == 0
+        assert iam.calls["get_credential_report"] == 1
+
+    def test_disable_resolves_key_id(self, monkeypatch):
+        """Keys built from the report look up their ID only when disabled"""
+        fleet = generate_fleet(5)
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_POLL_INTERVAL", 0)
+
+        user = next(
+            u for u in services.get_iam_users_from_credential_report() if u.keys
+        )
+        key = user.keys[0]
+        assert key.key_id is None
+
+        services.disable_key(key, user.username)
+        assert key.key_id == fleet[int(user.username[4:])]["Keys"][0]["AccessKeyId"]
+        assert iam.calls["list_access_keys"] == 1
+        assert iam.calls["update_access_key"] == 1
+
+    def test_streams_batches(self, monkeypatch):
+        """Tags are fetched a batch ahead of the users handed out"""
+        iam = FakeIAM(generate_fleet(50))
+        monkeypatch.setattr(services, "IAM", iam)
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_POLL_INTERVAL", 0)
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_BATCH_SIZE", 10)
+
+        users = services.iter_iam_users_from_credential_report(workers=2)
+        assert next(users).slack_id is not None
+        assert iam.calls["list_user_tags"] <= 20
+        assert len(list(users)) == 49
+
+
+class TestBulkTags:
+    def test_matches_per_user_tags(self, monkeypatch):
+        """Tags listed with the users match the per user calls"""
+        fleet = generate_fleet(2500, now=created)
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        untagged = sum(1 for u in fleet if not u["Tags"])
+
+        bulk_users = services.get_iam_users(list_pages=services.list_user_details_pages)
+
+        assert iam.calls["get_account_authorization_details"] == 3
+        # users without tags come without a Tags entry and are asked for them
+        assert iam.calls["list_user_tags"] == untagged
+        assert [(u.username, u.path, u.tags) for u in bulk_users] == [
+            (u.username, u.path, u.tags) for u in services.get_iam_users()
+        ]
+
+    def test_credential_report(self, monkeypatch):
+        """The credential report takes its tags from the bulk map"""
+        fleet = generate_fleet(50)
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        monkeypatch.setattr(services, "CREDENTIAL_REPORT_POLL_INTERVAL", 0)
+
+        tags = services.get_user_tags_bulk()
+        users = services.get_iam_users_from_credential_report(tags=tags)
+
+        assert iam.calls["list_user_tags"] == 50 - len(tags)
+        assert [u.slack_id for u in users] == [
+            u.slack_id for u in services.get_iam_users_from_credential_report()
+        ]
+
+
+class TestCollectionWorkers:
+    def test_order_matches_serial(self, monkeypatch):
+        """Concurrent enrichment returns users in list_users order"""
+        fleet = generate_fleet(60)
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet, page_size=9, latency=0.001))
+
+        users = services.get_iam_users(workers=8)
+        assert [u.username for u in users] == [u["UserName"] for u in fleet]
+        assert [[k.key_id for k in u.keys] for u in users] == [
+            [k["AccessKeyId"] for k in u["Keys"]] for u in fleet
+        ]
+
+    def test_workers_from_env(self, monkeypatch):
+        """COLLECTION_WORKERS must be a positive number"""
+        monkeypatch.setenv("COLLECTION_WORKERS", "4")
+        assert services.get_collection_workers() == 4
+
+        monkeypatch.setenv("COLLECTION_WORKERS", "0")
+        with pytest.raises(RuntimeError):
+            services.get_collection_workers()
+
+
+class TestLazyClients:
+    def test_cold_start(self):
+        """Importing the handler builds no clients and skips optional modules"""
+        _, clients, lazy, _ = import_handler()
+        assert clients == []
+        assert lazy == []
+
+    def test_cached(self):
+        """Clients are built once and shared"""
+        assert services.get_client("ssm") is services.get_client("ssm")
+        assert services.SSM is services.get_client("ssm")
+
+    def test_override(self, monkeypatch):
+        """A client assigned to the module attribute is used instead"""
+        sns = FakeSNS()
+        monkeypatch.setattr(services, "SNS", sns)
+        assert services.send_sns_message("arn:topic", "message")
+        assert sns.calls["publish"] == 1
@@ -0,0 +1,137 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.bench_report import generate_users
+from sleuth.services import prepare_slack_message
+from sleuth.slack import MAX_FIELD_LENGTH, SlackWebhook, chunk_message, split_lines
+
+
+class StubSlack(BaseHTTPRequestHandler):
+    """Webhook that enforces size limits and answers every third post with a 429"""
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.posts += 1
+            if server.posts % 3 == 0:
+                return self.reply(
+                    429, "rate_limited", {"Retry-After": server.retry_after}
+                )
+
+        payload = json.loads(body)
+        if len(body) > server.max_bytes:
+            return self.reply(400, "msg_too_long")
+        if len(payload["attachments"]) > server.max_attachments:
+            return self.reply(400, "too_many_attachments")
+        for a in payload["attachments"]:
+            for f in a.get("fields", []):
+                if len(f["value"]) > server.max_field:
+                    return self.reply(400, "field_too_long")
+
+        with server.lock:
+            server.messages.append(payload)
+        self.reply(200, "ok")
+
+    def reply(self, status, text, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(text)))
+        self.end_headers()
+        self.wfile.write(text.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubSlack)
+    server.lock = threading.Lock()
+    server.posts = 0
+    server.messages = []
+    server.max_bytes = 40000
+    server.retry_after = "2"
+    server.max_attachments = 100
+    server.max_field = MAX_FIELD_LENGTH
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def message_lines(messages):
+    return [
+        line
+        for m in messages
+        for a in m["attachments"]
+        for f in a.get("fields", [])
+        for line in f["value"].split("\n")
+    ]
+
+
+class TestChunking:
+    def test_split_lines(self):
+        """Chunks stay under the limit and join back to the text"""
+        text = "\n".join("line {}".format(i) for i in range(500))
+        chunks = split_lines(text, 100)
+        assert max(len(c) for c in chunks) <= 100
+        assert "\n".join(chunks) == text
+
+    def test_small_message(self):
+        """Messages under the limits are left alone"""
+        _, msg = prepare_slack_message(generate_users(20), "t", "a", "t2", "a2")
+        assert chunk_message(msg) == [msg]
+
+    def test_large_message(self):
+        """Every line ends up in a message under the limits, in order"""
+        _, msg = prepare_slack_message(generate_users(5000), "t", "a", "t2", "a2")
+        messages = chunk_message(msg, max_attachments=5, max_bytes=10000)
+
+        assert len(messages) > 1
+        assert message_lines(messages) == message_lines([msg])
+        for m in messages:
+            assert len(m["attachments"]) <= 5
+            assert len(json.dumps(m)) <= 10000
+
+
+class TestSlackWebhook:
+    def test_delivers_in_order(self, stub):
+        """A large report is posted in parts that all get accepted in order"""
+        _, msg = prepare_slack_message(generate_users(5000), "t", "a", "t2", "a2")
+        assert len(json.dumps(msg)) > stub.max_bytes
+
+        delays = []
+        webhook = SlackWebhook(
+            "http://127.0.0.1:{}/hook".format(stub.server_port), sleep=delays.append
+        )
+        assert webhook.send(msg)
+
+        assert len(stub.messages) > 1
+        assert message_lines(stub.messages) == message_lines([msg])
+        assert stub.messages[0]["attachments"][0]["title"] == "t"
+        # every third post was rate limited and retried after Retry-After
+        assert delays == [2.0] * (stub.posts // 3)
+
+    def test_retry_after_date(self, stub):
+        """A Retry-After that is not a number of seconds falls back to backoff"""
+        stub.retry_after = "Wed, 21 Oct 2015 07:28:00 GMT"
+        delays = []
+        webhook = SlackWebhook(
+            "http://127.0.0.1:{}/hook".format(stub.server_port), sleep=delays.append
+        )
+        for _ in range(3):
+            assert webhook.post({"attachments": [{"title": "t"}]})
+        assert delays == [1]
+
+    def test_rejected(self, stub):
+        """Messages Slack rejects are not retried"""
+        stub.max_attachments = 0
+        webhook = SlackWebhook("http://127.0.0.1:{}/hook".format(stub.server_port))
+        assert webhook.post({"attachments": [{"title": "t"}]}) is False
+        assert stub.posts == 1
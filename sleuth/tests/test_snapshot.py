@@ -0,0 +1,206 @@
+import dataclasses
+import datetime
+
+from benchmarks.fakes import FakeIAM, FakeS3, generate_fleet
+from sleuth import services
+from sleuth.auditor import get_schedule_version
+from sleuth.config import Config
+from sleuth.policy import Policy, PolicyIndex, load_policy
+from sleuth.snapshot import SnapshotCollector
+from sleuth.store import FileStore, S3Store, get_store
+
+now = datetime.datetime(2019, 6, 1, tzinfo=datetime.timezone.utc)
+
+
+def key_tuples(users):
+    return [
+        (
+            u.username,
+            u.slack_id,
+            u.auto_expire,
+            k.key_id,
+            k.status,
+            k.created,
+            k.inactivity_age,
+        )
+        for u in users
+        for k in u.keys
+    ]
+
+
+def collect_audited(store, when, **kwargs):
+    collector = SnapshotCollector(store, now=when, schedule_version="1", **kwargs)
+    users = services.get_iam_users(build_user=collector.build_user, now=when)
+    for u in users:
+        u.audit(80, 90, 90, 80, auto_expire_enabled=True)
+    collector.save()
+    return users
+
+
+def collect(store, **kwargs):
+    collector = SnapshotCollector(store, now=now, **kwargs)
+    users = services.get_iam_users(build_user=collector.build_user)
+    collector.save()
+    return users
+
+
+class TestStore:
+    def test_file_store(self, tmp_path):
+        """Documents round trip through a file, missing file loads as None"""
+        store = get_store(str(tmp_path / "snapshot.json"))
+        assert isinstance(store, FileStore)
+        assert store.load() is None
+        store.save({"a": [1, 2]})
+        assert store.load() == {"a": [1, 2]}
+
+    def test_s3_store(self):
+        """Documents round trip through S3, missing object loads as None"""
+        s3 = FakeS3()
+        store = get_store("s3://bucket/path/snapshot.json", client=s3)
+        assert isinstance(store, S3Store)
+        assert store.key == "path/snapshot.json"
+        assert store.load() is None
+        store.save({"a": 1})
+        assert store.load() == {"a": 1}
+
+
+class TestSnapshotCollector:
+    def test_second_run_reuses(self, monkeypatch, tmp_path):
+        """Unchanged users only cost a list_access_keys call on the next run"""
+        fleet = generate_fleet(100, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        first = collect(store, last_used_refresh_age=80)
+
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        second = collect(store, last_used_refresh_age=80)
+
+        assert key_tuples(second) == key_tuples(first)
+        assert iam.calls["list_user_tags"] == 0
+        assert iam.calls["list_access_keys"] == 100
+        # only keys unused for 80+ days get their last used date refreshed
+        stale = [
+            k
+            for u in fleet
+            for k in u["Keys"]
+            if (now - k.get("LastUsedDate", k["CreateDate"])).days >= 80
+        ]
+        assert iam.calls["get_access_key_last_used"] == len(stale)
+
+    def test_changes_are_fetched(self, monkeypatch, tmp_path):
+        """Users with a new list_users entry or new keys are fetched again"""
+        fleet = generate_fleet(10, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        collect(store)
+
+        fleet[0]["Path"] = "/moved/"
+        fleet[1]["Keys"].append(
+            {"AccessKeyId": "AKIANEW", "Status": "Active", "CreateDate": now}
+        )
+        fleet[1]["Tags"] = [{"Key": "Slack", "Value": "UNEW"}]
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        users = collect(store)
+
+        assert iam.calls["list_user_tags"] == 2
+        assert users[1].slack_id == "UNEW"
+        assert users[1].keys[-1].key_id == "AKIANEW"
+
+    def test_full_refresh(self, monkeypatch, tmp_path):
+        """Every full_refresh_runs runs everything is fetched again"""
+        fleet = generate_fleet(10, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+
+        tag_calls = []
+        for _ in range(6):
+            iam = FakeIAM(fleet)
+            monkeypatch.setattr(services, "IAM", iam)
+            collect(store, full_refresh_runs=3)
+            tag_calls.append(iam.calls["list_user_tags"])
+
+        assert tag_calls == [10, 0, 0, 10, 0, 0]
+
+    def test_schedule(self, monkeypatch, tmp_path):
+        """Only keys due in the schedule get their last used date refreshed"""
+        fleet = generate_fleet(200, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        first = collect_audited(store, now)
+
+        later = now + datetime.timedelta(days=1)
+        due = [k for u in first for k in u.keys if k.next_check <= later]
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        second = collect_audited(store, later)
+
+        assert 0 < iam.calls["get_access_key_last_used"] == len(due)
+        assert len(due) < sum(len(u.keys) for u in first)
+        # the same states as fetching every last used date
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        full = collect_audited(FileStore(str(tmp_path / "full.json")), later)
+        assert [(k.key_id, k.audit_state) for u in second for k in u.keys] == [
+            (k.key_id, k.audit_state) for u in full for k in u.keys
+        ]
+
+    def test_schedule_version(self, monkeypatch, tmp_path):
+        """A schedule saved with other settings falls back to the refresh age"""
+        fleet = generate_fleet(50, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        collect_audited(store, now)
+
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        collect(store, schedule_version="2")
+        assert iam.calls["get_access_key_last_used"] == sum(
+            len(u["Keys"]) for u in fleet
+        )
+
+    def test_bulk_tags_not_reused(self, monkeypatch, tmp_path):
+        """Tags listed with the users win over the snapshot's"""
+        fleet = generate_fleet(10, now=now)
+        store = FileStore(str(tmp_path / "snapshot.json"))
+
+        def collect_bulk():
+            collector = SnapshotCollector(store, now=now)
+            users = services.get_iam_users(
+                build_user=collector.build_user,
+                list_pages=services.list_user_details_pages,
+            )
+            collector.save()
+            return users, collector
+
+        monkeypatch.setattr(services, "IAM", FakeIAM(fleet))
+        collect_bulk()
+
+        fleet[0]["Tags"] = [
+            {"Key": "Slack", "Value": "UNEW"},
+            {"Key": "KeyAutoExpire", "Value": "false"},
+        ]
+        iam = FakeIAM(fleet)
+        monkeypatch.setattr(services, "IAM", iam)
+        users, collector = collect_bulk()
+
+        assert (users[0].slack_id, users[0].auto_expire) == ("UNEW", "false")
+        assert collector.counts["reused"] == 10
+        assert iam.calls["list_user_tags"] == 0
+
+    def test_schedule_version_settings(self):
+        """Only the settings audit states depend on change the schedule version"""
+        config = Config(80, 90, 90, 80)
+
+        def version(**changes):
+            changed = dataclasses.replace(config, **changes)
+            return get_schedule_version(changed, load_policy(changed))
+
+        assert version() == version(expire_title="Other", collection_workers=4)
+        assert version() != version(warning_age=70)
+        assert version() != version(enable_auto_expire=True)
+        rules = PolicyIndex(
+            [{"username": "svc-*", "warning_age": 60}],
+            Policy("default", config.audit_ages),
+        )
+        assert version() != get_schedule_version(config, rules)
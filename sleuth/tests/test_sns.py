@@ -0,0 +1,102 @@
+import dataclasses
+import json
+
+from benchmarks.bench_report import generate_users
+from benchmarks.fakes import FakeSNS
+from sleuth import services
+from sleuth.auditor import notify_channel
+from sleuth.config import Config
+from sleuth.report import Report
+from sleuth.sns import MAX_BATCH_BYTES, entry_size, pack_batches, publish_findings
+
+
+def entry(i, size):
+    return {"Id": str(i), "Message": "x" * size}
+
+
+class RejectingSNS(FakeSNS):
+    """Rejects the first entry of every batch as a sender fault"""
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries):
+        resp = super().publish_batch(TopicArn, PublishBatchRequestEntries[1:])
+        resp["Failed"].append(
+            {"Id": PublishBatchRequestEntries[0]["Id"], "SenderFault": True}
+        )
+        return resp
+
+
+class TestPackBatches:
+    def test_entry_limit(self):
+        """Small entries are packed ten to a batch, in order"""
+        batches = pack_batches([entry(i, 10) for i in range(25)])
+        assert [len(b) for b in batches] == [10, 10, 5]
+        assert [e["Id"] for b in batches for e in b] == [str(i) for i in range(25)]
+
+    def test_size_limit(self):
+        """Large entries are packed under the batch size limit"""
+        batches = pack_batches([entry(i, 60 * 1024) for i in range(10)])
+        assert [len(b) for b in batches] == [4, 4, 2]
+        for b in batches:
+            assert sum(entry_size(e) for e in b) <= MAX_BATCH_BYTES
+
+    def test_oversized(self):
+        """Entries that can never fit are dropped"""
+        batches = pack_batches([entry(0, 10), entry(1, MAX_BATCH_BYTES + 1)])
+        assert [[e["Id"] for e in b] for b in batches] == [["0"]]
+
+
+class TestPublishFindings:
+    def test_one_message_per_finding(self):
+        """Every finding is published once as JSON with filterable attributes"""
+        report = Report(generate_users(300))
+        sns = FakeSNS()
+
+        summary = publish_findings("arn:topic", report, sns=sns)
+
+        assert summary["published"] == len(report)
+        assert summary["batches"] == len(sns.batches) == -(-len(report) // 10)
+        records = [json.loads(p["Message"]) for p in sns.published]
+        assert [(r["username"], r["audit_state"]) for r in records] == [
+            (u.username, k.audit_state)
+            for u, k in report.items("old", "stagnant", "expire", "stagnant_expire")
+        ]
+        attrs = sns.published[0]["MessageAttributes"]
+        assert attrs["audit_state"]["StringValue"] == records[0]["audit_state"]
+
+    def test_retries_failed_entries(self):
+        """Entries SNS failed on are published again, only those"""
+        report = Report(generate_users(300))
+        sns = FakeSNS(fail_every=7)
+        delays = []
+
+        summary = publish_findings("arn:topic", report, sns=sns, sleep=delays.append)
+
+        assert summary["published"] == len(report)
+        assert summary["failed"] == 0
+        assert delays
+        assert len({p["Message"] for p in sns.published}) == len(sns.published)
+        assert len(sns.published) == len(report)
+
+    def test_sender_fault(self):
+        """Entries rejected as sender faults are not retried"""
+        report = Report(generate_users(100))
+        sns = RejectingSNS()
+
+        summary = publish_findings("arn:topic", report, sns=sns, sleep=None)
+
+        assert summary["failed"] == len(sns.batches)
+        assert summary["published"] + summary["failed"] == len(report)
+
+    def test_findings_mode(self, monkeypatch):
+        """SNS_MODE=findings publishes findings instead of the text report"""
+        sns = FakeSNS()
+        monkeypatch.setattr(services, "SNS", sns)
+        config = Config(80, 90, 90, 80, sns_topic="arn:topic", sns_mode="findings")
+
+        notify_channel(Report(generate_users(50)), config)
+        assert sns.calls["publish"] == 0
+        assert sns.calls["publish_batch"] > 0
+
+        config = dataclasses.replace(config, sns_mode="report")
+        notify_channel(Report(generate_users(50)), config)
+        assert sns.calls["publish"] == 1